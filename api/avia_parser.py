@@ -11,44 +11,39 @@ infant = 0                        # Младенцев
 
 
 import os
-import json
-import csv
 import requests
-from datetime import datetime
+import time
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from reference_data import registry
+from cache import TTLCache
+from singleflight import SingleFlight
+from limits import RateLimiter, provider_slot
+from flight_client import API_URL, CONNECT_TIMEOUT, READ_TIMEOUT, flight_client, flights_governor
+from governor import ProviderUnavailable, UpstreamError
+from metrics import observe_upstream, timed
+from cassette import cassette
 
 
 # Загрузка переменных окружения
 load_dotenv()
 TOKEN = os.getenv("AVIASALES_TOKEN")
-API_URL = "https://api.travelpayouts.com/aviasales/v3/prices_for_dates"
 
-# Загрузка справочника городов
-def load_city_codes(file_path="city2code.json"):
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("Файл city2code.json не найден.")
-        return {}
-
-# Поиск IATA-кода по названию города
-def find_iata_code(city_name, city_codes):
-    matches = []
-    city_name = city_name.lower()
-
-    for city, code in city_codes.items():
-        if city_name in city.lower():
-            matches.append((city, code))
+# Кэш цен: данные Travelpayouts и так кэшированные, меняются медленно
+flight_cache = TTLCache(
+    "flights",
+    ttl=float(os.getenv("FLIGHT_CACHE_TTL", "600")),
+    stale_ttl=float(os.getenv("FLIGHT_CACHE_STALE_TTL", "1800")),
+    max_entries=int(os.getenv("FLIGHT_CACHE_MAX_ENTRIES", "2000")),
+    max_bytes=int(os.getenv("FLIGHT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
 
-    if not matches:
-        return None
+flight_calls = SingleFlight("flights")
 
-    if len(matches) == 1:
-        return matches[0][1]
-
-    # Если несколько совпадений, выбираем первое
-    return matches[0][1]
+# Сессия для синхронного режима: переиспользует соединения между запросами
+_session = requests.Session()
 
 # Парсинг даты DD-MM-YY или YYYY-MM-DD
 def parse_date(date_str):
@@ -61,33 +56,12 @@ def parse_date(date_str):
             continue
     raise ValueError("Дата должна быть в формате DD-MM-YY или YYYY-MM-DD")
 
-# Загрузка данных об авиакомпаниях из JSON
-def load_airline_data(file_path="airlines.json"):
-    try:
-        with open(file_path, "r", encoding="utf-8") as f:
-            return {item["code"]: item for item in json.load(f)}
-    except FileNotFoundError:
-        return {}
-
-# Получение названия авиакомпании по IATA-коду из JSON
-def get_airline_name(code, airline_data):
-    item = airline_data.get(code)
-    if item:
-        if item["name"] and item["name"] != "null":
-            return item["name"]
-        en_name = item["name_translations"].get("en", "Неизвестная авиакомпания")
-        return en_name
-    return f"({code})"
-
-# Получение полного названия города по коду
-def get_city_name(code, city_data):
-    for city, iata in city_data.items():
-        if iata == code:
-            return city
-    return code  # если не нашли, оставляем IATA
-
-# Получение данных от API
-def fetch_flight_prices(
+# Получение названия авиакомпании по IATA-коду из справочника
+def get_airline_name(code, airline_names):
+    return airline_names.get(code, f"({code})")
+
+# Параметры запроса к prices_for_dates
+def build_flight_params(
     origin,
     destination=None,
     departure_at=None,
@@ -96,7 +70,9 @@ def fetch_flight_prices(
     adult=1,
     child=0,
     infant=0,
-    direct=None
+    direct=None,
+    limit=10,
+    page=1
 ):
     if not origin or len(origin) < 2 or len(origin) > 3:
         raise ValueError("Неверный IATA-код города вылета")
@@ -107,8 +83,8 @@ def fetch_flight_prices(
         "currency": "RUB",
         "one_way": str(one_way).lower(),
         "sorting": "price",
-        "limit": 10,
-        "page": 1,
+        "limit": limit,
+        "page": page,
         "adults": adult,
         "children": child,
         "infants": infant
@@ -126,131 +102,80 @@ def fetch_flight_prices(
     if return_at:
         params["return_at"] = return_at
 
-    response = requests.get(API_URL, params=params)
-
-    if response.status_code != 200:
-        raise Exception(f"Ошибка API: {response.status_code}, {response.text}")
-
-    return response.json()
-
-# Форматирование минут в ЧЧ:ММ
-def minutes_to_hhmm(minutes):
-    if not minutes or minutes <= 0:
-        return "—"
-    hours = minutes // 60
-    mins = minutes % 60
-    return f"{hours}ч {mins}м"
-
-# === ПАРАМЕТРЫ ===
-BASE_LINK = "https://www.aviasales.ru"
-
-# Сохранение в CSV
-def save_to_csv(data, city_data, airline_data, filename="aviasales_results.csv"):
-    fieldnames = [
-        "Город отправления",
-        "Код отправления",
-        "Город назначения",
-        "Код назначения",
-        "Цена за человека (₽)",
-        "Общая цена (₽)",
-        "Дата вылета",
-        "Дата возвращения",
-        "Пересадки",
-        "Класс перелёта",
-        "Длительность пути туда",
-        "Длительность пути обратно",
-        "Авиакомпания",
-        "Ссылка"
-    ]
-
-    total_passengers = adult + child + infant
-    class_map = {0: "Эконом", 1: "Бизнес", 2: "Первый"}
-
-    with open(filename, mode="w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for item in data.get("data", []):
-            price_per_person = item['price']
-            total_price = price_per_person * total_passengers
-
-            link = BASE_LINK + item.get("link", "")
-
-            row = {
-                "Город отправления": get_city_name(item['origin'], city_data),
-                "Код отправления": item['origin'],
-                "Город назначения": get_city_name(item['destination'], city_data),
-                "Код назначения": item['destination'],
-                "Цена за человека (₽)": price_per_person,
-                "Общая цена (₽)": total_price,
-                "Дата вылета": item['departure_at'].replace("T", " ").split("+")[0],
-                "Дата возвращения": item.get('return_at', '—').replace("T", " ").split("+")[0] if item.get('return_at') else '—',
-                "Пересадки": item.get('transfers', 0) + item.get('return_transfers', 0),
-                "Класс перелёта": class_map.get(item.get("trip_class", 0), "Неизвестный"),
-                "Длительность пути туда": minutes_to_hhmm(item.get('duration_to')),
-                "Длительность пути обратно": minutes_to_hhmm(item.get('duration_back')),
-                "Авиакомпания": get_airline_name(item.get('airline', 'N/A'), airline_data),
-                "Ссылка": link
-            }
-            writer.writerow(row)
-    print(f"\n✅ Результаты сохранены в файл {filename}")
-
-
-# Сохранение в JSON
-def save_to_json(data, city_data, airline_data, filename="aviasales_results.json"):
-    enriched_data = []
-    class_map = {0: "Эконом", 1: "Бизнес", 2: "Первый"}
-    city_map = {code: city for city, code in city_data.items()}
-
-    for item in data.get("data", []):
-        origin = item['origin']
-        destination = item['destination']
-        transfers = item.get('transfers', 0) + item.get('return_transfers', 0)
-
-        enriched_item = {
-            "origin_city": get_city_name(origin, city_data),
-            "origin_code": origin,
-            "destination_city": get_city_name(destination, city_data),
-            "destination_code": destination,
-            "price_per_person": item['price'],
-            "total_price": item['price'] * (adult + child + infant),
-            "departure_at": item['departure_at'],
-            "return_at": item.get('return_at'),
-            "transfers": transfers,
-            "trip_class": class_map.get(item.get("trip_class", 0), "Неизвестный"),
-            "duration_to": minutes_to_hhmm(item.get('duration_to')),
-            "duration_back": minutes_to_hhmm(item.get('duration_back')),
-            "airline": get_airline_name(item.get('airline', 'N/A'), airline_data),
-            "link": BASE_LINK + item.get("link", "")
-        }
-        enriched_data.append(enriched_item)
-
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(enriched_data, f, ensure_ascii=False, indent=4)
-    print(f"\n✅ Результаты сохранены в файл {filename}")
-
-
-def search_flights(
-    origin_input,         # Город вылета
-    destination_input,    # Город назначения или оставить пустым для популярных направлений
-    departure_date,       # Дата вылета: DD-MM-YY или YYYY-MM-DD
-    return_date,         # Дата возвращения: DD-MM-YY или YYYY-MM-DD
-    is_one_way=False,    # Билет в одну сторону?
-    direct=False,        # Только прямые рейсы?
-    adult=1,            # Взрослых
-    child=0,            # Детей
-    infant=0,           # Младенцев
-    save_results=True   # Сохранять результаты в файлы?
+    return params
+
+# Нормализованный ключ кэша: все параметры запроса, кроме токена
+def flight_cache_key(params):
+    return tuple(sorted(
+        (name, str(value).upper() if name in ("origin", "destination") else str(value))
+        for name, value in params.items() if name != "token"
+    ))
+
+# Получение данных от API (синхронно, для скриптов)
+@timed("fetch_flight_prices")
+def fetch_flight_prices(**kwargs):
+    params = build_flight_params(**kwargs)
+    key = flight_cache_key(params)
+    cached, _ = flight_cache.lookup(key)
+    if cached is not None:
+        return cached
+
+    with flights_governor.sync_slot():
+        started = time.perf_counter()
+        try:
+            response = cassette.request(
+                "flights", "GET", API_URL,
+                lambda: _session.get(API_URL, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)),
+                params=params
+            )
+        except Exception:
+            observe_upstream("flights", "error", started)
+            raise
+        observe_upstream("flights", response.status_code, started, len(response.content))
+
+        if response.status_code != 200:
+            raise UpstreamError(f"Ошибка API: {response.status_code}, {response.text}", response.status_code)
+
+    result = response.json()
+    flight_cache.set(key, result)
+    return result
+
+async def _fetch_prices_limited(params):
+    async with provider_slot("flights"):
+        return await flight_client.fetch_prices(params)
+
+# Получение данных от API через общий асинхронный клиент
+@timed("fetch_flight_prices_async")
+async def fetch_flight_prices_async(**kwargs):
+    params = build_flight_params(**kwargs)
+    key = flight_cache_key(params)
+    # Запасной ответ на случай, когда провайдер недоступен: даже давно устаревший
+    fallback = await flight_cache.peek_async(key)
+    try:
+        # Одновременные одинаковые промахи кэша идут в API одним запросом
+        return await flight_cache.get_or_fetch(
+            key,
+            lambda: flight_calls.do(key, lambda: _fetch_prices_limited(params))
+        )
+    except ProviderUnavailable:
+        if fallback is None:
+            raise
+        return fallback
+
+def resolve_search(
+    origin_input,
+    destination_input,
+    departure_date,
+    return_date,
+    is_one_way=False,
+    direct=False,
+    adult=1,
+    child=0,
+    infant=0
 ):
-    """
-    Основная функция поиска авиабилетов.
-    
-    Returns:
-        dict: Результаты поиска в формате JSON
-    """
-    # Загрузка справочников
-    city_data = load_city_codes()
-    airline_data = load_airline_data()
+    """Переводит пользовательский ввод в параметры fetch_flight_prices."""
+    # Справочники загружены один раз на процесс
+    resolver = registry.city_resolver
 
     # Обработка дат
     try:
@@ -261,7 +186,7 @@ def search_flights(
 
     # Город вылета
     if len(origin_input) != 3:
-        origin = find_iata_code(origin_input, city_data)
+        origin = resolver.find_code(origin_input)
     else:
         origin = origin_input.upper()
 
@@ -272,35 +197,260 @@ def search_flights(
     destination = None
     if destination_input:
         if len(destination_input) != 3:
-            destination = find_iata_code(destination_input, city_data)
+            destination = resolver.find_code(destination_input)
         else:
             destination = destination_input.upper()
 
         if not destination:
             raise ValueError(f"Не удалось найти код города для: {destination_input}")
 
+    return {
+        "origin": origin,
+        "destination": destination,
+        "departure_at": dep_parsed,
+        "return_at": ret_parsed if not is_one_way else None,
+        "one_way": is_one_way,
+        "adult": adult,
+        "child": child,
+        "infant": infant,
+        "direct": direct
+    }
+
+
+def search_flights(
+    origin_input,         # Город вылета
+    destination_input,    # Город назначения или оставить пустым для популярных направлений
+    departure_date,       # Дата вылета: DD-MM-YY или YYYY-MM-DD
+    return_date,         # Дата возвращения: DD-MM-YY или YYYY-MM-DD
+    is_one_way=False,    # Билет в одну сторону?
+    direct=False,        # Только прямые рейсы?
+    adult=1,            # Взрослых
+    child=0,            # Детей
+    infant=0,           # Младенцев
+    save_results=True,  # Сохранять результаты в файлы?
+    flex_days=0         # Гибкие даты: ±дней (0 — только указанные даты)
+):
+    """
+    Основная функция поиска авиабилетов (синхронная, для скриптов).
+    
+    Returns:
+        dict: Результаты поиска в формате JSON; при flex_days > 0 —
+        календарь цен (см. search_price_calendar_async)
+    """
+    if flex_days:
+        return asyncio.run(_price_calendar_sync(
+            origin_input, destination_input, departure_date, return_date, flex_days,
+            is_one_way, direct, adult, child, infant
+        ))
+
+    search = resolve_search(
+        origin_input, destination_input, departure_date, return_date,
+        is_one_way, direct, adult, child, infant
+    )
+
     try:
-        results = fetch_flight_prices(
-            origin=origin,
-            destination=destination,
-            departure_at=dep_parsed,
-            return_at=ret_parsed if not is_one_way else None,
-            one_way=is_one_way,
-            adult=adult,
-            child=child,
-            infant=infant,
-            direct=direct
-        )
+        results = fetch_flight_prices(**search)
 
         # if save_results:
-        #     save_to_csv(results, city_data, airline_data)
-        #     save_to_json(results, city_data, airline_data)
-        print(results)
+        #     from exports import save_to_csv, save_to_json
+        #     passengers = adult + child + infant
+        #     save_to_csv(results, registry.city_resolver, registry.airline_names, passengers)
+        #     save_to_json(results, registry.city_resolver, registry.airline_names, passengers)
         return results
 
+    except ProviderUnavailable:
+        raise
     except Exception as e:
         raise Exception(f"Ошибка при поиске билетов: {e}")
 
+
+async def search_flights_async(
+    origin_input,
+    destination_input,
+    departure_date,
+    return_date,
+    is_one_way=False,
+    direct=False,
+    adult=1,
+    child=0,
+    infant=0,
+    limit=10
+):
+    """Асинхронный поиск авиабилетов через общий пул соединений.
+
+    Без города назначения API отдаёт самые дешёвые билеты по разным направлениям.
+    """
+    search = resolve_search(
+        origin_input, destination_input, departure_date, return_date,
+        is_one_way, direct, adult, child, infant
+    )
+
+    try:
+        return await fetch_flight_prices_async(**search, limit=limit)
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        raise Exception(f"Ошибка при поиске билетов: {e}")
+
+
+# Постраничная выдача: размер страницы, сколько страниц максимум и сколько грузить заранее
+FLIGHT_PAGE_SIZE = int(os.getenv("FLIGHT_PAGE_SIZE", "30"))
+FLIGHT_MAX_PAGES = int(os.getenv("FLIGHT_MAX_PAGES", "5"))
+FLIGHT_PREFETCH_PAGES = int(os.getenv("FLIGHT_PREFETCH_PAGES", "2"))
+
+
+class FlightOffers:
+    """Асинхронный поток предложений prices_for_dates по страницам.
+
+    Следующие prefetch страниц запрашиваются заранее, пока разбирается
+    текущая. Выдача отсортирована по цене, поэтому поток заканчивается на
+    первом билете дороже max_price, на неполной странице или через
+    max_pages страниц; недогруженные страницы отменяются. Счётчики
+    received и pages показывают, сколько пришло из API.
+    """
+
+    def __init__(self, search, max_price=None, page_size=FLIGHT_PAGE_SIZE,
+                 max_pages=FLIGHT_MAX_PAGES, prefetch=FLIGHT_PREFETCH_PAGES):
+        self.search = search
+        self.max_price = max_price
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.prefetch = max(1, prefetch)
+        self.received = 0
+        self.pages = 0
+        self.over_budget = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    def _start_page(self, page):
+        return asyncio.create_task(
+            fetch_flight_prices_async(**self.search, limit=self.page_size, page=page)
+        )
+
+    async def _iterate(self):
+        pages = deque()
+        next_page = 1
+        try:
+            while True:
+                while next_page <= self.max_pages and len(pages) < self.prefetch:
+                    pages.append(self._start_page(next_page))
+                    next_page += 1
+                if not pages:
+                    return
+                data = (await pages.popleft()).get("data") or []
+                self.pages += 1
+                self.received += len(data)
+                for offer in data:
+                    if self.max_price is not None and offer.get("price", 0) > self.max_price:
+                        self.over_budget = True
+                        return
+                    yield offer
+                if len(data) < self.page_size:
+                    return
+        finally:
+            for task in pages:
+                task.cancel()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def search_flight_offers(
+    origin_input,
+    destination_input,
+    departure_date,
+    return_date,
+    is_one_way=False,
+    direct=False,
+    adult=1,
+    child=0,
+    infant=0,
+    max_price=None
+):
+    """Поток предложений по маршруту (см. FlightOffers)."""
+    search = resolve_search(
+        origin_input, destination_input, departure_date, return_date,
+        is_one_way, direct, adult, child, infant
+    )
+    return FlightOffers(search, max_price=max_price)
+
+
+# Ограничения для перебора дат: запросов в секунду и одновременно
+CALENDAR_RATE = float(os.getenv("CALENDAR_RATE", "10"))
+CALENDAR_CONCURRENCY = int(os.getenv("CALENDAR_CONCURRENCY", "8"))
+
+def shift_date(date_str, days):
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+async def search_price_calendar_async(
+    origin_input,
+    destination_input,
+    departure_date,
+    return_date,
+    flex_days=3,          # Сдвиг дат в обе стороны, дней
+    is_one_way=False,
+    direct=False,
+    adult=1,
+    child=0,
+    infant=0,
+    top=5,                # Сколько самых дешёвых комбинаций вернуть
+    rate_limiter=None,
+    concurrency=CALENDAR_CONCURRENCY
+):
+    """
+    Поиск по гибким датам: вылет и возвращение ±flex_days.
+
+    Ячейки запрашиваются параллельно (не больше concurrency одновременно
+    и не чаще rate_limiter), уже закэшированные берутся из кэша.
+
+    Returns:
+        dict: departures, returns, matrix[вылет][возвращение] -> минимальная
+        цена или None, cheapest — самые дешёвые комбинации дат
+    """
+    search = resolve_search(
+        origin_input, destination_input, departure_date, return_date,
+        is_one_way, direct, adult, child, infant
+    )
+    offsets = range(-flex_days, flex_days + 1)
+    departures = [shift_date(search["departure_at"], d) for d in offsets]
+    returns = [shift_date(search["return_at"], d) for d in offsets] if search["return_at"] else [None]
+
+    limiter = rate_limiter or RateLimiter(CALENDAR_RATE)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def cell(dep, ret):
+        params = dict(search, departure_at=dep, return_at=ret)
+        key = flight_cache_key(build_flight_params(**params))
+        if await flight_cache.get_async(key) is None:
+            await limiter.acquire()
+        async with semaphore:
+            results = await fetch_flight_prices_async(**params)
+        prices = [item["price"] for item in results.get("data", []) if item.get("price")]
+        return dep, ret, min(prices) if prices else None
+
+    cells = [(dep, ret) for dep in departures for ret in returns if ret is None or ret >= dep]
+    try:
+        found = await asyncio.gather(*(cell(dep, ret) for dep, ret in cells))
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        raise Exception(f"Ошибка при поиске билетов: {e}")
+
+    matrix = {dep: {ret: None for ret in returns} for dep in departures}
+    for dep, ret, price in found:
+        matrix[dep][ret] = price
+    cheapest = sorted(
+        ({"departure_at": dep, "return_at": ret, "price": price} for dep, ret, price in found if price is not None),
+        key=lambda c: (c["price"], c["departure_at"], c["return_at"] or "")
+    )[:top]
+    return {"departures": departures, "returns": returns, "matrix": matrix, "cheapest": cheapest}
+
+async def _price_calendar_sync(*args):
+    # Клиент привязан к event loop, который asyncio.run закроет
+    try:
+        return await search_price_calendar_async(*args)
+    finally:
+        await flight_client.close()
+
 # === Запуск как скрипт ===
 if __name__ == "__main__":
     # Параметры поиска
@@ -318,6 +468,7 @@ if __name__ == "__main__":
     
     try:
         results = search_flights(**params)
+        print(results)
         print("Поиск выполнен успешно. Результаты сохранены в файлы.")
     except Exception as e:
         print(f"\nПроизошла ошибка: {e}")
\ No newline at end of file
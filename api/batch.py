@@ -0,0 +1,60 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import HTTPException
+
+from deadline import DeadlineExceeded
+from governor import ProviderUnavailable
+from limits import use_provider_limits
+from pipeline import StageTimings, run_recommendation
+
+# Сколько элементов пакета обрабатывается одновременно по умолчанию
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+async def _run_item(key: str, request, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    async with semaphore:
+        timings = StageTimings()
+        try:
+            result = await run_recommendation(request, timings)
+        except HTTPException as e:
+            return {"key": key, "status": e.status_code, "detail": e.detail}
+        except ProviderUnavailable as e:
+            return {"key": key, "status": 503, "detail": str(e), "retry_after": int(e.retry_after + 0.5)}
+        except DeadlineExceeded as e:
+            return {"key": key, "status": 504, "detail": str(e)}
+        except Exception as e:
+            return {"key": key, "status": 500, "detail": str(e)}
+        return {"key": key, "status": 200, "result": result, "timings": timings.as_dict()}
+
+
+async def run_batch(requests: List[Any], concurrency: int = BATCH_CONCURRENCY,
+                    provider_limits: Dict[str, int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Выполняет пакет запросов /recommend, отдавая результаты по мере готовности.
+
+    Одинаковые элементы пакета считаются один раз. Общие подзапросы разных
+    элементов (тот же маршрут и даты, тот же город) объединяются кэшами и
+    single-flight, а обращения к каждому провайдеру ограничены
+    provider_limits на весь пакет.
+    """
+    use_provider_limits(provider_limits or {})
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    indices: Dict[str, List[int]] = {}
+    unique = {}
+    for i, request in enumerate(requests):
+        key = request.model_dump_json()
+        indices.setdefault(key, []).append(i)
+        unique.setdefault(key, request)
+
+    tasks = [asyncio.create_task(_run_item(key, request, semaphore)) for key, request in unique.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            outcome = await next_done
+            key = outcome.pop("key")
+            for i in indices[key]:
+                yield {"index": i, **outcome}
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,61 @@
+"""Микробенчмарк поиска городов по полному справочнику city2code.json.
+
+Сравнивает линейный проход по словарю (как раньше в avia_parser)
+с индексом CityResolver. Запуск из каталога api:
+
+    python -m benchmarks.city_resolver
+"""
+import random
+import time
+
+from reference_data import load_city_codes
+from city_resolver import CityResolver
+
+ROUNDS = 2000
+
+
+def linear_find(city_name, city_codes):
+    city_name = city_name.lower()
+    for city, code in city_codes.items():
+        if city_name in city.lower():
+            return code
+    return None
+
+
+def linear_city_name(code, city_codes):
+    for city, iata in city_codes.items():
+        if iata == code:
+            return city
+    return code
+
+
+def measure(label, func, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {elapsed / len(args_list) * 1e6:10.2f} мкс/запрос")
+
+
+def main():
+    city_codes = load_city_codes()
+    rnd = random.Random(42)
+    names = rnd.choices(list(city_codes), k=ROUNDS)
+    parts = [name[:max(3, len(name) // 2)] for name in names]
+    codes = rnd.choices(list(city_codes.values()), k=ROUNDS)
+
+    start = time.perf_counter()
+    resolver = CityResolver(city_codes)
+    print(f"Городов: {len(resolver)}, построение индекса: "
+          f"{(time.perf_counter() - start) * 1e3:.1f} мс\n")
+
+    measure("linear: точное название", linear_find, [(n, city_codes) for n in names])
+    measure("resolver: точное название", resolver.find_code, [(n,) for n in names])
+    measure("linear: подстрока", linear_find, [(p, city_codes) for p in parts])
+    measure("resolver: подстрока", resolver.find_code, [(p,) for p in parts])
+    measure("linear: код -> город", linear_city_name, [(c, city_codes) for c in codes])
+    measure("resolver: код -> город", resolver.city_name, [(c,) for c in codes])
+
+
+if __name__ == "__main__":
+    main()
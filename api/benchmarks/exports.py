@@ -0,0 +1,139 @@
+"""Пропускная способность экспорта результатов поиска, строк в секунду.
+
+Синтетические ответы prices_for_dates (настоящие коды городов и
+авиакомпаний из справочников) пишутся прежним способом — список
+в памяти, DictWriter и json.dump с отступами — и потоковыми
+писателями exports. Пиковая память считается tracemalloc отдельным
+прогоном. Parquet и Arrow — если установлен pyarrow. Запуск из каталога api:
+
+    python -m benchmarks.exports [--rows 200000] [--routes 50]
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from exports import (
+    BASE_LINK, CLASS_NAMES, csv_date, export_flights, flight_items, flight_rows, minutes_to_hhmm
+)
+from reference_data import load_city_codes, registry
+
+
+def make_responses(rows, routes, codes, airlines):
+    """routes ответов API по rows // routes билетов, генерируются по одному."""
+    rng = random.Random(0)
+    per_route = rows // routes
+    for _ in range(routes):
+        origin, destination = rng.sample(codes, 2)
+        yield {"success": True, "data": [
+            {
+                "origin": origin,
+                "destination": destination,
+                "price": rng.randrange(3000, 90000),
+                "airline": rng.choice(airlines),
+                "departure_at": f"2025-06-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:00:00+03:00",
+                "return_at": f"2025-07-{rng.randrange(1, 29):02d}T{rng.randrange(24):02d}:00:00+03:00",
+                "transfers": rng.randrange(3),
+                "return_transfers": rng.randrange(3),
+                "trip_class": 0,
+                "duration_to": rng.randrange(60, 1200),
+                "duration_back": rng.randrange(60, 1200),
+                "link": f"/search/{origin}{destination}?t={i}",
+            }
+            for i in range(per_route)
+        ]}
+
+
+def legacy_export(responses, directory, resolver, airline_names, passengers):
+    """Как save_to_csv + save_to_json раньше: всё в памяти, JSON с отступами."""
+    data = [item for response in responses for item in response["data"]]
+    enriched = []
+    for item in data:
+        enriched.append({
+            "origin_city": resolver.city_name(item["origin"]),
+            "origin_code": item["origin"],
+            "destination_city": resolver.city_name(item["destination"]),
+            "destination_code": item["destination"],
+            "price_per_person": item["price"],
+            "total_price": item["price"] * passengers,
+            "departure_at": item["departure_at"],
+            "return_at": item.get("return_at"),
+            "transfers": item.get("transfers", 0) + item.get("return_transfers", 0),
+            "trip_class": CLASS_NAMES.get(item.get("trip_class", 0), "Неизвестный"),
+            "duration_to": minutes_to_hhmm(item.get("duration_to")),
+            "duration_back": minutes_to_hhmm(item.get("duration_back")),
+            "airline": airline_names.get(item.get("airline", "N/A"), f"({item.get('airline')})"),
+            "link": BASE_LINK + item.get("link", ""),
+        })
+    with open(os.path.join(directory, "legacy.csv"), "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=list(enriched[0]))
+        writer.writeheader()
+        for row in enriched:
+            writer.writerow(dict(row, departure_at=csv_date(row["departure_at"]),
+                                 return_at=csv_date(row["return_at"])))
+    with open(os.path.join(directory, "legacy.json"), "w", encoding="utf-8") as f:
+        json.dump(enriched, f, ensure_ascii=False, indent=4)
+    return len(enriched)
+
+
+def pyarrow_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def measure(run):
+    start = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main(args):
+    registry.load()
+    resolver = registry.city_resolver
+    airline_names = registry.airline_names
+    codes = sorted(set(load_city_codes().values()))
+    airlines = sorted(airline_names)
+    passengers = 3
+
+    def responses():
+        return make_responses(args.rows, args.routes, codes, airlines)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cases = [("прежний CSV+JSON", lambda: legacy_export(
+            responses(), directory, resolver, airline_names, passengers))]
+        formats = ["csv", "ndjson", "json"] + (["parquet", "arrow"] if pyarrow_available() else [])
+        for fmt in formats:
+            path = os.path.join(directory, f"flights.{fmt}")
+            cases.append((fmt, lambda path=path: export_flights(
+                responses(), path, resolver, airline_names, passengers)))
+        cases.append(("только строки", lambda: sum(
+            1 for _ in flight_rows(flight_items(responses()), resolver, airline_names, passengers))))
+
+        print(f"{'способ':<18} {'строк':>8} {'строк/с':>10} {'пик памяти':>11} {'файл':>9}")
+        for name, run in cases:
+            count, elapsed, peak = measure(run)
+            sizes = [os.path.getsize(os.path.join(directory, f)) for f in os.listdir(directory)
+                     if f.startswith("legacy" if name.startswith("прежний") else "flights." + name)]
+            size = f"{sum(sizes) / 1e6:.1f} МБ" if sizes else "—"
+            print(f"{name:<18} {count:>8} {count / elapsed:>10.0f} {peak / 1e6:>8.1f} МБ {size:>9}")
+        if not pyarrow_available():
+            print("pyarrow не установлен: Parquet и Arrow пропущены")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--routes", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,60 @@
+"""Бенчмарк постраничной выдачи перелётов (FlightOffers) на заглушке Travelpayouts.
+
+Заглушка отдаёт total предложений, отсортированных по цене. Для разных
+бюджетов сравниваются загрузка страниц по одной и с упреждением.
+Запуск из каталога api:
+
+    python -m benchmarks.flight_pages [--latency-ms 200] [--total 150] [--page-size 30]
+"""
+import argparse
+import asyncio
+import time
+
+import avia_parser
+from benchmarks.stubs import StubServer
+from flight_client import FlightClient
+
+SEARCH = dict(origin="MOW", destination="DXB", departure_at="2025-06-10",
+              return_at="2025-06-24", adult=2, child=0, infant=0, direct=False)
+
+
+def paged_handler(total):
+    def handler(method, path, query, body):
+        limit, page = int(query["limit"]), int(query["page"])
+        first = (page - 1) * limit
+        return 200, {"success": True, "data": [
+            {"origin": "MOW", "destination": "DXB", "price": 10000 + 500 * i}
+            for i in range(first, min(first + limit, total))
+        ]}
+    return handler
+
+
+async def run(stub, budget, prefetch, page_size):
+    avia_parser.flight_cache.clear()
+    offers = avia_parser.FlightOffers(SEARCH, max_price=budget, page_size=page_size,
+                                      max_pages=100, prefetch=prefetch)
+    before = stub.requests
+    start = time.perf_counter()
+    count = 0
+    async for _ in offers:
+        count += 1
+    elapsed = time.perf_counter() - start
+    print(f"бюджет {budget:>7} упреждение {prefetch}: предложений {count:4d}, "
+          f"страниц {offers.pages:2d}, запросов в API {stub.requests - before:2d}, {elapsed:5.2f} с")
+
+
+async def main(args):
+    with StubServer(paged_handler(args.total), latency=args.latency_ms / 1000) as stub:
+        avia_parser.flight_client = FlightClient(url=stub.url)
+        for budget in (15000, 40000, 10 ** 9):
+            for prefetch in (1, 3):
+                await run(stub, budget, prefetch, args.page_size)
+        await avia_parser.flight_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--total", type=int, default=150)
+    parser.add_argument("--page-size", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
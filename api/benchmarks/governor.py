@@ -0,0 +1,92 @@
+"""Поведение ProviderGovernor под всплеском нагрузки на нестабильный провайдер.
+
+Провайдер-заглушка отвечает за --latency-ms, в окне --outage секунд
+отвечает 503, при перегрузке (больше --capacity запросов одновременно)
+замедляется. Раз в секунду печатается состояние автомата, лимит,
+очередь и исходы запросов. Запуск из каталога api:
+
+    python -m benchmarks.governor [--clients 200 --duration 12 --outage 3:6]
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from governor import ProviderGovernor, ProviderUnavailable, UpstreamError
+
+
+class FlakyProvider:
+    def __init__(self, latency: float, capacity: int, outage):
+        self.latency = latency
+        self.capacity = capacity
+        self.outage = outage
+        self.in_flight = 0
+        self.started = time.monotonic()
+
+    async def call(self):
+        self.in_flight += 1
+        try:
+            now = time.monotonic() - self.started
+            overload = max(1.0, self.in_flight / self.capacity)
+            await asyncio.sleep(self.latency * overload * random.uniform(0.8, 1.2))
+            if self.outage[0] <= now < self.outage[1]:
+                raise UpstreamError("HTTP 503", 503)
+        finally:
+            self.in_flight -= 1
+
+
+async def client(governor, provider, outcomes, latencies, stop):
+    while time.monotonic() < stop:
+        start = time.perf_counter()
+        try:
+            async with governor.slot():
+                await provider.call()
+            outcomes["ok"] += 1
+            latencies.append(time.perf_counter() - start)
+        except ProviderUnavailable as e:
+            outcomes[type(e).__name__] += 1
+            # Быстрый отказ: клиент ждёт, как просит Retry-After, но не дольше секунды
+            await asyncio.sleep(min(e.retry_after, 1.0))
+        except UpstreamError:
+            outcomes["upstream_error"] += 1
+
+
+async def main(args):
+    outage = tuple(float(x) for x in args.outage.split(":"))
+    provider = FlakyProvider(args.latency_ms / 1000, args.capacity, outage)
+    governor = ProviderGovernor(
+        "bench", rate=args.rate, burst=args.rate, max_concurrency=args.max_concurrency,
+        target_latency=args.latency_ms / 1000 * 2, failure_threshold=5, cooldown=1.0,
+        max_queue=args.clients // 2, max_wait=2.0,
+    )
+    outcomes, latencies = Counter(), []
+    stop = time.monotonic() + args.duration
+    tasks = [asyncio.create_task(client(governor, provider, outcomes, latencies, stop))
+             for _ in range(args.clients)]
+
+    print(f"{'с':>3} {'автомат':>9} {'лимит':>6} {'в работе':>8} {'очередь':>7} "
+          f"{'успех':>6} {'ошибки':>6} {'отказ':>6} {'перегруз':>8} {'p95, мс':>8}")
+    for second in range(1, int(args.duration) + 1):
+        await asyncio.sleep(1)
+        s = governor.stats()
+        window = sorted(latencies)
+        p95 = window[int(len(window) * 0.95)] * 1000 if window else 0
+        print(f"{second:>3} {s['state']:>9} {s['limit']:>6.1f} {s['in_flight']:>8} {s['queued']:>7} "
+              f"{outcomes['ok']:>6} {outcomes['upstream_error']:>6} {outcomes['ProviderUnavailable']:>6} "
+              f"{outcomes['ProviderOverloaded']:>8} {p95:>8.0f}")
+        outcomes.clear()
+        latencies.clear()
+    await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=12)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--capacity", type=int, default=10, help="одновременных запросов без замедления")
+    parser.add_argument("--outage", default="3:6", help="окно ответов 503, секунды от старта")
+    parser.add_argument("--rate", type=float, default=150)
+    parser.add_argument("--max-concurrency", type=int, default=32)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+"""Бенчмарк фильтрации отелей по бюджету на синтетическом каталоге.
+
+Сравнивает прежний проход (сортировка каталога на каждый вызов и цикл
+на Python) с HotelIndex. Запуск из каталога api:
+
+    python -m benchmarks.hotel_index [--hotels 20000]
+"""
+import argparse
+import random
+import time
+
+from hotel_catalog import compact_hotel
+from hotel_index import HotelIndex
+
+ROUNDS = 200
+
+
+def synthetic_catalog(n, seed=42):
+    rnd = random.Random(seed)
+    return [compact_hotel({
+        "id": i,
+        "name": {"en": f"Hotel {i}"},
+        "rating": rnd.randint(0, 100),
+        "stars": rnd.randint(0, 5),
+        "pricefrom": None if rnd.random() < 0.05 else round(rnd.uniform(20, 800), 2),
+        "address": {"en": f"Street {i}"},
+        "link": f"/hotels/hotel-{i}.html",
+        "photos": [{"url": f"https://photo.example/{i}/{k}.jpg"} for k in range(3)],
+    }) for i in range(n)]
+
+
+def linear_select(hotels, max_total_price, nights, adults, max_results=10):
+    filtered = []
+    for hotel in sorted(hotels, key=lambda x: x["rating"], reverse=True):
+        if len(filtered) >= max_results:
+            break
+        price = hotel["pricefrom"]
+        if price is None:
+            continue
+        if (price * nights * adults) * 100 <= max_total_price:
+            filtered.append(hotel["id"])
+    return filtered
+
+
+def measure(label, func):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = func()
+    elapsed = (time.perf_counter() - start) / ROUNDS
+    print(f"{label:<40} {elapsed * 1000:8.3f} мс")
+    return result
+
+
+def main(args):
+    hotels = synthetic_catalog(args.hotels)
+    start = time.perf_counter()
+    index = HotelIndex(hotels)
+    print(f"Отелей: {len(index)}, построение индекса: "
+          f"{(time.perf_counter() - start) * 1000:.1f} мс\n")
+
+    # Свободный бюджет находит 10 отелей сразу, жёсткий проходит почти весь каталог
+    for label, budget in (("свободный бюджет", 10_000_000), ("жёсткий бюджет", 50_000)):
+        old = measure(f"linear, {label}", lambda: linear_select(hotels, budget, 7, 2))
+        new = measure(f"HotelIndex, {label}", lambda: [
+            index.hotels[i]["id"] for i in index.select(budget, 7, 2)
+        ])
+        assert old == new, "результаты не совпадают"
+    measure("HotelIndex, по цене", lambda: index.select(1_000_000, 7, 2, sort_by="price"))
+    measure("HotelIndex, по звёздам", lambda: index.select(1_000_000, 7, 2, sort_by="stars"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hotels", type=int, default=20000)
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+"""Бенчмарк общего пула LLMClient против клиента на каждый запрос.
+
+Заглушка OpenRouter добавляет задержку на установку каждого соединения
+(имитация TCP+TLS рукопожатия). Запуск из каталога api:
+
+    python -m benchmarks.llm_client [--handshake-ms 60] [--requests 50]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+# Мерим пул соединений, а не ограничитель провайдера: с LLM_RATE=5
+# общий пул ждал бы токенов, а клиент на запрос обходит ограничитель
+for name, value in (("LLM_RATE", "100000"), ("LLM_BURST", "100000"),
+                    ("LLM_MAX_CONCURRENCY", "1000"), ("LLM_MAX_QUEUE", "100000")):
+    os.environ.setdefault(name, value)
+
+from benchmarks.stubs import StubServer, openrouter_handler
+from llm_client import LLMClient
+
+
+async def per_request_client(url, prompt):
+    # Прежняя реализация ask_llm: новый AsyncClient на каждый вызов
+    async with httpx.AsyncClient() as client:
+        response = await client.post(
+            url,
+            json={"model": "stub", "messages": [{"role": "user", "content": prompt}]},
+            timeout=30
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+async def run(label, call, n, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with sem:
+            start = time.perf_counter()
+            await call(f"prompt {i}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    total = time.perf_counter() - start
+    latencies.sort()
+    print(f"{label:<24} avg {sum(latencies) / n * 1000:7.2f} мс, "
+          f"p95 {latencies[int(n * 0.95) - 1] * 1000:7.2f} мс, всего {total:6.2f} с")
+    return sum(latencies) / n
+
+
+async def main(args):
+    with StubServer(openrouter_handler, handshake=args.handshake_ms / 1000) as stub:
+        url = stub.url + "/api/v1/chat/completions"
+
+        before = stub.connections
+        old = await run("клиент на запрос", lambda p: per_request_client(url, p),
+                        args.requests, args.concurrency)
+        print(f"{'':<24} соединений открыто: {stub.connections - before}")
+
+        client = LLMClient(url=url, api_key="stub", max_connections=args.concurrency)
+        await client.start()
+        before = stub.connections
+        new = await run("общий пул LLMClient", client.complete, args.requests, args.concurrency)
+        print(f"{'':<24} соединений открыто: {stub.connections - before}")
+        print(f"{'':<24} pool_stats: {client.pool_stats()}")
+        await client.close()
+
+    print(f"\nЭкономия на запрос: {(old - new) * 1000:.2f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--handshake-ms", type=float, default=60)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
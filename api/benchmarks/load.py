@@ -0,0 +1,317 @@
+"""Нагрузочный тест /recommend без внешних API.
+
+Поднимает заглушки Travelpayouts, Hotellook и OpenRouter с профилем
+задержек и размеров ответов, запускает API отдельным процессом
+(benchmarks.load_server, переводчик там тоже заглушка) и гоняет
+/recommend на фиксированных уровнях конкурентности. Для каждого уровня
+печатает RPS, p50/p95/p99 и пиковый RSS процесса API.
+
+Нагрузка — сгенерированные запросы или --replay файла JSONL (одна
+TravelRequest на строку, можно в поле "payload"). Число запросов на
+уровень фиксировано, random в API засеян, так что прогоны сравнимы:
+--save сохраняет результат, --compare показывает разницу с сохранённым.
+С --cassette API отвечает записанными ответами настоящих провайдеров
+(CASSETTE_MODE=replay, задержки умножаются на --latency-scale).
+Ограничители провайдеров (governor.py) по умолчанию сняты, иначе прогон
+мерит лимит LLM_RATE, а не сервис; --governor default оставляет
+рабочие лимиты.
+Запуск из каталога api:
+
+    python -m benchmarks.load [--profile typical] [--concurrency 1,8,32] [--requests 200]
+                              [--replay benchmarks/workload.jsonl] [--cassette upstream.cassette]
+                              [--save out.json] [--compare base.json] [--governor default]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.stubs import StubServer
+
+# Провайдеры с ограничителем и его снятые лимиты для --governor relaxed
+GOVERNED_PROVIDERS = ("flights", "hotellook", "translate", "llm")
+RELAXED_GOVERNOR = dict(RATE="100000", BURST="100000", MAX_CONCURRENCY="1000", MAX_QUEUE="100000")
+
+# Задержки в мс и размеры ответов провайдеров
+PROFILES = {
+    "fast": dict(flights_ms=20, lookup_ms=20, catalog_ms=50, translate_ms=10, llm_ms=50,
+                 offers=30, hotels=200, llm_chars=500),
+    "typical": dict(flights_ms=250, lookup_ms=150, catalog_ms=800, translate_ms=150, llm_ms=2000,
+                    offers=60, hotels=2000, llm_chars=3000),
+    "slow": dict(flights_ms=800, lookup_ms=500, catalog_ms=3000, translate_ms=400, llm_ms=8000,
+                 offers=100, hotels=8000, llm_chars=6000),
+}
+
+CITIES = ["Дубай", "Стамбул", "Париж", "Сочи", "Казань", "Санкт-Петербург", "Тбилиси", "Ереван", "Рим"]
+
+
+def flights_handler(profile):
+    def handler(method, path, query, body):
+        limit, page = int(query.get("limit", 10)), int(query.get("page", 1))
+        seed = zlib.crc32(f"{query.get('destination')}|{query.get('departure_at')}".encode())
+        first = (page - 1) * limit
+        return 200, {"success": True, "data": [
+            {"origin": query["origin"], "destination": query.get("destination") or "DXB",
+             "price": 8000 + seed % 5000 + 700 * i, "airline": "SU",
+             "departure_at": f"{query.get('departure_at')}T10:00:00+03:00",
+             "return_at": f"{query.get('return_at')}T18:00:00+03:00" if query.get("return_at") else None,
+             "transfers": i % 3, "link": f"/search/{i}"}
+            for i in range(first, min(first + limit, profile["offers"]))
+        ]}
+    return handler
+
+
+def hotellook_handler(profile):
+    # Задержка сервера — как у lookup.json; каталогу добавляем разницу
+    extra = max(0.0, profile["catalog_ms"] - profile["lookup_ms"]) / 1000
+
+    def handler(method, path, query, body):
+        if path.endswith("/lookup.json"):
+            return 200, {"results": {"locations": [{"id": zlib.crc32(query["query"].encode()) % 100000}]}}
+        time.sleep(extra)
+        return 200, {"hotels": [
+            {"id": i, "name": {"en": f"Hotel {i}"}, "rating": 50 + i % 50, "stars": 1 + i % 5,
+             "pricefrom": 0.05 + (i % 40) / 100, "address": {"en": f"Street {i}"},
+             "link": f"/hotel-{i}.html", "photos": [{"url": f"https://photo.example/{i}.jpg"}]}
+            for i in range(profile["hotels"])
+        ]}
+    return handler
+
+
+def openrouter_handler(profile):
+    answer = ("## Рекомендация\n" + "- вариант подходит для отдыха\n" * profile["llm_chars"])[:profile["llm_chars"]]
+
+    def handler(method, path, query, body):
+        return 200, {"choices": [{"message": {"content": answer}}]}
+    return handler
+
+
+def generated_workload(n: int) -> List[Dict[str, Any]]:
+    """Разные запросы: разные ключи кэшей и single-flight."""
+    return [{
+        "departure_city": "Москва",
+        "destination_city": CITIES[i % len(CITIES)],
+        "departure_date": f"2025-07-{1 + i % 20:02d}",
+        "return_date": f"2025-07-{8 + i % 20:02d}",
+        "budget": 150000 + 1000 * (i % 50),
+        "adults": 1 + i % 3,
+        "preferences": ["art"],
+    } for i in range(n)]
+
+
+def replay_workload(path: str) -> List[Dict[str, Any]]:
+    """Запросы из JSONL; строки, которые не похожи на TravelRequest, пропускаются."""
+    payloads, skipped = [], 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            payload = item.get("payload", item) if isinstance(item, dict) else None
+            if isinstance(payload, dict) and "departure_city" in payload and "budget" in payload:
+                payloads.append(payload)
+            else:
+                skipped += 1
+    if skipped:
+        print(f"Пропущено строк без TravelRequest: {skipped}")
+    if not payloads:
+        raise SystemExit(f"В {path} нет запросов /recommend")
+    return payloads
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[i]
+
+
+async def run_level(client, url, workload, concurrency, total, pid) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+    peak_rss = rss_mb(pid) or 0.0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < total:
+            payload = workload[next_index % len(workload)]
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json=payload)
+                ok = response.status_code == 200
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss_mb(pid) or 0.0)
+            await asyncio.sleep(0.2)
+
+    sampler = asyncio.create_task(sample_rss())
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    sampler.cancel()
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "rss_mb": round(max(peak_rss, rss_mb(pid) or 0.0), 1),
+    }
+
+
+def start_api(port: int, profile: Dict[str, Any], stubs: Dict[str, str], data_dir: str,
+              warm_cache: bool, cassette: Optional[str] = None,
+              latency_scale: float = 1.0, governor: str = "relaxed") -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        FLIGHT_API_URL=stubs["flights"],
+        HOTELLOOK_URL=stubs["hotellook"],
+        OPENROUTER_API_URL=stubs["llm"],
+        HOTEL_CATALOG_DIR=os.path.join(data_dir, "hotels"),
+        CITY_LOCATIONS_FILE=os.path.join(data_dir, "city_locations.json"),
+        CACHE_DB_PATH=os.path.join(data_dir, "cache.sqlite3"),
+        # Запросы прогона не попадают в настоящий журнал, и фоновый прогрев не мешает замерам
+        QUERY_LOG_PATH=os.path.join(data_dir, "requests.jsonl"),
+        PREFETCH_ENABLED="0",
+        PYTHONHASHSEED="0",
+    )
+    if governor == "relaxed":
+        # Явно заданные в окружении лимиты (LLM_RATE=...) сохраняются
+        for provider in GOVERNED_PROVIDERS:
+            for name, value in RELAXED_GOVERNOR.items():
+                env.setdefault(f"{provider.upper()}_{name}", value)
+    if not warm_cache:
+        # Меряем конвейер, а не кэш готовых ответов
+        env.update(RECOMMEND_CACHE_TTL="0", FLIGHT_CACHE_TTL="0", FLIGHT_CACHE_STALE_TTL="0",
+                   CHECKLIST_CACHE_TTL="0")
+    if cassette:
+        env.update(CASSETTE_MODE="replay", CASSETTE_PATH=os.path.abspath(cassette),
+                   CASSETTE_LATENCY_SCALE=str(latency_scale))
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_server", "--port", str(port),
+         "--translate-ms", str(profile["translate_ms"])],
+        env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+
+
+async def wait_ready(client, base_url: str, process: subprocess.Popen, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit("API не запустился")
+        try:
+            if (await client.get(base_url + "/")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise SystemExit("API не ответил за отведённое время")
+
+
+def print_table(results: List[Dict[str, Any]], baseline: Optional[Dict[int, Dict[str, Any]]] = None) -> None:
+    fields = ("rps", "p50_ms", "p95_ms", "p99_ms", "rss_mb")
+    print(f"{'conc':>5} {'reqs':>5} {'err':>4} " + " ".join(f"{f:>16}" for f in fields))
+    for row in results:
+        cells = []
+        for field in fields:
+            cell = f"{row[field]:.1f}"
+            base = (baseline or {}).get(row["concurrency"])
+            if base and base.get(field):
+                cell += f" ({(row[field] - base[field]) / base[field] * 100:+.0f}%)"
+            cells.append(f"{cell:>16}")
+        print(f"{row['concurrency']:>5} {row['requests']:>5} {row['errors']:>4} " + " ".join(cells))
+
+
+async def main(args):
+    profile = dict(PROFILES[args.profile])
+    for name in ("flights_ms", "lookup_ms", "catalog_ms", "translate_ms", "llm_ms"):
+        profile[name] *= args.latency_scale
+    levels = [int(c) for c in args.concurrency.split(",")]
+    workload = replay_workload(args.replay) if args.replay else generated_workload(args.requests)
+
+    with StubServer(flights_handler(profile), latency=profile["flights_ms"] / 1000) as flights, \
+            StubServer(hotellook_handler(profile), latency=profile["lookup_ms"] / 1000) as hotellook, \
+            StubServer(openrouter_handler(profile), latency=profile["llm_ms"] / 1000) as llm, \
+            tempfile.TemporaryDirectory() as data_dir:
+        stubs = {"flights": flights.url, "hotellook": hotellook.url, "llm": llm.url}
+        process = start_api(args.port, profile, stubs, data_dir, args.warm_cache,
+                            args.cassette, args.latency_scale, args.governor)
+        base_url = f"http://127.0.0.1:{args.port}"
+        limits = httpx.PoolLimits(soft_limit=max(levels), hard_limit=max(levels))
+        try:
+            async with httpx.AsyncClient(pool_limits=limits, timeout=120) as client:
+                await wait_ready(client, base_url, process)
+                url = base_url + "/recommend"
+                # Прогрев: каталоги отелей и локации попадают в дисковый кэш
+                await run_level(client, url, workload, min(8, max(levels)), args.warmup, process.pid)
+                results = []
+                for concurrency in levels:
+                    results.append(await run_level(client, url, workload, concurrency, args.requests, process.pid))
+        finally:
+            process.terminate()
+            process.wait()
+
+    print(f"профиль {args.profile} (x{args.latency_scale}), запросов на уровень {args.requests}, "
+          f"нагрузка: {args.replay or 'сгенерированная'}, кэш ответов: {'да' if args.warm_cache else 'нет'}, "
+          f"ограничители: {args.governor}")
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = {row["concurrency"]: row for row in json.load(f)["results"]}
+    print_table(results, baseline)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "profile": profile, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="typical")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--replay")
+    parser.add_argument("--cassette")
+    parser.add_argument("--warm-cache", action="store_true")
+    parser.add_argument("--governor", choices=("relaxed", "default"), default="relaxed",
+                        help="relaxed — лимиты провайдеров сняты, default — рабочие")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    asyncio.run(main(parser.parse_args()))
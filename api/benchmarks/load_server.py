@@ -0,0 +1,45 @@
+"""API для нагрузочного теста: обычное приложение, но переводчик — заглушка.
+
+googletrans ходит только на https://translate.google*, поэтому вместо
+отдельного сервера подменяется объект переводчика. Адреса остальных
+провайдеров задаются переменными окружения (FLIGHT_API_URL, HOTELLOOK_URL,
+OPENROUTER_API_URL). Запускается из benchmarks.load:
+
+    python -m benchmarks.load_server --port 8765 [--translate-ms 150]
+"""
+import argparse
+import random
+import time
+import zlib
+
+import uvicorn
+
+import hotels_request
+import main
+
+
+class StubTranslation:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubTranslator:
+    """Детерминированный «перевод» в ASCII с задержкой сетевого запроса."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def translate(self, text, src="auto", dest="en"):
+        time.sleep(self.latency)
+        return StubTranslation(f"city{zlib.crc32(text.encode('utf-8'))}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--translate-ms", type=float, default=150)
+    args = parser.parse_args()
+
+    random.seed(0)
+    hotels_request._translator = StubTranslator(args.translate_ms / 1000)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
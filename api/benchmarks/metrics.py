@@ -0,0 +1,36 @@
+"""Накладные расходы инструментирования: observe(), @timed и отрисовка /metrics.
+
+Запуск из каталога api:
+
+    python -m benchmarks.metrics [--calls 200000]
+"""
+import argparse
+import timeit
+
+from metrics import Histogram, render_prometheus, timed
+
+
+def main(args):
+    histogram = Histogram("bench_seconds", "Бенчмарк", ("stage",))
+    n = args.calls
+
+    def plain():
+        return 1
+
+    wrapped = timed("bench")(plain)
+
+    base = timeit.timeit(plain, number=n) / n
+    observe = timeit.timeit(lambda: histogram.observe(0.042, "flights"), number=n) / n
+    decorated = timeit.timeit(wrapped, number=n) / n
+    render = timeit.timeit(render_prometheus, number=100) / 100
+
+    print(f"вызов функции:          {base * 1e9:8.0f} нс")
+    print(f"Histogram.observe:      {observe * 1e9:8.0f} нс")
+    print(f"функция под @timed:     {decorated * 1e9:8.0f} нс (+{(decorated - base) * 1e9:.0f} нс)")
+    print(f"render_prometheus():    {render * 1e3:8.3f} мс")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    main(parser.parse_args())
@@ -0,0 +1,82 @@
+"""Бенчмарк календаря цен 7×7 (гибкие даты ±3 дня) на заглушке Travelpayouts.
+
+Сравнивает последовательный перебор дат с параллельным
+search_price_calendar_async и повторный запуск по кэшу.
+Запуск из каталога api:
+
+    python -m benchmarks.price_calendar [--latency-ms 200] [--rate 20] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import time
+import zlib
+
+import avia_parser
+from benchmarks.stubs import StubServer
+from flight_client import FlightClient
+from limits import RateLimiter
+
+SEARCH = dict(origin_input="MOW", destination_input="DXB",
+              departure_date="2025-06-10", return_date="2025-06-24", adult=2)
+
+
+def calendar_handler(method, path, query, body):
+    # Цена детерминированно зависит от пары дат
+    seed = zlib.crc32(f"{query.get('departure_at')}|{query.get('return_at')}".encode())
+    return 200, {"success": True, "data": [
+        {"origin": query["origin"], "destination": query.get("destination"),
+         "departure_at": query.get("departure_at"), "return_at": query.get("return_at"),
+         "price": 10000 + seed % 20000}
+    ]}
+
+
+async def sequential(flex_days):
+    search = avia_parser.resolve_search(
+        SEARCH["origin_input"], SEARCH["destination_input"],
+        SEARCH["departure_date"], SEARCH["return_date"], adult=SEARCH["adult"]
+    )
+    for dep_shift in range(-flex_days, flex_days + 1):
+        for ret_shift in range(-flex_days, flex_days + 1):
+            params = dict(
+                search,
+                departure_at=avia_parser.shift_date(search["departure_at"], dep_shift),
+                return_at=avia_parser.shift_date(search["return_at"], ret_shift)
+            )
+            await avia_parser.flight_client.fetch_prices(avia_parser.build_flight_params(**params))
+
+
+async def timed(label, stub, coro):
+    before = stub.requests
+    start = time.perf_counter()
+    result = await coro
+    print(f"{label:<28} {time.perf_counter() - start:7.2f} с, запросов в API: {stub.requests - before}")
+    return result
+
+
+async def main(args):
+    with StubServer(calendar_handler, latency=args.latency_ms / 1000) as stub:
+        avia_parser.flight_client = FlightClient(url=stub.url)
+
+        await timed("последовательно 7×7", stub, sequential(3))
+
+        def calendar():
+            return avia_parser.search_price_calendar_async(
+                **SEARCH, flex_days=3,
+                rate_limiter=RateLimiter(args.rate, burst=args.concurrency),
+                concurrency=args.concurrency
+            )
+
+        result = await timed("параллельно 7×7", stub, calendar())
+        await timed("повторно (из кэша)", stub, calendar())
+        print("\nСамые дешёвые даты:")
+        for combo in result["cheapest"]:
+            print(f"  {combo['departure_at']} — {combo['return_at']}: {combo['price']} ₽")
+        await avia_parser.flight_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--rate", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
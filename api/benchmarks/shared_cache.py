@@ -0,0 +1,81 @@
+"""Запросы к провайдеру при нескольких воркерах: кэш в памяти против общего SQLite.
+
+--workers процессов, как воркеры uvicorn, одновременно запрашивают
+одни и те же --keys ключей (по --rounds раз каждый) через TTLCache.get_or_fetch.
+Загрузка ключа стоит --latency-ms и считается общим счётчиком. С кэшем
+в памяти каждый процесс загружает всё сам; с общим хранилищем ключ
+загружает один процесс, остальные ждут его запись. Запуск из каталога api:
+
+    python -m benchmarks.shared_cache [--workers 4 --keys 200 --rounds 5]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+
+def worker(backend, db_path, args, upstream, start):
+    # Путь к базе читается при импорте, поэтому кэш импортируется уже в процессе воркера
+    os.environ["CACHE_DB_PATH"] = db_path
+    from cache import TTLCache
+
+    cache = TTLCache("bench", ttl=600, max_entries=args.keys * 2, backend=backend)
+
+    async def fetch(key):
+        await asyncio.sleep(args.latency_ms / 1000)
+        with upstream.get_lock():
+            upstream.value += 1
+        return {"key": key, "data": [{"price": random.randrange(1000, 90000)} for _ in range(30)]}
+
+    async def client(keys):
+        for key in keys:
+            await cache.get_or_fetch(key, lambda key=key: fetch(key))
+
+    async def run():
+        keys = [f"route-{i}" for i in range(args.keys)] * args.rounds
+        random.shuffle(keys)
+        chunk = len(keys) // args.clients + 1
+        await asyncio.gather(*(client(keys[i:i + chunk]) for i in range(0, len(keys), chunk)))
+
+    start.wait()
+    asyncio.run(run())
+
+
+def measure(backend, args):
+    upstream = multiprocessing.Value("i", 0)
+    start = multiprocessing.Event()
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, "cache.sqlite3")
+        processes = [multiprocessing.Process(target=worker, args=(backend, db_path, args, upstream, start))
+                     for _ in range(args.workers)]
+        for p in processes:
+            p.start()
+        time.sleep(1.0)
+        began = time.perf_counter()
+        start.set()
+        for p in processes:
+            p.join()
+        elapsed = time.perf_counter() - began
+    return upstream.value, elapsed
+
+
+def main(args):
+    lookups = args.workers * args.keys * args.rounds
+    print(f"{args.workers} воркеров, {args.keys} ключей, {lookups} обращений к кэшу")
+    print(f"{'хранилище':<10} {'к провайдеру':>12} {'на ключ':>8} {'обращений/с':>12}")
+    for backend in ("memory", "sqlite"):
+        calls, elapsed = measure(backend, args)
+        print(f"{backend:<10} {calls:>12} {calls / args.keys:>8.2f} {lookups / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--keys", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--clients", type=int, default=32, help="одновременных клиентов в воркере")
+    parser.add_argument("--latency-ms", type=float, default=100)
+    main(parser.parse_args())
@@ -0,0 +1,68 @@
+"""Нагрузочный тест объединения одинаковых запросов (single-flight).
+
+Волны одновременных одинаковых поисков перелётов идут в заглушку
+Travelpayouts напрямую и через fetch_flight_prices_async (кэш выключен,
+чтобы мерить именно объединение). Запуск из каталога api:
+
+    python -m benchmarks.singleflight [--callers 100] [--waves 10] [--latency-ms 200]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+# Мерим объединение, а не ограничитель провайдера: без этого базовый
+# вариант упирается в FLIGHTS_RATE и сравнение теряет смысл
+for name, value in (("FLIGHTS_RATE", "100000"), ("FLIGHTS_BURST", "100000"),
+                    ("FLIGHTS_MAX_CONCURRENCY", "1000"), ("FLIGHTS_MAX_QUEUE", "100000")):
+    os.environ.setdefault(name, value)
+
+import avia_parser
+from benchmarks.stubs import StubServer
+from flight_client import FlightClient
+
+PARAMS = dict(origin="MOW", destination="DXB", departure_at="2025-06-10",
+              return_at="2025-06-24", adult=2, child=0, infant=0, direct=False)
+
+
+def flights_handler(method, path, query, body):
+    return 200, {"success": True, "data": [
+        {"origin": query["origin"], "destination": query.get("destination"), "price": 15000 + i}
+        for i in range(10)
+    ]}
+
+
+async def run(label, stub, call, callers, waves):
+    before = stub.requests
+    start = time.perf_counter()
+    for _ in range(waves):
+        await asyncio.gather(*(call() for _ in range(callers)))
+    elapsed = time.perf_counter() - start
+    upstream = stub.requests - before
+    print(f"{label:<18} вызовов {callers * waves:5d}, запросов в API {upstream:5d}, "
+          f"QPS к API {upstream / elapsed:8.1f}, время {elapsed:6.2f} с")
+
+
+async def main(args):
+    with StubServer(flights_handler, latency=args.latency_ms / 1000) as stub:
+        client = FlightClient(url=stub.url)
+        avia_parser.flight_client = client
+        avia_parser.flight_cache.ttl = 0
+        avia_parser.flight_cache.stale_ttl = 0
+
+        await run("без объединения", stub,
+                  lambda: client.fetch_prices(avia_parser.build_flight_params(**PARAMS)),
+                  args.callers, args.waves)
+        await run("single-flight", stub,
+                  lambda: avia_parser.fetch_flight_prices_async(**PARAMS),
+                  args.callers, args.waves)
+        print(f"\n{avia_parser.flight_calls.stats()}")
+        await client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=100)
+    parser.add_argument("--waves", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    asyncio.run(main(parser.parse_args()))
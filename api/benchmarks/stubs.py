@@ -0,0 +1,117 @@
+"""Локальные заглушки внешних HTTP API для бенчмарков.
+
+StubServer поднимает HTTP/1.1 сервер с keep-alive в отдельном потоке.
+Задержка ответа (latency) и задержка установки соединения (handshake,
+имитирует TCP+TLS до удалённого хоста) настраиваются.
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+# handler(method, path, query, body) -> (status, json-объект или SSEStream)
+Handler = Callable[[str, str, Dict[str, str], Any], Tuple[int, Any]]
+
+
+class SSEStream:
+    """Ответ в формате text/event-stream: события отдаются с паузой delay."""
+
+    def __init__(self, events, delay: float = 0.0):
+        self.events = list(events)
+        self.delay = delay
+
+
+class StubServer:
+    def __init__(self, handler: Handler, latency: float = 0.0, handshake: float = 0.0):
+        self.handler = handler
+        self.latency = latency
+        self.handshake = handshake
+        self.requests = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def _make_handler(self):
+        stub = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.connections += 1
+                if stub.handshake:
+                    time.sleep(stub.handshake)
+
+            def _respond(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                body = json.loads(raw) if raw else None
+                parts = urlsplit(self.path)
+                query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, payload = stub.handler(method, parts.path, query, body)
+                if isinstance(payload, SSEStream):
+                    self._stream(status, payload)
+                    return
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, status, payload):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for event in payload.events:
+                    if payload.delay:
+                        time.sleep(payload.delay)
+                    chunk = f"data: {event}\n\n".encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                self._respond("GET")
+
+            def do_POST(self):
+                self._respond("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return RequestHandler
+
+    def __enter__(self) -> "StubServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+STUB_ANSWER = "## Ответ заглушки\n- пункт первый\n- пункт второй"
+
+
+def openrouter_handler(method, path, query, body, token_delay: float = 0.02):
+    if body and body.get("stream"):
+        tokens = [STUB_ANSWER[i:i + 4] for i in range(0, len(STUB_ANSWER), 4)]
+        events = [json.dumps({"choices": [{"delta": {"content": t}}]}, ensure_ascii=False) for t in tokens]
+        return 200, SSEStream(events + ["[DONE]"], delay=token_delay)
+    return 200, {"choices": [{"message": {"content": STUB_ANSWER}}]}
@@ -0,0 +1,232 @@
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from cache_store import CACHE_LEASE_POLL, CACHE_LEASE_TTL, open_store
+from reference_data import deep_sizeof
+
+# Все созданные кэши по имени, для /cache/stats
+CACHES: Dict[str, "TTLCache"] = {}
+
+
+class TTLCache:
+    """Кэш с TTL и вытеснением по числу записей и объёму.
+
+    Запись свежая до ttl; после этого ещё stale_ttl секунд она может
+    отдаваться как устаревшая, пока get_or_fetch обновляет её в фоне
+    (stale-while-revalidate). Записи хранятся в памяти процесса или
+    в общем для воркеров SQLite (backend, по умолчанию CACHE_BACKEND);
+    во втором случае промах по ключу загружает один процесс, остальные
+    ждут его запись.
+
+    Из асинхронного кода — методы *_async и get_or_fetch: с общим
+    хранилищем они обращаются к SQLite в пуле потоков, чтобы ожидание
+    блокировки записи не останавливало event loop. Синхронные методы —
+    для потоков и скриптов.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024, stale_ttl: float = 0.0,
+                 sizeof: Callable[[Any], int] = deep_sizeof, backend: Optional[str] = None):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.store = open_store(name, max_entries, max_bytes, sizeof, backend)
+        self._refreshing: Dict[Hashable, asyncio.Task] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        # Попадания в записи, заранее прогретые фоновым prefetch (каждая считается один раз)
+        self.prefetch_hits = 0
+        # Промахи, дождавшиеся загрузки в другом процессе вместо своего запроса
+        self.lease_waits = 0
+        CACHES[name] = self
+
+    def __len__(self) -> int:
+        return self.store.usage()[0]
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        """Возвращает (значение, свежее ли оно) или (None, False) при промахе."""
+        entry = self.store.get(key)
+        now = time.time()
+        if entry is None:
+            self.misses += 1
+            return None, False
+        if now >= entry.stale_until:
+            self.store.delete(key)
+            self.expirations += 1
+            self.misses += 1
+            return None, False
+        self.store.touch(key)
+        if entry.prefetched and self.store.take_prefetched(key):
+            self.prefetch_hits += 1
+        if now < entry.expires_at:
+            self.hits += 1
+            return entry.value, True
+        self.stale_hits += 1
+        return entry.value, False
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Только свежее значение или None."""
+        value, fresh = self.lookup(key)
+        return value if fresh else None
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Значение даже после stale_ttl, пока запись не вытеснена; без учёта в статистике.
+
+        Запасной ответ, когда провайдер недоступен."""
+        entry = self.store.get(key)
+        return entry.value if entry is not None else None
+
+    def fresh(self, key: Hashable) -> Optional[Any]:
+        """Свежее значение или None; без учёта в статистике."""
+        entry = self.store.get(key)
+        return entry.value if entry is not None and time.time() < entry.expires_at else None
+
+    def ttl_left(self, key: Hashable) -> Optional[float]:
+        """Сколько секунд запись ещё свежая (меньше нуля — устарела), None — записи нет."""
+        entry = self.store.get(key)
+        return entry.expires_at - time.time() if entry is not None else None
+
+    def set(self, key: Hashable, value: Any, prefetched: bool = False) -> None:
+        now = time.time()
+        evicted = self.store.put(key, value, now + self.ttl, now + self.ttl + self.stale_ttl, prefetched)
+        self.evictions += evicted or 0
+
+    async def _io(self, method: Callable[..., Any], *args) -> Any:
+        # Память отвечает сразу; SQLite может ждать блокировку до CACHE_DB_TIMEOUT
+        if self.store.shared:
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def lookup_async(self, key: Hashable) -> Tuple[Optional[Any], bool]:
+        return await self._io(self.lookup, key)
+
+    async def get_async(self, key: Hashable) -> Optional[Any]:
+        return await self._io(self.get, key)
+
+    async def peek_async(self, key: Hashable) -> Optional[Any]:
+        return await self._io(self.peek, key)
+
+    async def fresh_async(self, key: Hashable) -> Optional[Any]:
+        return await self._io(self.fresh, key)
+
+    async def ttl_left_async(self, key: Hashable) -> Optional[float]:
+        return await self._io(self.ttl_left, key)
+
+    async def set_async(self, key: Hashable, value: Any, prefetched: bool = False) -> None:
+        await self._io(self.set, key, value, prefetched)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.store.delete(key)
+
+    def clear(self) -> None:
+        self.store.clear()
+
+    async def _renew(self, key: Hashable) -> None:
+        while True:
+            await asyncio.sleep(CACHE_LEASE_TTL / 3)
+            await self._io(self.store.renew, key)
+
+    async def _fetch_leased(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """fetch() под своей арендой: она продлевается, пока загрузка идёт дольше CACHE_LEASE_TTL."""
+        renewer = asyncio.create_task(self._renew(key)) if self.store.shared else None
+        try:
+            return await fetch()
+        finally:
+            if renewer is not None:
+                renewer.cancel()
+
+    async def _refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> None:
+        # Общую запись обновляет один процесс; остальные отдают устаревшую, пока он не закончит
+        acquired = False
+        try:
+            acquired = await self._io(self.store.acquire, key)
+            if acquired:
+                await self.set_async(key, await self._fetch_leased(key, fetch))
+                self.refreshes += 1
+        except Exception as e:
+            self.refresh_errors += 1
+            print(f"Ошибка фонового обновления кэша {self.name}: {e}")
+        finally:
+            if acquired:
+                await self._io(self.store.release, key)
+            self._refreshing.pop(key, None)
+
+    async def _fetch_once(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Промах: fetch() в одном процессе, остальные ждут его запись.
+
+        Держатель аренды продлевает её, пока загружает, поэтому ждём,
+        пока значение не появится или аренда не освободится: после
+        ошибки держателя или его падения (через CACHE_LEASE_TTL).
+        """
+        acquired = await self._io(self.store.acquire, key)
+        while not acquired:
+            await asyncio.sleep(CACHE_LEASE_POLL)
+            value = await self.fresh_async(key)
+            if value is not None:
+                self.lease_waits += 1
+                return value
+            acquired = await self._io(self.store.acquire, key)
+        if self.store.shared:
+            # Аренду мог только что отпустить процесс, уже записавший значение
+            value = await self.fresh_async(key)
+            if value is not None:
+                await self._io(self.store.release, key)
+                self.lease_waits += 1
+                return value
+        try:
+            value = await self._fetch_leased(key, fetch)
+            await self.set_async(key, value)
+            return value
+        finally:
+            await self._io(self.store.release, key)
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Значение из кэша или результат fetch().
+
+        Устаревшая запись отдаётся сразу, а fetch() запускается в фоне
+        (не более одного обновления на ключ).
+        """
+        value, fresh = await self.lookup_async(key)
+        if fresh:
+            return value
+        if value is not None:
+            if key not in self._refreshing:
+                self._refreshing[key] = asyncio.create_task(self._refresh(key, fetch))
+            return value
+        return await self._fetch_once(key, fetch)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        entries, size = self.store.usage()
+        return {
+            "backend": "sqlite" if self.store.shared else "memory",
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "prefetch_hits": self.prefetch_hits,
+            "lease_waits": self.lease_waits,
+            "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -0,0 +1,356 @@
+import os
+import time
+import uuid
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from reference_data import DATA_DIR, deep_sizeof
+
+# Где хранятся кэши: memory — в памяти процесса, sqlite — общий файл для всех
+# воркеров uvicorn на узле (--workers N): запрос, сделанный одним воркером,
+# видят все, и данные переживают перезапуск
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(DATA_DIR, "data_cache", "cache.sqlite3"))
+# Сколько ждать блокировку записи SQLite, прежде чем считать операцию неудачной
+CACHE_DB_TIMEOUT = float(os.getenv("CACHE_DB_TIMEOUT", "5"))
+# На сколько воркер захватывает право загрузить ключ и как часто другие проверяют результат.
+# Пока загрузка идёт, аренда продлевается каждые CACHE_LEASE_TTL / 3 секунд, так что TTL
+# ограничивает только ожидание после падения воркера, а не длительность загрузки
+CACHE_LEASE_TTL = float(os.getenv("CACHE_LEASE_TTL", "30"))
+CACHE_LEASE_POLL = float(os.getenv("CACHE_LEASE_POLL", "0.05"))
+
+# Свой id у каждого процесса: по нему снимается только своя аренда
+_OWNER = uuid.uuid4().hex
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires_at", "stale_until", "prefetched")
+
+    def __init__(self, value: Any, size: int, expires_at: float, stale_until: float,
+                 prefetched: bool = False):
+        self.value = value
+        self.size = size
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.prefetched = prefetched
+
+
+class MemoryStore:
+    """Записи одного кэша в памяти процесса, вытеснение по LRU."""
+
+    shared = False
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int,
+                 sizeof: Callable[[Any], int] = deep_sizeof):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key)
+        self._bytes -= entry.size
+
+    def get(self, key: Hashable) -> Optional[_Entry]:
+        with self._lock:
+            return self._data.get(key)
+
+    def touch(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+
+    def take_prefetched(self, key: Hashable) -> bool:
+        """Снимает отметку прогрева; True — только у первого, кто её снял."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or not entry.prefetched:
+                return False
+            entry.prefetched = False
+            return True
+
+    def put(self, key: Hashable, value: Any, expires_at: float, stale_until: float,
+            prefetched: bool = False) -> Optional[int]:
+        """Сохраняет запись; число вытесненных или None, если значение больше max_bytes."""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return None
+        entry = _Entry(value, size, expires_at, stale_until, prefetched)
+        evicted = 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = entry
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                evicted += 1
+        return evicted
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def usage(self) -> Tuple[int, int]:
+        return len(self._data), self._bytes
+
+    # Внутри процесса одновременные загрузки объединяет SingleFlight
+    def acquire(self, key: Hashable, ttl: float = CACHE_LEASE_TTL) -> bool:
+        return True
+
+    def renew(self, key: Hashable, ttl: float = CACHE_LEASE_TTL) -> bool:
+        return True
+
+    def release(self, key: Hashable) -> None:
+        pass
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    cache TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    prefetched INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (cache, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_age ON entries (cache, stored_at);
+CREATE TABLE IF NOT EXISTS leases (
+    cache TEXT NOT NULL,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (cache, key)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteDatabase:
+    """Файл SQLite в режиме WAL, общий для всех процессов узла.
+
+    Читатели не блокируют писателя и друг друга; записи идут короткими
+    транзакциями BEGIN IMMEDIATE, конкурирующие ждут до CACHE_DB_TIMEOUT.
+    У каждого потока своё соединение.
+    """
+
+    def __init__(self, path: str = CACHE_DB_PATH, timeout: float = CACHE_DB_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._schema_ready = False
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # Кэш можно перезапросить: при сбое питания допустимо потерять последние записи
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    def write(self, statements) -> Any:
+        """Выполняет statements(conn) в одной транзакции записи."""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = statements(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+
+_databases: Dict[str, SQLiteDatabase] = {}
+
+
+def database(path: str = CACHE_DB_PATH) -> SQLiteDatabase:
+    if path not in _databases:
+        _databases[path] = SQLiteDatabase(path)
+    return _databases[path]
+
+
+class SQLiteStore:
+    """Записи одного кэша в общей базе SQLite.
+
+    Ключ хранится как repr (кортежи строк и чисел, строки), значение —
+    pickle. Сверх max_entries и max_bytes удаляются сначала истёкшие,
+    затем самые старые по времени записи: порядок чтения между процессами
+    не отслеживается, чтобы чтение не становилось записью.
+    """
+
+    shared = True
+
+    def __init__(self, name: str, max_entries: int, max_bytes: int, db: Optional[SQLiteDatabase] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db = db or database()
+
+    def get(self, key: Hashable) -> Optional[_Entry]:
+        row = self.db.connection().execute(
+            "SELECT value, size, expires_at, stale_until, prefetched FROM entries WHERE cache = ? AND key = ?",
+            (self.name, repr(key))
+        ).fetchone()
+        if row is None:
+            return None
+        value, size, expires_at, stale_until, prefetched = row
+        try:
+            return _Entry(pickle.loads(value), size, expires_at, stale_until, bool(prefetched))
+        except Exception as e:
+            print(f"Повреждена запись кэша {self.name}: {e}")
+            return None
+
+    def touch(self, key: Hashable) -> None:
+        pass
+
+    def take_prefetched(self, key: Hashable) -> bool:
+        return self.db.write(lambda conn: conn.execute(
+            "UPDATE entries SET prefetched = 0 WHERE cache = ? AND key = ? AND prefetched = 1",
+            (self.name, repr(key))
+        ).rowcount == 1)
+
+    def put(self, key: Hashable, value: Any, expires_at: float, stale_until: float,
+            prefetched: bool = False) -> Optional[int]:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return None
+        now = time.time()
+
+        def statements(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.name, repr(key), blob, len(blob), now, expires_at, stale_until, int(prefetched))
+            )
+            return self._evict(conn, now)
+
+        return self.db.write(statements)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> int:
+        entries, size = self._usage(conn)
+        if entries <= self.max_entries and size <= self.max_bytes:
+            return 0
+        evicted = conn.execute(
+            "DELETE FROM entries WHERE cache = ? AND stale_until <= ?", (self.name, now)
+        ).rowcount
+        entries, size = self._usage(conn)
+        while entries > self.max_entries or size > self.max_bytes:
+            # Лишние по числу — разом; по объёму — по одной самой старой
+            batch = max(1, entries - self.max_entries)
+            evicted += conn.execute(
+                "DELETE FROM entries WHERE cache = ? AND key IN "
+                "(SELECT key FROM entries WHERE cache = ? ORDER BY stored_at LIMIT ?)",
+                (self.name, self.name, batch)
+            ).rowcount
+            entries, size = self._usage(conn)
+        return evicted
+
+    def _usage(self, conn: sqlite3.Connection) -> Tuple[int, int]:
+        entries, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE cache = ?", (self.name,)
+        ).fetchone()
+        return entries, size
+
+    def delete(self, key: Hashable) -> None:
+        self.db.write(lambda conn: conn.execute(
+            "DELETE FROM entries WHERE cache = ? AND key = ?", (self.name, repr(key))
+        ))
+
+    def clear(self) -> None:
+        self.db.write(lambda conn: conn.execute("DELETE FROM entries WHERE cache = ?", (self.name,)))
+
+    def usage(self) -> Tuple[int, int]:
+        return self._usage(self.db.connection())
+
+    def acquire(self, key: Hashable, ttl: float = CACHE_LEASE_TTL) -> bool:
+        """Право загрузить ключ для всех процессов; истёкшую чужую аренду можно перехватить."""
+        now = time.time()
+        return self.db.write(lambda conn: conn.execute(
+            "INSERT INTO leases VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (cache, key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.expires_at <= ?",
+            (self.name, repr(key), _OWNER, now + ttl, now)
+        ).rowcount == 1)
+
+    def renew(self, key: Hashable, ttl: float = CACHE_LEASE_TTL) -> bool:
+        """Продлевает свою аренду; False — её уже нет или перехватил другой процесс."""
+        return self.db.write(lambda conn: conn.execute(
+            "UPDATE leases SET expires_at = ? WHERE cache = ? AND key = ? AND owner = ?",
+            (time.time() + ttl, self.name, repr(key), _OWNER)
+        ).rowcount == 1)
+
+    def release(self, key: Hashable) -> None:
+        self.db.write(lambda conn: conn.execute(
+            "DELETE FROM leases WHERE cache = ? AND key = ? AND owner = ?", (self.name, repr(key), _OWNER)
+        ))
+
+
+def open_store(name: str, max_entries: int, max_bytes: int,
+               sizeof: Callable[[Any], int] = deep_sizeof, backend: Optional[str] = None):
+    """Хранилище кэша name для backend (по умолчанию CACHE_BACKEND)."""
+    backend = backend or CACHE_BACKEND
+    if backend == "memory":
+        return MemoryStore(name, max_entries, max_bytes, sizeof)
+    if backend == "sqlite":
+        return SQLiteStore(name, max_entries, max_bytes)
+    raise ValueError(f"Неизвестный CACHE_BACKEND: {backend} (есть memory, sqlite)")
+
+
+def wait_for_lease(store, key: Hashable, ready: Callable[[], Optional[Any]],
+                   ttl: float = CACHE_LEASE_TTL, poll: float = CACHE_LEASE_POLL) -> Tuple[bool, Optional[Any]]:
+    """Синхронно: (True, None) — аренда наша, загружать под renewing и потом release;
+    (False, value) — значение появилось, пока загружал другой процесс.
+
+    Держатель продлевает аренду, пока загружает, поэтому ждём сколько нужно:
+    если он упал, аренда истечёт через ttl и перейдёт к нам.
+    """
+    while not store.acquire(key, ttl):
+        value = ready()
+        if value is not None:
+            return False, value
+        time.sleep(poll)
+    return True, None
+
+
+@contextmanager
+def renewing(store, key: Hashable, ttl: float = CACHE_LEASE_TTL):
+    """Продлевает аренду key из фонового потока, пока идёт синхронная загрузка."""
+    if not store.shared:
+        yield
+        return
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(ttl / 3):
+            store.renew(key, ttl)
+
+    thread = threading.Thread(target=renew, name=f"lease-{store.name}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
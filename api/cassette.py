@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import zlib
+import struct
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from reference_data import DATA_DIR
+
+# off — обычная работа, record — запросы идут в сеть и записываются,
+# replay — ответы только из архива, сеть не используется
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", os.path.join(DATA_DIR, "data_cache", "upstream.cassette"))
+# Множитель записанной задержки при воспроизведении: 1 — как было, 0 — без задержки
+CASSETTE_LATENCY_SCALE = float(os.getenv("CASSETTE_LATENCY_SCALE", "1"))
+
+# Параметры с секретами не попадают ни в ключ, ни в архив
+SECRET_PARAMS = {"token", "api_key", "key"}
+
+# Заголовок записи: длина метаданных и длина сжатого тела
+_RECORD = struct.Struct(">II")
+
+
+class CassetteMiss(Exception):
+    """В режиме replay нет записи для запроса."""
+
+
+class RecordedResponse:
+    """Ответ из архива с тем же интерфейсом, что используют клиенты."""
+
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}: {self.text[:200]}")
+
+    async def aiter_bytes(self):
+        yield self.content
+
+
+class Cassette:
+    """Архив ответов внешних API для воспроизводимых прогонов без сети.
+
+    Файл только дописывается: каждая запись — заголовок, JSON с ключом,
+    провайдером, кодом ответа и задержкой, затем тело, сжатое zlib.
+    При открытии читаются только заголовки и строится индекс
+    ключ -> смещение тела; оборванная последняя запись игнорируется.
+    """
+
+    def __init__(self, path: str = CASSETTE_PATH, mode: str = CASSETTE_MODE,
+                 latency_scale: float = CASSETTE_LATENCY_SCALE):
+        if mode not in ("off", "record", "replay"):
+            raise ValueError(f"Неизвестный режим CASSETTE_MODE: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[int, int, int, float]] = {}
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        if mode != "off":
+            self._load_index()
+
+    @property
+    def active(self) -> bool:
+        return self.mode != "off"
+
+    def _load_index(self) -> None:
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            end = 0
+            while end + _RECORD.size <= size:
+                meta_len, body_len = _RECORD.unpack(f.read(_RECORD.size))
+                offset = end + _RECORD.size + meta_len
+                if offset + body_len > size:
+                    break
+                meta = json.loads(f.read(meta_len))
+                self._index[meta["key"]] = (offset, body_len, meta["status"], meta["latency"])
+                end = f.seek(body_len, os.SEEK_CUR)
+        # Обрыв при записи: хвост после последней целой записи пропускаем
+        if end < size:
+            print(f"Архив {self.path}: последняя запись неполная и будет пропущена")
+
+    @staticmethod
+    def key(provider: str, method: str, url: str, params: Optional[Dict[str, Any]] = None,
+            body: Any = None) -> str:
+        """Ключ запроса без хоста и секретов: один архив годится для любого адреса API."""
+        parts = urlsplit(url)
+        query = dict(parse_qsl(parts.query))
+        query.update({k: str(v) for k, v in (params or {}).items()})
+        query = sorted((k, v) for k, v in query.items() if k not in SECRET_PARAMS)
+        raw = json.dumps([provider, method, parts.path, query, body], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _read(self, key: str) -> Optional[Tuple[int, bytes, float]]:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        offset, length, status, latency = entry
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return status, zlib.decompress(f.read(length)), latency
+
+    def _write(self, key: str, provider: str, status: int, latency: float, content: bytes) -> None:
+        meta = json.dumps({"key": key, "provider": provider, "status": status,
+                           "latency": round(latency, 4)}).encode("utf-8")
+        body = zlib.compress(content, 6)
+        with self._lock:
+            if key in self._index:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as f:
+                f.write(_RECORD.pack(len(meta), len(body)) + meta)
+                offset = f.tell()
+                f.write(body)
+            self._index[key] = (offset, len(body), status, latency)
+            self.recorded += 1
+
+    def _replay(self, key: str) -> Tuple[int, bytes, float]:
+        found = self._read(key)
+        if found is None:
+            self.misses += 1
+            raise CassetteMiss(f"Нет записи в {self.path} для запроса {key}")
+        self.replayed += 1
+        status, content, latency = found
+        return status, content, latency * self.latency_scale
+
+    def request(self, provider: str, method: str, url: str, fetch: Callable[[], Any],
+                params: Optional[Dict[str, Any]] = None, body: Any = None) -> Any:
+        """HTTP-запрос клиента (requests): fetch() или ответ из архива."""
+        if not self.active:
+            return fetch()
+        key = self.key(provider, method, url, params, body)
+        if self.mode == "replay":
+            status, content, delay = self._replay(key)
+            time.sleep(delay)
+            return RecordedResponse(status, content)
+        start = time.perf_counter()
+        response = fetch()
+        self._write(key, provider, response.status_code, time.perf_counter() - start, response.content)
+        return response
+
+    async def request_async(self, provider: str, method: str, url: str,
+                            fetch: Callable[[], Awaitable[Any]],
+                            params: Optional[Dict[str, Any]] = None, body: Any = None) -> Any:
+        """Асинхронный вариант request для клиентов httpx."""
+        if not self.active:
+            return await fetch()
+        key = self.key(provider, method, url, params, body)
+        if self.mode == "replay":
+            status, content, delay = await asyncio.to_thread(self._replay, key)
+            await asyncio.sleep(delay)
+            return RecordedResponse(status, content)
+        start = time.perf_counter()
+        response = await fetch()
+        await asyncio.to_thread(
+            self._write, key, provider, response.status_code, time.perf_counter() - start, response.content
+        )
+        return response
+
+    def call(self, provider: str, argument: Any, fetch: Callable[[], Any]) -> Any:
+        """Вызов не-HTTP клиента (переводчик): результат должен сериализоваться в JSON."""
+        if not self.active:
+            return fetch()
+        key = self.key(provider, "CALL", "", body=argument)
+        if self.mode == "replay":
+            _, content, delay = self._replay(key)
+            time.sleep(delay)
+            return json.loads(content)
+        start = time.perf_counter()
+        value = fetch()
+        self._write(key, provider, 200, time.perf_counter() - start,
+                    json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "path": self.path,
+            "entries": len(self._index),
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "misses": self.misses,
+            "latency_scale": self.latency_scale,
+        }
+
+
+cassette = Cassette()
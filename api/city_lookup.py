@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import atexit
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from cache import TTLCache
+from cache_store import CACHE_BACKEND
+from reference_data import DATA_DIR
+from singleflight import SingleFlight
+
+try:
+    import fcntl
+except ImportError:  # Windows: файл пишет один процесс
+    fcntl = None
+
+LOCATIONS_FILE = os.getenv(
+    "CITY_LOCATIONS_FILE", os.path.join(DATA_DIR, "data_cache", "city_locations.json")
+)
+# Найденные локации почти не меняются; промахи перепроверяем чаще
+POSITIVE_TTL = float(os.getenv("CITY_LOCATION_TTL", str(90 * 24 * 3600)))
+NEGATIVE_TTL = float(os.getenv("CITY_LOCATION_NEGATIVE_TTL", str(24 * 3600)))
+CITY_SHARED_ENTRIES = int(os.getenv("CITY_SHARED_ENTRIES", "100000"))
+# Новые записи копятся и пишутся в файл одним разом не чаще, чем раз в столько секунд
+SAVE_DELAY = float(os.getenv("CITY_LOCATIONS_SAVE_DELAY", "5"))
+
+
+def normalize_city(name: str) -> str:
+    return " ".join(name.split()).lower()
+
+
+class CityLocationTable:
+    """Сохраняемая таблица: город -> английское название -> locationId Hotellook.
+
+    Переводы и ответы lookup.json кэшируются отдельно, так что «Париж»
+    и «Paris» приводят к одной записи. Отсутствие локации тоже
+    запоминается (на NEGATIVE_TTL). Таблица общая для всех запросов
+    процесса и переживает перезапуск. При CACHE_BACKEND=sqlite записи
+    дублируются в общий кэш city_locations, и город, найденный одним
+    воркером, не ищется заново в остальных.
+
+    Файл пишется не на каждую новую запись, а через SAVE_DELAY секунд
+    после первой несохранённой и при выходе. Запись атомарная (временный
+    файл + os.replace) под файловой блокировкой, и перед ней в таблицу
+    подмешиваются более новые записи из файла: воркеры, пишущие один
+    файл, не затирают находки друг друга.
+    """
+
+    def __init__(self, path: str = LOCATIONS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        # Одна запись файла за раз: снимок, сделанный позже, не перезапишется более старым
+        self._save_lock = threading.Lock()
+        self._save_timer: Optional[threading.Timer] = None
+        self.translations: Dict[str, Dict[str, Any]] = {}
+        self.locations: Dict[str, Dict[str, Any]] = {}
+        self.calls = SingleFlight("city_lookup")
+        self.shared = TTLCache(
+            "city_locations", ttl=POSITIVE_TTL, max_entries=CITY_SHARED_ENTRIES
+        ) if CACHE_BACKEND != "memory" else None
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+        self._load()
+        atexit.register(self.flush)
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            print(f"Повреждён файл {self.path}: {e}")
+            return {}
+
+    def _load(self) -> None:
+        data = self._read()
+        self.translations = data.get("translations", {})
+        self.locations = data.get("locations", {})
+
+    def _schedule_save(self) -> None:
+        with self._lock:
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(SAVE_DELAY, self.save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self) -> None:
+        """Сохраняет отложенные записи сразу (при остановке процесса)."""
+        with self._lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        with self._save_lock, open(self.path + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            on_disk = self._read()
+            with self._lock:
+                self._save_timer = None
+                for table in ("translations", "locations"):
+                    entries = getattr(self, table)
+                    for key, entry in on_disk.get(table, {}).items():
+                        if key not in entries or entry["resolved_at"] > entries[key]["resolved_at"]:
+                            entries[key] = entry
+                data = {"translations": dict(self.translations), "locations": dict(self.locations)}
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self.saves += 1
+
+    @staticmethod
+    def _fresh(entry: Optional[Dict[str, Any]], ttl: float) -> bool:
+        return entry is not None and time.time() - entry["resolved_at"] < ttl
+
+    def _entry(self, table: str, key: str) -> Optional[Dict[str, Any]]:
+        """Запись таблицы; если своя устарела или её нет — более новая из общего кэша."""
+        entry = getattr(self, table).get(key)
+        if self.shared is None or self._fresh(entry, NEGATIVE_TTL):
+            return entry
+        shared = self.shared.get((table, key))
+        if shared is not None and (entry is None or shared["resolved_at"] > entry["resolved_at"]):
+            with self._lock:
+                getattr(self, table)[key] = shared
+            return shared
+        return entry
+
+    def _store(self, table: str, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            getattr(self, table)[key] = entry
+        if self.shared is not None:
+            self.shared.set((table, key), entry)
+        self._schedule_save()
+
+    def english_name(self, city: str, translate: Callable[[str], str]) -> str:
+        key = normalize_city(city)
+        entry = self._entry("translations", key)
+        if self._fresh(entry, POSITIVE_TTL):
+            return entry["en"]
+        en_name = self.calls.do_sync(("translate", key), lambda: translate(city))
+        self._store("translations", key, {"en": en_name, "resolved_at": time.time()})
+        return en_name
+
+    def resolve(self, city: str, translate: Callable[[str], str],
+                lookup: Callable[[str], Optional[int]]) -> Optional[int]:
+        """locationId города; сеть используется только для новых городов."""
+        en_name = self.english_name(city, translate)
+        key = normalize_city(en_name)
+        entry = self._entry("locations", key)
+        ttl = POSITIVE_TTL if entry and entry["id"] is not None else NEGATIVE_TTL
+        if self._fresh(entry, ttl):
+            self.hits += 1
+            return entry["id"]
+
+        self.misses += 1
+        location_id = self.calls.do_sync(("lookup", key), lambda: lookup(en_name))
+        self._store("locations", key, {"id": location_id, "resolved_at": time.time()})
+        return location_id
+
+    def known_id(self, city: str) -> Optional[int]:
+        """locationId из таблицы без обращений к сети, даже устаревший."""
+        entry = self._entry("translations", normalize_city(city))
+        en_name = entry["en"] if entry else city
+        location = self._entry("locations", normalize_city(en_name))
+        return location["id"] if location else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "translations": len(self.translations),
+            "locations": len(self.locations),
+            "negative": sum(1 for e in self.locations.values() if e["id"] is None),
+            "hits": self.hits,
+            "misses": self.misses,
+            "saves": self.saves,
+        }
+
+
+city_locations = CityLocationTable()
@@ -0,0 +1,99 @@
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# Длина n-граммы для подстрочного индекса
+NGRAM = 3
+
+
+def _ngrams(text: str, n: int = NGRAM) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class CityResolver:
+    """Индекс справочника городов: название -> IATA и IATA -> название.
+
+    Строится один раз по словарю city2code.json. Точные совпадения ищутся
+    по хеш-таблице, подстроки — через индекс триграмм, обратный поиск
+    кода — по отдельному словарю.
+    """
+
+    def __init__(self, city_codes: Dict[str, str]):
+        self._names: List[str] = list(city_codes)
+        self._codes: List[str] = [city_codes[name] for name in self._names]
+        self._lower: List[str] = [name.lower() for name in self._names]
+
+        self._exact: Dict[str, int] = {}
+        self._code_to_city: Dict[str, str] = {}
+        index: Dict[str, List[int]] = {}
+
+        for i, name in enumerate(self._lower):
+            # При коллизиях побеждает первая запись, как при линейном проходе
+            self._exact.setdefault(name, i)
+            self._code_to_city.setdefault(self._codes[i], self._names[i])
+            for gram in _ngrams(name):
+                index.setdefault(gram, []).append(i)
+        # Списки вхождений храним компактно, как массивы uint32
+        self._index: Dict[str, array] = {
+            gram: array("I", ids) for gram, ids in index.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _candidates(self, query: str) -> List[int]:
+        """Номера записей, в названии которых встречается query."""
+        if len(query) < NGRAM:
+            return [i for i, name in enumerate(self._lower) if query in name]
+
+        postings = []
+        for gram in _ngrams(query):
+            ids = self._index.get(gram)
+            if not ids:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+
+        found = set(postings[0])
+        for ids in postings[1:]:
+            found.intersection_update(ids)
+            if not found:
+                return []
+        # Триграммы не гарантируют подстроку, проверяем явно
+        return [i for i in found if query in self._lower[i]]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, str]]:
+        """Кандидаты (город, IATA) по убыванию релевантности.
+
+        Порядок детерминирован: точное совпадение, затем совпадение
+        по префиксу, затем по подстроке; внутри группы — более короткие
+        названия, затем порядок в справочнике.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+
+        def rank(i: int) -> Tuple[int, int, int]:
+            name = self._lower[i]
+            if name == query:
+                group = 0
+            elif name.startswith(query):
+                group = 1
+            else:
+                group = 2
+            return group, len(name), i
+
+        ranked = sorted(self._candidates(query), key=rank)[:limit]
+        return [(self._names[i], self._codes[i]) for i in ranked]
+
+    def find_code(self, city_name: str) -> Optional[str]:
+        """IATA-код лучшего совпадения или None."""
+        query = city_name.strip().lower()
+        i = self._exact.get(query)
+        if i is not None:
+            return self._codes[i]
+        matches = self.search(query, limit=1)
+        return matches[0][1] if matches else None
+
+    def city_name(self, code: str) -> str:
+        """Название города по коду; если не нашли, оставляем IATA."""
+        return self._code_to_city.get(code, code)
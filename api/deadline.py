@@ -0,0 +1,74 @@
+import os
+import time
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Optional
+
+# Общий срок ответа /recommend; клиент Streamlit ждёт ответ не дольше 60 с
+RECOMMEND_DEADLINE = float(os.getenv("RECOMMEND_DEADLINE", "45"))
+# Сколько секунд срока оставлять билетам, отелям и LLM, пока идут
+# необязательные этапы (календарь цен, отели направлений-кандидатов)
+DEADLINE_RESERVE = float(os.getenv("DEADLINE_RESERVE", "20"))
+# Если до срока осталось меньше, LLM-секции не запускаются и не ждутся
+LLM_MIN_BUDGET = float(os.getenv("LLM_MIN_BUDGET", "5"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """Срок запроса истёк раньше, чем этап успел начаться или закончиться."""
+
+
+class Deadline:
+    """Момент, к которому запрос должен быть готов."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, default: Optional[float] = None, reserve: float = 0.0) -> float:
+        """Сколько можно дать этапу: не больше default и остатка срока за вычетом reserve."""
+        left = self.remaining() - reserve
+        if left <= 0:
+            raise DeadlineExceeded(f"до срока запроса осталось {self.remaining():.1f} с")
+        return left if default is None else min(default, left)
+
+
+# Срок текущего запроса; задачи и asyncio.to_thread наследуют его через контекст
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def use_deadline(seconds: float) -> Deadline:
+    """Задаёт срок для текущего контекста и всех задач, созданных после."""
+    deadline = Deadline(seconds)
+    _deadline.set(deadline)
+    return deadline
+
+
+def timeout_for(default: Optional[float], reserve: float = 0.0) -> Optional[float]:
+    """Таймаут внешнего вызова с учётом срока запроса; без срока — default."""
+    deadline = _deadline.get()
+    return default if deadline is None else deadline.timeout(default, reserve)
+
+
+async def within(awaitable: Awaitable[Any], reserve: float = 0.0) -> Any:
+    """Ждёт awaitable не дольше остатка срока; по истечении — DeadlineExceeded.
+
+    Задача, переданная сюда, отменяется вместе с ожиданием.
+    """
+    deadline = _deadline.get()
+    if deadline is None or (isinstance(awaitable, asyncio.Future) and awaitable.done()):
+        return await awaitable
+    try:
+        timeout = deadline.timeout(reserve=reserve)
+    except DeadlineExceeded:
+        if isinstance(awaitable, asyncio.Future):
+            awaitable.cancel()
+        elif asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"этап не уложился в {timeout:.1f} с до срока запроса") from None
@@ -0,0 +1,238 @@
+import os
+import csv
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# Сколько строк собирать в один пакет Parquet/Arrow; память экспорта ограничена им
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+
+BASE_LINK = "https://www.aviasales.ru"
+CLASS_NAMES = {0: "Эконом", 1: "Бизнес", 2: "Первый"}
+
+# Поля строки экспорта и заголовки CSV
+FIELDS = [
+    ("origin_city", "Город отправления"),
+    ("origin_code", "Код отправления"),
+    ("destination_city", "Город назначения"),
+    ("destination_code", "Код назначения"),
+    ("price_per_person", "Цена за человека (₽)"),
+    ("total_price", "Общая цена (₽)"),
+    ("departure_at", "Дата вылета"),
+    ("return_at", "Дата возвращения"),
+    ("transfers", "Пересадки"),
+    ("trip_class", "Класс перелёта"),
+    ("duration_to", "Длительность пути туда"),
+    ("duration_back", "Длительность пути обратно"),
+    ("airline", "Авиакомпания"),
+    ("link", "Ссылка"),
+]
+
+
+# Форматирование минут в ЧЧ:ММ
+def minutes_to_hhmm(minutes):
+    if not minutes or minutes <= 0:
+        return "—"
+    hours = minutes // 60
+    mins = minutes % 60
+    return f"{hours}ч {mins}м"
+
+
+def csv_date(value: Optional[str]) -> str:
+    """2025-06-10T10:00:00+03:00 -> 2025-06-10 10:00:00; пустая дата — прочерк."""
+    return value.replace("T", " ").split("+")[0] if value else "—"
+
+
+class _Memo(dict):
+    """Словарь-кэш значений func: каждый ключ считается один раз за экспорт."""
+
+    def __init__(self, func: Callable[[Any], Any]):
+        super().__init__()
+        self.func = func
+
+    def __missing__(self, key):
+        value = self[key] = self.func(key)
+        return value
+
+
+def flight_items(results: Any) -> Iterator[Dict[str, Any]]:
+    """Билеты из ответа prices_for_dates или из любого числа ответов.
+
+    Несколько маршрутов или все ячейки календаря цен передаются
+    итератором ответов; они читаются по одному.
+    """
+    if isinstance(results, dict):
+        results = (results,)
+    for response in results:
+        yield from response.get("data") or ()
+
+
+def flight_rows(items: Iterable[Dict[str, Any]], resolver, airline_names: Dict[str, str],
+                passengers: int) -> Iterator[Dict[str, Any]]:
+    """Строки экспорта по одной на билет.
+
+    Названия городов и авиакомпаний, длительности и классы берутся
+    из словарей, которые заполняются по ходу экспорта: на повторяющихся
+    кодах обращений к справочникам нет.
+    """
+    city = _Memo(resolver.city_name)
+    airline = _Memo(lambda code: airline_names.get(code, f"({code})"))
+    duration = _Memo(minutes_to_hhmm)
+    trip_class = _Memo(lambda value: CLASS_NAMES.get(value, "Неизвестный"))
+    for item in items:
+        origin = item["origin"]
+        destination = item["destination"]
+        price = item["price"]
+        yield {
+            "origin_city": city[origin],
+            "origin_code": origin,
+            "destination_city": city[destination],
+            "destination_code": destination,
+            "price_per_person": price,
+            "total_price": price * passengers,
+            "departure_at": item["departure_at"],
+            "return_at": item.get("return_at"),
+            "transfers": item.get("transfers", 0) + item.get("return_transfers", 0),
+            "trip_class": trip_class[item.get("trip_class", 0)],
+            "duration_to": duration[item.get("duration_to")],
+            "duration_back": duration[item.get("duration_back")],
+            "airline": airline[item.get("airline", "N/A")],
+            "link": BASE_LINK + item.get("link", ""),
+        }
+
+
+def write_csv(rows: Iterable[Dict[str, Any]], path: str) -> int:
+    """CSV для Excel (UTF-8 с BOM) с русскими заголовками; возвращает число строк."""
+    date = _Memo(csv_date)
+    keys = [key for key, _ in FIELDS]
+    departure, return_ = keys.index("departure_at"), keys.index("return_at")
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8-sig", buffering=1 << 20) as f:
+        writer = csv.writer(f)
+        writer.writerow([header for _, header in FIELDS])
+        for row in rows:
+            values = [row[key] for key in keys]
+            values[departure] = date[values[departure]]
+            values[return_] = date[values[return_]]
+            writer.writerow(values)
+            count += 1
+    return count
+
+
+def write_ndjson(rows: Iterable[Dict[str, Any]], path: str) -> int:
+    """Одна строка JSON на билет."""
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    count = 0
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        for row in rows:
+            f.write(encode(row))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def write_json(rows: Iterable[Dict[str, Any]], path: str) -> int:
+    """Массив JSON без отступов, записывается по мере чтения строк."""
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    count = 0
+    with open(path, "w", encoding="utf-8", buffering=1 << 20) as f:
+        f.write("[")
+        for row in rows:
+            if count:
+                f.write(",\n")
+            f.write(encode(row))
+            count += 1
+        f.write("]\n")
+    return count
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError("Для экспорта в Parquet/Arrow нужен пакет pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def arrow_schema():
+    pa = _pyarrow()
+    types = {"price_per_person": pa.int64(), "total_price": pa.int64(), "transfers": pa.int32()}
+    return pa.schema([(key, types.get(key, pa.string())) for key, _ in FIELDS])
+
+
+def arrow_batches(rows: Iterable[Dict[str, Any]], schema, batch_rows: int = EXPORT_BATCH_ROWS):
+    """RecordBatch по batch_rows строк: в памяти не больше одного пакета."""
+    pa = _pyarrow()
+    columns: Dict[str, List[Any]] = {key: [] for key in schema.names}
+    size = 0
+    for row in rows:
+        for key, values in columns.items():
+            values.append(row[key])
+        size += 1
+        if size == batch_rows:
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+            columns = {key: [] for key in schema.names}
+            size = 0
+    if size:
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def write_parquet(rows: Iterable[Dict[str, Any]], path: str, batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """Parquet: каждый пакет строк — отдельная группа строк файла."""
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema()
+    count = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for batch in arrow_batches(rows, schema, batch_rows):
+            writer.write_table(pa.Table.from_batches([batch]))
+            count += batch.num_rows
+    return count
+
+
+def write_arrow(rows: Iterable[Dict[str, Any]], path: str, batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """Файл Arrow IPC (Feather v2), читается pyarrow.feather / polars без разбора."""
+    pa = _pyarrow()
+    schema = arrow_schema()
+    count = 0
+    with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in arrow_batches(rows, schema, batch_rows):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+
+WRITERS = {
+    ".csv": write_csv,
+    ".ndjson": write_ndjson,
+    ".jsonl": write_ndjson,
+    ".json": write_json,
+    ".parquet": write_parquet,
+    ".arrow": write_arrow,
+    ".feather": write_arrow,
+}
+
+
+def export_rows(rows: Iterable[Dict[str, Any]], path: str) -> int:
+    """Пишет строки в формате по расширению файла; возвращает число строк."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"Неизвестный формат экспорта: {ext} (есть {', '.join(WRITERS)})")
+    return WRITERS[ext](rows, path)
+
+
+def export_flights(results: Any, path: str, resolver, airline_names: Dict[str, str], passengers: int) -> int:
+    """Ответ(ы) prices_for_dates в файл; строки строятся и пишутся по одной."""
+    return export_rows(flight_rows(flight_items(results), resolver, airline_names, passengers), path)
+
+
+# Сохранение в CSV
+def save_to_csv(data, resolver, airline_names, passengers, filename="aviasales_results.csv"):
+    export_flights(data, filename, resolver, airline_names, passengers)
+    print(f"\n✅ Результаты сохранены в файл {filename}")
+
+
+# Сохранение в JSON
+def save_to_json(data, resolver, airline_names, passengers, filename="aviasales_results.json"):
+    export_flights(data, filename, resolver, airline_names, passengers)
+    print(f"\n✅ Результаты сохранены в файл {filename}")
@@ -0,0 +1,78 @@
+import os
+import time
+from typing import Any, Dict, Optional
+
+import httpcore
+import httpx
+
+from cassette import cassette
+from governor import UpstreamError, governor
+from metrics import observe_upstream
+
+API_URL = os.getenv("FLIGHT_API_URL", "https://api.travelpayouts.com/aviasales/v3/prices_for_dates")
+
+# Таймауты и пул соединений к Travelpayouts
+CONNECT_TIMEOUT = float(os.getenv("FLIGHT_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("FLIGHT_READ_TIMEOUT", "15"))
+POOL_TIMEOUT = float(os.getenv("FLIGHT_POOL_TIMEOUT", "5"))
+MAX_CONNECTIONS = int(os.getenv("FLIGHT_MAX_CONNECTIONS", "50"))
+MAX_KEEPALIVE = int(os.getenv("FLIGHT_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("FLIGHT_KEEPALIVE_EXPIRY", "60"))
+
+# Общий для всех путей ограничитель запросов к Travelpayouts (FLIGHTS_RATE, FLIGHTS_COOLDOWN, ...)
+flights_governor = governor("flights", rate=20, burst=20, max_concurrency=16, target_latency=2)
+
+
+class FlightClient:
+    """Асинхронный клиент Travelpayouts на одном общем пуле соединений.
+
+    Клиент создаётся при старте приложения (start) и закрывается при
+    остановке (close). Если start не вызывали, пул создаётся при первом
+    запросе в текущем event loop.
+    """
+
+    def __init__(self, url: str = API_URL):
+        self.url = url
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        transport = httpcore.AsyncConnectionPool(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(
+            READ_TIMEOUT,
+            connect_timeout=CONNECT_TIMEOUT,
+            pool_timeout=POOL_TIMEOUT,
+        )
+        return httpx.AsyncClient(transport=transport, timeout=timeout)
+
+    async def start(self) -> None:
+        if self._client is None:
+            self._client = self._build_client()
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch_prices(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET prices_for_dates с готовыми параметрами запроса."""
+        await self.start()
+        async with flights_governor.slot():
+            started = time.perf_counter()
+            try:
+                response = await cassette.request_async(
+                    "flights", "GET", self.url, lambda: self._client.get(self.url, params=params), params=params
+                )
+            except Exception:
+                observe_upstream("flights", "error", started)
+                raise
+            observe_upstream("flights", response.status_code, started, len(response.content))
+            if response.status_code != 200:
+                raise UpstreamError(f"Ошибка API: {response.status_code}, {response.text}", response.status_code)
+            return response.json()
+
+
+flight_client = FlightClient()
@@ -0,0 +1,339 @@
+import os
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict, Iterator, AsyncIterator, Optional
+
+from deadline import DeadlineExceeded
+
+
+class ProviderUnavailable(Exception):
+    """Провайдер считается недоступным (открыт автомат), запрос не отправлялся."""
+
+    def __init__(self, provider: str, retry_after: float, reason: str = "провайдер недоступен"):
+        super().__init__(f"{provider}: {reason}, повторите через {retry_after:.0f} с")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class ProviderOverloaded(ProviderUnavailable):
+    """Очередь к провайдеру переполнена или ожидание слишком долгое."""
+
+
+class UpstreamError(Exception):
+    """Ответ провайдера с кодом ошибки."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def _health(error: Optional[BaseException]) -> Optional[bool]:
+    """Что исход запроса говорит о провайдере: True — здоров, False — нет, None — ничего."""
+    if error is None:
+        return True
+    # 4xx, кроме 429, — ошибка запроса, а не признак нездоровья провайдера
+    if isinstance(error, UpstreamError):
+        return error.status < 500 and error.status != 429
+    # Отмена и истёкший срок запроса говорят о клиенте, а не о провайдере
+    if isinstance(error, (asyncio.CancelledError, GeneratorExit, ProviderUnavailable, DeadlineExceeded)):
+        return None
+    return False
+
+
+class _Waiter:
+    __slots__ = ("future", "loop", "event", "granted")
+
+    def __init__(self, future=None, loop=None, event=None):
+        self.future = future
+        self.loop = loop
+        self.event = event
+        self.granted = False
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class ProviderGovernor:
+    """Ограничитель исходящих запросов к одному провайдеру.
+
+    Порядок для каждого запроса:
+    - автомат (circuit breaker): после failure_threshold ошибок подряд
+      запросы сразу получают ProviderUnavailable на cooldown секунд,
+      затем проходит один пробный;
+    - адаптивный лимит одновременных запросов (AIMD): растёт на 1/limit
+      после быстрого успешного ответа, уменьшается при медленных ответах
+      (дольше target_latency) и вдвое при ошибках и 429;
+    - общая очередь FIFO к лимиту, не длиннее max_queue и не дольше
+      max_wait, — лишнее отклоняется с ProviderOverloaded;
+    - token bucket: не больше rate запросов в секунду, всплеск до burst.
+
+    Работает и из event loop (slot), и из потоков asyncio.to_thread (sync_slot).
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_concurrency: int,
+                 min_concurrency: int = 1, target_latency: float = 5.0,
+                 failure_threshold: int = 5, cooldown: float = 30.0,
+                 max_queue: int = 200, max_wait: float = 15.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.target_latency = target_latency
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self.limit = float(max(min_concurrency, max_concurrency // 2))
+        self.in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self.throttle_seconds = 0.0
+
+    # --- автомат ---
+
+    def _admit(self) -> bool:
+        """Пропускает запрос через автомат; True — это пробный запрос."""
+        if self.state == "closed":
+            return False
+        retry_after = self._opened_at + self.cooldown - time.monotonic()
+        if self.state == "open" and retry_after <= 0:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        self.rejected += 1
+        raise ProviderUnavailable(self.name, max(retry_after, 1.0))
+
+    def _release_probe(self) -> None:
+        with self._lock:
+            self._probing = False
+
+    def _record(self, latency: float, error: Optional[BaseException], probe: bool) -> None:
+        healthy = _health(error)
+        with self._lock:
+            if probe:
+                self._probing = False
+            if healthy is None:
+                return
+            if not healthy:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+                if probe or self.consecutive_failures >= self.failure_threshold:
+                    self.state = "open"
+                    self._opened_at = time.monotonic()
+                return
+            self.consecutive_failures = 0
+            if probe:
+                self.state = "closed"
+            if error is not None:
+                return
+            if latency <= self.target_latency:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            else:
+                self.limit = max(self.min_concurrency, self.limit * 0.9)
+
+    # --- очередь к лимиту ---
+
+    def _try_enter(self, waiter: Optional[_Waiter]) -> bool:
+        """Под замком: занять слот сразу или встать в очередь."""
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.overloaded += 1
+            raise ProviderOverloaded(self.name, self.max_wait, "очередь переполнена")
+        self._waiters.append(waiter)
+        return False
+
+    def _leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._grant()
+
+    def _grant(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self.in_flight += 1
+            waiter.wake()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Ожидание прервано: убрать из очереди или вернуть уже выданный слот."""
+        with self._lock:
+            if waiter.granted:
+                self.in_flight -= 1
+                self._grant()
+            else:
+                self._waiters.remove(waiter)
+
+    def _reserve_token(self) -> float:
+        """Под замком: резервирует токен, возвращает сколько ждать."""
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        self.throttle_seconds += wait
+        return wait
+
+    def _overloaded(self) -> ProviderOverloaded:
+        self.overloaded += 1
+        return ProviderOverloaded(self.name, self.max_wait, "слишком долгое ожидание в очереди")
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Один запрос к провайдеру из event loop."""
+        with self._lock:
+            probe = self._admit()
+            self.requests += 1
+            waiter = _Waiter(future=asyncio.get_running_loop().create_future(),
+                             loop=asyncio.get_running_loop())
+            try:
+                entered = self._try_enter(waiter)
+            except ProviderOverloaded:
+                if probe:
+                    self._probing = False
+                raise
+        if not entered:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+                if probe:
+                    self._release_probe()
+                raise self._overloaded()
+            except BaseException:
+                self._abandon(waiter)
+                if probe:
+                    self._release_probe()
+                raise
+        try:
+            try:
+                with self._lock:
+                    wait = self._reserve_token()
+                if wait:
+                    await asyncio.sleep(wait)
+            except BaseException:
+                # Прерванное ожидание токена — не исход пробного запроса: пробу отпускаем
+                if probe:
+                    self._release_probe()
+                raise
+            start = time.perf_counter()
+            try:
+                yield
+            except BaseException as e:
+                self._record(time.perf_counter() - start, e, probe)
+                raise
+            self._record(time.perf_counter() - start, None, probe)
+        finally:
+            self._leave()
+
+    @contextmanager
+    def sync_slot(self) -> Iterator[None]:
+        """Один запрос к провайдеру из рабочего потока."""
+        with self._lock:
+            probe = self._admit()
+            self.requests += 1
+            waiter = _Waiter(event=threading.Event())
+            try:
+                entered = self._try_enter(waiter)
+            except ProviderOverloaded:
+                if probe:
+                    self._probing = False
+                raise
+        if not entered and not waiter.event.wait(self.max_wait):
+            self._abandon(waiter)
+            if probe:
+                self._release_probe()
+            raise self._overloaded()
+        try:
+            try:
+                with self._lock:
+                    wait = self._reserve_token()
+                if wait:
+                    time.sleep(wait)
+            except BaseException:
+                # Прерванное ожидание токена — не исход пробного запроса: пробу отпускаем
+                if probe:
+                    self._release_probe()
+                raise
+            start = time.perf_counter()
+            try:
+                yield
+            except BaseException as e:
+                self._record(time.perf_counter() - start, e, probe)
+                raise
+            self._record(time.perf_counter() - start, None, probe)
+        finally:
+            self._leave()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "rate": self.rate,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected,
+            "overloaded": self.overloaded,
+            "throttle_seconds": round(self.throttle_seconds, 3),
+        }
+
+
+GOVERNORS: Dict[str, ProviderGovernor] = {}
+
+
+def _setting(provider: str, name: str, default: float) -> float:
+    return float(os.getenv(f"{provider.upper()}_{name}", str(default)))
+
+
+def governor(provider: str, rate: float, burst: float, max_concurrency: int,
+             target_latency: float) -> ProviderGovernor:
+    """Ограничитель провайдера; значения по умолчанию переопределяются
+    переменными <PROVIDER>_RATE, _BURST, _MAX_CONCURRENCY, _TARGET_LATENCY,
+    _FAILURE_THRESHOLD, _COOLDOWN, _MAX_QUEUE, _MAX_WAIT."""
+    if provider not in GOVERNORS:
+        GOVERNORS[provider] = ProviderGovernor(
+            provider,
+            rate=_setting(provider, "RATE", rate),
+            burst=_setting(provider, "BURST", burst),
+            max_concurrency=int(_setting(provider, "MAX_CONCURRENCY", max_concurrency)),
+            target_latency=_setting(provider, "TARGET_LATENCY", target_latency),
+            failure_threshold=int(_setting(provider, "FAILURE_THRESHOLD", 5)),
+            cooldown=_setting(provider, "COOLDOWN", 30),
+            max_queue=int(_setting(provider, "MAX_QUEUE", 200)),
+            max_wait=_setting(provider, "MAX_WAIT", 15),
+        )
+    return GOVERNORS[provider]
+
+
+def governor_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: g.stats() for name, g in GOVERNORS.items()}
@@ -0,0 +1,229 @@
+import os
+import sys
+import time
+import pickle
+import tempfile
+from typing import Any, Callable, Dict, List, Optional
+
+from cache import TTLCache
+from cache_store import open_store, renewing, wait_for_lease
+from singleflight import SingleFlight
+from reference_data import DATA_DIR, deep_sizeof
+from hotel_index import HotelIndex
+
+# Каталоги отелей статичны: храним их на диске и в памяти
+CATALOG_DIR = os.getenv("HOTEL_CATALOG_DIR", os.path.join(DATA_DIR, "data_cache", "hotels"))
+CATALOG_TTL = float(os.getenv("HOTEL_CATALOG_TTL", str(7 * 24 * 3600)))
+CATALOG_MEMORY_ENTRIES = int(os.getenv("HOTEL_CATALOG_MEMORY_ENTRIES", "50"))
+# Предел по объёму разобранных каталогов в памяти вместе с индексами, а не по размеру файлов
+CATALOG_MEMORY_BYTES = int(os.getenv("HOTEL_CATALOG_MEMORY_BYTES", str(256 * 1024 * 1024)))
+# Сколько записей каталога обходить, оценивая его объём в памяти
+SIZEOF_SAMPLE = 500
+
+# Версия формата файла; при изменении compact_hotel старые файлы игнорируются
+FORMAT_VERSION = 1
+
+
+def compact_hotel(hotel: Dict[str, Any]) -> Dict[str, Any]:
+    """Оставляет из записи static/hotels.json только нужные поля."""
+    return {
+        "id": hotel.get("id"),
+        "name": (hotel.get("name") or {}).get("en", "Unknown"),
+        "rating": hotel.get("rating") or 0,
+        "stars": hotel.get("stars") or 0,
+        "pricefrom": hotel.get("pricefrom"),
+        "address": (hotel.get("address") or {}).get("en", ""),
+        "link": hotel.get("link"),
+        "photos": [p.get("url") for p in hotel.get("photos") or [] if p.get("url")],
+    }
+
+
+class HotelCatalog:
+    """Каталог отелей одной локации Hotellook в компактном виде."""
+
+    def __init__(self, location_id: int, hotels: List[Dict[str, Any]],
+                 fetched_at: float, size_bytes: int = 0):
+        self.location_id = location_id
+        self.hotels = hotels
+        self.fetched_at = fetched_at
+        self.size_bytes = size_bytes
+        self._index: Optional[HotelIndex] = None
+
+    @property
+    def index(self) -> HotelIndex:
+        """Индекс для фильтрации; строится один раз на загруженный каталог."""
+        if self._index is None:
+            self._index = HotelIndex(self.hotels)
+        return self._index
+
+    def resident_bytes(self) -> int:
+        """Объём каталога в памяти: записи отелей и индекс, построенный или будущий.
+
+        Файл pickle в разы меньше разобранных словарей, поэтому size_bytes
+        для предела памяти не годится.
+        """
+        count = len(self.hotels)
+        index = self._index.nbytes if self._index is not None else HotelIndex.estimated_nbytes(count)
+        # Записи однотипные: полный обход больших каталогов занимает сотни мс, хватает выборки
+        step = max(1, count // SIZEOF_SAMPLE)
+        sample = self.hotels[::step]
+        records = deep_sizeof(sample) - sys.getsizeof(sample)
+        return sys.getsizeof(self.hotels) + records * count // max(1, len(sample)) + index
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def is_expired(self, ttl: float = CATALOG_TTL) -> bool:
+        return self.age() >= ttl
+
+
+class HotelCatalogStore:
+    """Дисковое хранилище каталогов по locationId с LRU в памяти.
+
+    Файлы пишутся атомарно (временный файл + os.replace). Просроченный
+    каталог перекачивается; если сеть недоступна, отдаётся старая копия.
+    Каталог общий для всех воркеров через диск, поэтому в памяти он
+    держится в каждом процессе свой, а скачивает его один процесс
+    (аренда в общем хранилище при CACHE_BACKEND=sqlite).
+    """
+
+    def __init__(self, directory: str = CATALOG_DIR, ttl: float = CATALOG_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self.memory = TTLCache(
+            "hotel_catalogs",
+            ttl=ttl,
+            max_entries=CATALOG_MEMORY_ENTRIES,
+            max_bytes=CATALOG_MEMORY_BYTES,
+            sizeof=lambda catalog: catalog.resident_bytes(),
+            # Разобранный каталог с индексом не перекладываем через SQLite: файл уже общий
+            backend="memory",
+        )
+        # Только аренды скачиваний; записи каталогов хранятся на диске
+        self.leases = open_store("hotel_catalogs", max_entries=0, max_bytes=0)
+        self.calls = SingleFlight("hotel_catalogs")
+        self.disk_hits = 0
+        self.downloads = 0
+
+    def _path(self, location_id: int) -> str:
+        return os.path.join(self.directory, f"{int(location_id)}.v{FORMAT_VERSION}.pickle")
+
+    def load(self, location_id: int) -> Optional[HotelCatalog]:
+        try:
+            with open(self._path(location_id), "rb") as f:
+                blob = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            fetched_at, hotels = pickle.loads(blob)
+        except Exception as e:
+            print(f"Повреждён файл каталога {location_id}: {e}")
+            return None
+        return HotelCatalog(location_id, hotels, fetched_at, len(blob))
+
+    def save(self, catalog: HotelCatalog) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        blob = pickle.dumps((catalog.fetched_at, catalog.hotels), protocol=pickle.HIGHEST_PROTOCOL)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, self._path(catalog.location_id))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        catalog.size_bytes = len(blob)
+
+    def get(self, location_id: int,
+            fetch: Callable[[int], List[Dict[str, Any]]]) -> HotelCatalog:
+        """Каталог из памяти, с диска или через fetch(location_id)."""
+        catalog = self.memory.get(location_id)
+        if catalog is not None and not catalog.is_expired(self.ttl):
+            return catalog
+
+        # Одновременные запросы одного города читают диск и скачивают каталог один раз
+        return self.calls.do_sync(location_id, lambda: self._load_or_download(location_id, fetch))
+
+    def cached(self, location_id: int) -> Optional[HotelCatalog]:
+        """Каталог из памяти или с диска без скачивания, даже просроченный."""
+        catalog = self.memory.peek(location_id)
+        return catalog if catalog is not None else self.load(location_id)
+
+    def _load_or_download(self, location_id: int,
+                          fetch: Callable[[int], List[Dict[str, Any]]]) -> HotelCatalog:
+        stored = self.load(location_id)
+        if stored is not None and not stored.is_expired(self.ttl):
+            self.disk_hits += 1
+            self.memory.set(location_id, stored)
+            return stored
+
+        try:
+            return self._download(location_id, fetch)
+        except Exception:
+            if stored is None:
+                raise
+            print(f"Не удалось обновить каталог {location_id}, используем сохранённый")
+            self.memory.set(location_id, stored)
+            return stored
+
+    def _download(self, location_id: int, fetch: Callable[[int], List[Dict[str, Any]]],
+                  prefetched: bool = False) -> HotelCatalog:
+        # Тот же каталог может качать другой воркер: ждём его файл вместо второго запроса
+        since = time.time()
+        acquired, catalog = wait_for_lease(self.leases, location_id, lambda: self._saved_since(location_id, since))
+        try:
+            if catalog is None and self.leases.shared:
+                # Другой воркер мог успеть сохранить каталог до того, как мы взяли аренду
+                catalog = self._saved_since(location_id, 0)
+            if catalog is not None:
+                self.disk_hits += 1
+            else:
+                with renewing(self.leases, location_id):
+                    hotels = [compact_hotel(h) for h in fetch(location_id)]
+                    self.downloads += 1
+                    catalog = HotelCatalog(location_id, hotels, time.time())
+                    self.save(catalog)
+        finally:
+            if acquired:
+                self.leases.release(location_id)
+        self.memory.set(location_id, catalog, prefetched)
+        return catalog
+
+    def _saved_since(self, location_id: int, since: float) -> Optional[HotelCatalog]:
+        """Свежий каталог с диска, если файл записан после since; иначе None."""
+        try:
+            if os.path.getmtime(self._path(location_id)) < since:
+                return None
+        except FileNotFoundError:
+            return None
+        catalog = self.load(location_id)
+        return catalog if catalog is not None and not catalog.is_expired(self.ttl) else None
+
+    def warm(self, location_id: int, fetch: Callable[[int], List[Dict[str, Any]]], ahead: float) -> int:
+        """Для фонового prefetch: каталог в памяти и не устареет ещё ahead секунд.
+
+        Возвращает число скачиваний (0 — хватило копии с диска или из памяти).
+        """
+        catalog = self.cached(location_id)
+        if catalog is not None and catalog.age() < self.ttl - ahead:
+            if self.memory.peek(location_id) is None:
+                self.memory.set(location_id, catalog, prefetched=True)
+            return 0
+        self.calls.do_sync(location_id, lambda: self._download(location_id, fetch, prefetched=True))
+        return 1
+
+    def ttl_left(self, location_id: int) -> Optional[float]:
+        """Сколько секунд каталог в памяти ещё свежий; None — в памяти его нет."""
+        catalog = self.memory.peek(location_id)
+        return self.ttl - catalog.age() if catalog is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "disk_hits": self.disk_hits,
+            "downloads": self.downloads,
+            "memory": self.memory.stats(),
+        }
+
+
+catalog_store = HotelCatalogStore()
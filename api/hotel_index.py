@@ -0,0 +1,70 @@
+import sys
+from typing import Any, Dict, List
+
+import numpy as np
+
+# Допустимые ключи сортировки результатов find_hotels
+SORT_KEYS = ("rating", "price", "stars")
+
+
+class HotelIndex:
+    """Колоночный индекс каталога отелей для фильтрации по бюджету.
+
+    Строится один раз на каталог: записи упорядочены по убыванию рейтинга
+    (устойчиво, как sorted(..., reverse=True)), столбцы rating, stars,
+    pricefrom и id лежат в массивах NumPy. Для остальных ключей сортировки
+    заранее посчитаны перестановки.
+    """
+
+    def __init__(self, hotels: List[Dict[str, Any]]):
+        rating = np.fromiter((h["rating"] for h in hotels), dtype=np.float64, count=len(hotels))
+        by_rating = np.argsort(-rating, kind="stable")
+
+        self.hotels = [hotels[i] for i in by_rating]
+        self.rating = rating[by_rating]
+        self.stars = np.fromiter((h["stars"] for h in self.hotels), dtype=np.float64, count=len(hotels))
+        self.pricefrom = np.fromiter(
+            (np.nan if h["pricefrom"] is None else h["pricefrom"] for h in self.hotels),
+            dtype=np.float64, count=len(hotels)
+        )
+        self.ids = np.fromiter((h["id"] or 0 for h in self.hotels), dtype=np.int64, count=len(hotels))
+
+        # NaN-цены при сортировке по цене уходят в конец
+        self._orders = {
+            "rating": np.arange(len(self.hotels)),
+            "price": np.argsort(self.pricefrom, kind="stable"),
+            "stars": np.argsort(-self.stars, kind="stable"),
+        }
+
+    def __len__(self) -> int:
+        return len(self.hotels)
+
+    @staticmethod
+    def estimated_nbytes(count: int) -> int:
+        """Объём индекса на count отелей до его построения: 4 столбца,
+        3 перестановки по 8 байт на отель и список ссылок на записи."""
+        return count * (7 * 8 + 8)
+
+    @property
+    def nbytes(self) -> int:
+        """Объём массивов индекса и списка ссылок; сами записи отелей общие с каталогом."""
+        arrays = (self.rating, self.stars, self.pricefrom, self.ids, *self._orders.values())
+        return sum(a.nbytes for a in arrays) + sys.getsizeof(self.hotels)
+
+    def select(self, max_total_price: float, nights: int, adults: int,
+               max_results: int = 10, sort_by: str = "rating") -> List[int]:
+        """Позиции отелей, укладывающихся в бюджет, в порядке sort_by.
+
+        Стоимость считается так же, как в find_hotels:
+        pricefrom * nights * adults * 100.
+        """
+        if sort_by not in self._orders:
+            raise ValueError(f"Неизвестный ключ сортировки: {sort_by}")
+        total = self.pricefrom * nights * adults * 100
+        # NaN <= x даёт False, отели без цены отбрасываются
+        affordable = total <= max_total_price
+        order = self._orders[sort_by]
+        return order[affordable[order]][:max_results].tolist()
+
+    def total_price(self, position: int, nights: int, adults: int) -> float:
+        return (self.hotels[position]["pricefrom"] * nights * adults) * 100
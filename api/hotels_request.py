@@ -1,45 +1,109 @@
 import os
 import re
+import time
 import requests
 import json
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from googletrans import Translator
 from dotenv import load_dotenv
+from hotel_catalog import HotelCatalog, catalog_store
+from city_lookup import city_locations
+from metrics import observe_upstream, timed
+from cassette import cassette
+from governor import UpstreamError, governor
+from deadline import DeadlineExceeded, timeout_for
 
 # Загружаем переменные из .env
 load_dotenv()
 API_TOKEN = os.getenv('HOTEL_TOKEN')
+HOTELLOOK_URL = os.getenv('HOTELLOOK_URL', "https://engine.hotellook.com/api/v2")
+HOTELLOOK_TIMEOUT = float(os.getenv('HOTELLOOK_TIMEOUT', "30"))
 
+_session = requests.Session()
 
-def translate_to_en(text: str) -> str:
-    """Переводим текст на английский (синхронно)."""
-    translator = Translator()
-    translated = translator.translate(text, src='auto', dest='en')
-    return translated.text
+# Ограничители запросов к Hotellook (HOTELLOOK_RATE, ...) и к переводчику (TRANSLATE_RATE, ...)
+hotellook_governor = governor("hotellook", rate=10, burst=10, max_concurrency=8, target_latency=5)
+translate_governor = governor("translate", rate=5, burst=5, max_concurrency=4, target_latency=3)
 
 
-def find_city_id(city_name: str) -> Optional[int]:
-    """Ищем ID города по названию без сохранения на диск."""
-    en_name = translate_to_en(city_name)
-    url = (
-        f"https://engine.hotellook.com/api/v2/lookup.json"
-        f"?query={en_name}&lang=en&lookFor=city&limit=1&token={API_TOKEN}"
+_translator: Optional[Translator] = None
+
+
+@timed("translate_to_en")
+def translate_to_en(text: str) -> str:
+    """Переводим текст на английский (синхронно)."""
+    if text.isascii():
+        return text
+
+    def translate() -> str:
+        global _translator
+        if _translator is None:
+            _translator = Translator()
+        return _translator.translate(text, src='auto', dest='en').text
+
+    with translate_governor.sync_slot():
+        return cassette.call("translate", text, translate)
+
+
+def _get(provider: str, url: str, **kwargs) -> requests.Response:
+    """GET к Hotellook с записью кода ответа, времени и размера в метрики.
+
+    Ответ с кодом ошибки — UpstreamError. Таймаут не больше остатка
+    срока запроса; если сработал именно он — DeadlineExceeded."""
+    default = kwargs.pop("timeout", HOTELLOOK_TIMEOUT)
+    timeout = timeout_for(default)
+    with hotellook_governor.sync_slot():
+        started = time.perf_counter()
+        try:
+            resp = cassette.request(provider, "GET", url, lambda: _session.get(url, timeout=timeout, **kwargs),
+                                    params=kwargs.get("params"))
+        except requests.Timeout as e:
+            observe_upstream(provider, "error", started)
+            if timeout < default:
+                raise DeadlineExceeded(f"Hotellook не ответил до срока запроса ({timeout:.1f} с)") from e
+            raise
+        except Exception:
+            observe_upstream(provider, "error", started)
+            raise
+        observe_upstream(provider, resp.status_code, started, len(resp.content))
+        if resp.status_code >= 400:
+            raise UpstreamError(f"Hotellook: HTTP {resp.status_code}: {resp.text[:200]}", resp.status_code)
+    return resp
+
+
+@timed("lookup_city_id")
+def lookup_city_id(en_name: str) -> Optional[int]:
+    """Запрашиваем ID города в Hotellook по английскому названию."""
+    resp = _get(
+        "hotellook_lookup",
+        f"{HOTELLOOK_URL}/lookup.json",
+        params={"query": en_name, "lang": "en", "lookFor": "city", "limit": 1, "token": API_TOKEN},
+        timeout=10
     )
-    resp = requests.get(url, timeout=10)
-    resp.raise_for_status()
     locations = resp.json().get("results", {}).get("locations", [])
     return locations[0].get("id") if locations else None
 
 
+@timed("find_city_id")
+def find_city_id(city_name: str) -> Optional[int]:
+    """Ищем ID города по названию через сохраняемую таблицу локаций."""
+    return city_locations.resolve(city_name, translate_to_en, lookup_city_id)
+
+
+@timed("fetch_hotels_for_city")
 def fetch_hotels_for_city(city_id: int) -> List[Dict[str, Any]]:
     """Загружает список всех отелей для данного city_id."""
-    url = f"https://engine.hotellook.com/api/v2/static/hotels.json?locationId={city_id}&token={API_TOKEN}"
-    resp = requests.get(url)
-    resp.raise_for_status()
+    url = f"{HOTELLOOK_URL}/static/hotels.json?locationId={city_id}&token={API_TOKEN}"
+    resp = _get("hotellook_hotels", url)
     return resp.json().get("hotels", [])
 
 
+def get_hotel_catalog(city_id: int) -> HotelCatalog:
+    """Компактный каталог отелей из памяти/диска, при необходимости скачивает."""
+    return catalog_store.get(city_id, fetch_hotels_for_city)
+
+
 def calculate_nights(check_in: str, check_out: str) -> int:
     """Количество ночей между датами."""
     date_in = datetime.strptime(check_in, '%Y-%m-%d')
@@ -58,47 +122,96 @@ def get_hotel_url(link: Optional[str]) -> Optional[str]:
     return f"https://hotellook.com/hotels/hotel-{match.group(1)}" if match else None
 
 
-def find_hotels(
-    city: str,
+def hotel_to_result(hotel: Dict[str, Any], total_price: float) -> Dict[str, Any]:
+    """Карточка отеля для ответа API."""
+    photos = hotel['photos']
+    return {
+        "id":         hotel['id'],
+        "name":       hotel['name'],
+        "rating":     hotel['rating'],
+        "stars":      hotel['stars'],
+        "total_price":total_price,
+        "per_night":  hotel['pricefrom'],
+        "address":    hotel['address'],
+        "url":        get_hotel_url(hotel['link']),
+        "main_photo": photos[0] if photos else None,
+        "photos":     photos
+    }
+
+
+def load_city_catalog(city: str) -> HotelCatalog:
+    """Каталог отелей города: от названия до загруженного индекса."""
+    city_id = find_city_id(city)
+    if city_id is None:
+        raise RuntimeError(f"Город '{city}' не найден")
+    return get_hotel_catalog(city_id)
+
+
+def _lookup_calls(city: str) -> int:
+    """Сколько запросов нужно, чтобы узнать locationId: перевод и lookup, если их нет в таблице."""
+    return 0 if city_locations.known_id(city) is not None else 1 + (not city.isascii())
+
+
+def city_catalog_cost(city: str) -> int:
+    """Сколько запросов к API может сделать warm_city_catalog: locationId и скачивание каталога."""
+    return _lookup_calls(city) + 1
+
+
+def warm_city_catalog(city: str, ahead: float) -> int:
+    """Прогревает locationId города и его каталог; возвращает число запросов к API."""
+    calls = _lookup_calls(city)
+    city_id = find_city_id(city)
+    if city_id is None:
+        return calls
+    return calls + catalog_store.warm(city_id, fetch_hotels_for_city, ahead)
+
+
+def city_catalog_ttl_left(city: str) -> Optional[float]:
+    city_id = city_locations.known_id(city)
+    return catalog_store.ttl_left(city_id) if city_id is not None else None
+
+
+def cached_city_catalog(city: str) -> Optional[HotelCatalog]:
+    """Сохранённый каталог города без обращений к сети или None."""
+    city_id = city_locations.known_id(city)
+    return catalog_store.cached(city_id) if city_id is not None else None
+
+
+def filter_hotels(
+    catalog: HotelCatalog,
     max_total_price: float,
     check_in: str,
     check_out: str,
     adults: int,
-    max_results: int = 10
+    max_results: int = 10,
+    sort_by: str = "rating"
 ) -> List[Dict[str, Any]]:
-    """Ищем и фильтруем отели по заданным критериям."""
-    city_id = find_city_id(city)
-    if city_id is None:
-        raise RuntimeError(f"Город '{city}' не найден")
+    """Фильтруем каталог по бюджету и датам.
 
-    all_hotels = fetch_hotels_for_city(city_id)
+    sort_by: "rating" (по убыванию), "price" (по возрастанию) или "stars".
+    """
+    index = catalog.index
     nights = calculate_nights(check_in, check_out)
 
-    filtered: List[Dict[str, Any]] = []
-    for hotel in sorted(all_hotels, key=lambda x: x.get("rating", 0), reverse=True):
-        if len(filtered) >= max_results:
-            break
-
-        price_per_night = hotel.get('pricefrom')
-        if price_per_night is None:
-            continue
-
-        total_price = (price_per_night * nights * adults)*100
-        if total_price <= max_total_price:
-            photos = [p.get('url') for p in hotel.get('photos', []) if p.get('url')]
-            filtered.append({
-                "id":         hotel.get('id'),
-                "name":       hotel.get('name', {}).get('en', 'Unknown'),
-                "rating":     hotel.get('rating', 0),
-                "stars":      hotel.get('stars', 0),
-                "total_price":total_price,
-                "per_night":  price_per_night,
-                "address":    hotel.get('address', {}).get('en', ''),
-                "url":        get_hotel_url(hotel.get('link')),
-                "main_photo": photos[0] if photos else None,
-                "photos":     photos
-            })
-    return filtered
+    positions = index.select(max_total_price, nights, adults, max_results, sort_by)
+    return [
+        hotel_to_result(index.hotels[i], index.total_price(i, nights, adults))
+        for i in positions
+    ]
+
+
+def find_hotels(
+    city: str,
+    max_total_price: float,
+    check_in: str,
+    check_out: str,
+    adults: int,
+    max_results: int = 10,
+    sort_by: str = "rating"
+) -> List[Dict[str, Any]]:
+    """Ищем и фильтруем отели по заданным критериям."""
+    catalog = load_city_catalog(city)
+    return filter_hotels(catalog, max_total_price, check_in, check_out, adults, max_results, sort_by)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,233 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+from deadline import DeadlineExceeded
+from governor import ProviderUnavailable
+
+# Сколько задач /recommend выполняется одновременно
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "16"))
+# Сколько задач может ждать в очереди; сверх этого POST /jobs отвечает 503
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "200"))
+# Сколько хранится результат завершённой задачи
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))
+# Самое долгое ожидание результата в одном запросе (long-poll)
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueueFull(Exception):
+    """Очередь задач заполнена; повторить через retry_after секунд."""
+
+    def __init__(self, size: int, retry_after: float):
+        super().__init__(f"Очередь задач заполнена ({size}), повторите позже")
+        self.retry_after = retry_after
+
+
+class Job:
+    __slots__ = ("id", "request", "seq", "status", "created_at", "started_at", "finished_at",
+                 "result", "error", "sections", "changed", "done")
+
+    def __init__(self, request, seq: int):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.seq = seq
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        # Ошибка в виде ответа API: {"status": ..., "detail": ...}
+        self.error: Optional[Dict[str, Any]] = None
+        # Готовые секции ответа до завершения задачи: секция -> Markdown
+        self.sections: Dict[str, str] = {}
+        # Срабатывает при новой секции и при завершении; после срабатывания заменяется новым
+        self.changed = asyncio.Event()
+        self.done = asyncio.Event()
+
+    def report(self, section: str, markdown: str) -> None:
+        self.sections[section] = markdown
+        self.notify()
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+class JobQueue:
+    """Очередь задач с пулом из workers исполнителей.
+
+    submit ставит задачу в очередь и сразу возвращает её; исполнители
+    берут задачи по порядку и вызывают run(request, job.report): через
+    report задача публикует готовые секции ответа, пока выполняется.
+    Результат или ошибка хранятся ttl секунд после завершения, клиент
+    забирает их опросом или ждёт через wait (long-poll). Срок запроса
+    отсчитывается с начала выполнения задачи, а не с постановки в очередь.
+    """
+
+    def __init__(self, run: Callable[[Any, Callable[[str, str], None]], Awaitable[Any]], workers: int = JOB_WORKERS,
+                 max_queued: int = JOB_QUEUE_SIZE, ttl: float = JOB_RESULT_TTL):
+        self.run = run
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.jobs: Dict[str, Job] = {}
+        # Завершённые задачи в порядке завершения: устаревшие удаляются с начала
+        self._finished: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._submitted_seq = 0
+        self._taken_seq = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.busy_time = 0.0
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def retry_after(self) -> float:
+        """Оценка, через сколько освободится место: средняя длительность задачи на очередь."""
+        mean = self.busy_time / (self.completed + self.failed) if self.completed + self.failed else 5.0
+        return max(1.0, mean * self._queue.qsize() / self.workers)
+
+    def submit(self, request) -> Job:
+        self._purge()
+        job = Job(request, self._submitted_seq + 1)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise JobQueueFull(self.max_queued, self.retry_after()) from None
+        self._submitted_seq = job.seq
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge()
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float, seen: Optional[int] = None) -> Optional[Job]:
+        """Задача после завершения или через timeout секунд, что раньше; None — нет такой.
+
+        seen — сколько секций клиент уже получил: тогда ожидание
+        заканчивается и на новой готовой секции.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        loop = asyncio.get_running_loop()
+        stop_at = loop.time() + timeout
+        while not job.finished and (seen is None or len(job.sections) <= seen):
+            changed = job.changed
+            left = stop_at - loop.time()
+            if left <= 0:
+                break
+            try:
+                await asyncio.wait_for(changed.wait(), left)
+            except asyncio.TimeoutError:
+                break
+        return job
+
+    def position(self, job: Job) -> int:
+        """Место в очереди, 1 — следующая; 0 — задача уже выполняется или готова."""
+        return max(0, job.seq - self._taken_seq) if job.status == QUEUED else 0
+
+    def describe(self, job: Job) -> Dict[str, Any]:
+        info = {
+            "job_id": job.id,
+            "status": job.status,
+            "created_at": round(job.created_at, 3),
+            "started_at": job.started_at and round(job.started_at, 3),
+            "finished_at": job.finished_at and round(job.finished_at, 3),
+        }
+        if job.status == QUEUED:
+            info["position"] = self.position(job)
+        if job.sections and not job.finished:
+            info["sections"] = dict(job.sections)
+        if job.error is not None:
+            info["error"] = job.error
+        return info
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self._taken_seq = job.seq
+            job.status = RUNNING
+            job.started_at = time.time()
+            self.running += 1
+            try:
+                # Отдельная задача — отдельный контекст: срок и лимиты не переходят между задачами
+                job.result = await asyncio.create_task(self.run(job.request, job.report))
+                job.status = DONE
+                self.completed += 1
+            except asyncio.CancelledError:
+                job.error = {"status": 503, "detail": "Сервер останавливается, задача не выполнена"}
+                job.status = FAILED
+                raise
+            except HTTPException as e:
+                job.error = {"status": e.status_code, "detail": e.detail}
+            except ProviderUnavailable as e:
+                job.error = {"status": 503, "detail": str(e), "retry_after": int(e.retry_after + 0.5)}
+            except DeadlineExceeded as e:
+                job.error = {"status": 504, "detail": f"Не успели подготовить ответ: {e}"}
+            except Exception as e:
+                job.error = {"status": 500, "detail": str(e)}
+            finally:
+                if job.error is not None:
+                    job.status = FAILED
+                    self.failed += 1
+                job.request = None
+                job.sections = {}
+                job.finished_at = time.time()
+                self.busy_time += job.finished_at - job.started_at
+                self.running -= 1
+                self._finished[job.id] = job
+                job.done.set()
+                job.notify()
+                self._queue.task_done()
+
+    def _purge(self) -> None:
+        expired_before = time.time() - self.ttl
+        while self._finished:
+            job_id, job = next(iter(self._finished.items()))
+            if job.finished_at >= expired_before:
+                break
+            del self._finished[job_id]
+            self.jobs.pop(job_id, None)
+            self.expired += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.max_queued,
+            "running": self.running,
+            "stored": len(self.jobs),
+            "submitted": self._submitted_seq,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "mean_duration": round(self.busy_time / (self.completed + self.failed), 3)
+            if self.completed + self.failed else None,
+        }
@@ -0,0 +1,59 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Optional
+
+# Лимиты одновременных обращений к провайдерам по умолчанию для пакетных запросов
+DEFAULT_PROVIDER_LIMITS = {
+    "flights": int(os.getenv("BATCH_FLIGHTS_CONCURRENCY", "8")),
+    "hotels": int(os.getenv("BATCH_HOTELS_CONCURRENCY", "4")),
+    "llm": int(os.getenv("BATCH_LLM_CONCURRENCY", "4")),
+}
+
+# Семафоры текущей области (например, одного пакета); задачи наследуют их через контекст
+_slots: ContextVar[Optional[Dict[str, asyncio.Semaphore]]] = ContextVar("provider_slots", default=None)
+
+
+def use_provider_limits(limits: Dict[str, int]) -> None:
+    """Ограничивает обращения к провайдерам в текущем контексте и его задачах."""
+    merged = {**DEFAULT_PROVIDER_LIMITS, **limits}
+    _slots.set({name: asyncio.Semaphore(max(1, n)) for name, n in merged.items()})
+
+
+@asynccontextmanager
+async def provider_slot(provider: str) -> AsyncIterator[None]:
+    """Занимает слот провайдера, если в контексте заданы лимиты."""
+    slots = _slots.get()
+    semaphore = slots.get(provider) if slots else None
+    if semaphore is None:
+        yield
+        return
+    async with semaphore:
+        yield
+
+
+class RateLimiter:
+    """Token bucket: не больше rate запросов в секунду, всплеск до burst."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # Под замком ждёт только первый в очереди, остальные встают за ним по порядку
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
@@ -0,0 +1,244 @@
+import os
+import json
+import codecs
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpcore
+import httpx
+from httpcore._async.base import ConnectionState
+from dotenv import load_dotenv
+
+from cassette import cassette
+from deadline import DeadlineExceeded, timeout_for
+from governor import UpstreamError, governor
+from metrics import observe_upstream
+from singleflight import SingleFlight
+
+load_dotenv()
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+MODEL_NAME = "deepseek/deepseek-prover-v2:free"
+
+# Пул соединений и таймауты к OpenRouter
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+HTTP_TIMEOUTS = (httpx.ConnectTimeout, httpx.ReadTimeout, httpx.WriteTimeout, httpx.PoolTimeout)
+
+# Ограничитель запросов к OpenRouter (LLM_RATE, LLM_COOLDOWN, ...)
+llm_governor = governor("llm", rate=5, burst=10, max_concurrency=8, target_latency=20)
+
+HEADERS = {
+    "HTTP-Referer": "https://your-travel-app.com",
+    "X-Title": "Travel AI"
+}
+
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """Поля data из потока SSE; поток всегда декодируется как UTF-8."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in response.aiter_bytes():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            # Строки-комментарии (": OPENROUTER PROCESSING") и пустые пропускаем
+            if line.startswith("data:"):
+                yield line[len("data:"):].strip()
+
+
+def _check_status(response) -> None:
+    if response.status_code >= 400:
+        raise UpstreamError(f"OpenRouter: HTTP {response.status_code}", response.status_code)
+
+
+class LLMClient:
+    """Долгоживущий клиент OpenRouter с ограниченным пулом соединений.
+
+    Число одновременных запросов ограничено размером пула; время ожидания
+    свободного слота и состояние соединений доступны через pool_stats().
+    """
+
+    def __init__(self, url: str = OPENROUTER_API_URL, api_key: Optional[str] = OPENROUTER_API_KEY,
+                 model: str = MODEL_NAME, max_connections: int = LLM_MAX_CONNECTIONS):
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        self._transport: Optional[httpcore.AsyncConnectionPool] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.calls = SingleFlight("llm")
+
+        self.requests = 0
+        self.errors = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        self._transport = httpcore.AsyncConnectionPool(
+            max_connections=self.max_connections,
+            max_keepalive=self.max_connections,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        self._client = httpx.AsyncClient(
+            transport=self._transport,
+            headers={**HEADERS, "Authorization": f"Bearer {self.api_key}"},
+            timeout=httpx.Timeout(LLM_TIMEOUT, connect_timeout=LLM_CONNECT_TIMEOUT),
+        )
+        self._slots = asyncio.Semaphore(self.max_connections)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._transport = None
+            self._slots = None
+
+    async def _acquire(self) -> asyncio.Semaphore:
+        slots = self._slots
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - start
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        self.in_use += 1
+        return slots
+
+    def _release(self, slots: asyncio.Semaphore) -> None:
+        self.in_use -= 1
+        slots.release()
+
+    async def complete(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """Один ответ модели на prompt; timeout задаёт предел на вызов.
+
+        Одновременные вызовы с одинаковым prompt получают один ответ.
+        Общий вызов идёт с timeout первого: если он не уложился в срок
+        этого запроса, ожидающие не получают чужую DeadlineExceeded, а
+        повторяют вызов с остатком своего срока.
+        """
+        key = (self.model, prompt)
+        while True:
+            leader = not self.calls.in_flight(key)
+            try:
+                return await self.calls.do(key, lambda: self._complete(prompt, timeout))
+            except DeadlineExceeded:
+                if leader:
+                    raise
+            # Свой срок: без остатка timeout_for сам поднимет DeadlineExceeded
+            timeout = timeout_for(timeout)
+
+    async def _complete(self, prompt: str, timeout: Optional[float] = None) -> str:
+        # Таймаут короче LLM_TIMEOUT задан сроком запроса: его срабатывание — не сбой провайдера
+        limit = LLM_TIMEOUT if timeout is None else timeout
+        await self.start()
+        slots = await self._acquire()
+        self.requests += 1
+        started = time.perf_counter()
+        status, size = "error", None
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        try:
+            async with llm_governor.slot():
+                try:
+                    response = await cassette.request_async(
+                        "llm", "POST", self.url,
+                        lambda: self._client.post(self.url, json=payload, timeout=limit),
+                        body=payload
+                    )
+                except HTTP_TIMEOUTS as e:
+                    if limit < LLM_TIMEOUT:
+                        raise DeadlineExceeded(f"LLM не ответила до срока запроса ({limit:.1f} с)") from e
+                    raise
+                status, size = response.status_code, len(response.content)
+                _check_status(response)
+            return response.json()["choices"][0]["message"]["content"]
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            observe_upstream("llm", status, started, size)
+            self._release(slots)
+
+    @asynccontextmanager
+    async def _open_stream(self, payload: Dict[str, Any], timeout: float):
+        # Для архива ответ читается целиком, из архива отдаётся одним куском
+        if cassette.active:
+            yield await cassette.request_async(
+                "llm", "POST", self.url,
+                lambda: self._client.post(self.url, json=payload, timeout=timeout),
+                body=payload
+            )
+            return
+        async with self._client.stream("POST", self.url, json=payload, timeout=timeout) as response:
+            yield response
+
+    async def stream(self, prompt: str, timeout: Optional[float] = None) -> AsyncIterator[str]:
+        """Ответ модели по частям (stream=true в OpenRouter, формат SSE)."""
+        await self.start()
+        slots = await self._acquire()
+        self.requests += 1
+        started = time.perf_counter()
+        status, size = "error", 0
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+        try:
+            async with llm_governor.slot(), \
+                    self._open_stream(payload, LLM_TIMEOUT if timeout is None else timeout) as response:
+                status = response.status_code
+                _check_status(response)
+                async for data in iter_sse_data(response):
+                    size += len(data.encode())
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    choices = chunk.get("choices") or [{}]
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            observe_upstream("llm", status, started, size)
+            self._release(slots)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        connections = []
+        if self._transport is not None:
+            connections = [c for conns in self._transport._connections.values() for c in conns]
+        idle = sum(1 for c in connections if c.state == ConnectionState.IDLE)
+        return {
+            "max_connections": self.max_connections,
+            "requests_in_use": self.in_use,
+            "requests_waiting": self.waiting,
+            "connections_open": len(connections),
+            "connections_idle": idle,
+            "connections_active": len(connections) - idle,
+            "requests_total": self.requests,
+            "errors_total": self.errors,
+            "wait_ms_avg": round(self.wait_seconds_total / self.requests * 1000, 3) if self.requests else 0.0,
+            "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+        }
+
+
+llm_client = LLMClient()
@@ -1,29 +1,146 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+from typing import Any, Callable, Optional, List, Dict, Union
 from enum import Enum
-import httpx
-import os
 from dotenv import load_dotenv
-import random
+import os
+import json
+import time
 import asyncio
-from datetime import datetime, timedelta
-from fastapi.responses import PlainTextResponse
-from avia_parser import search_flights
-from hotels_request import find_hotels
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from flight_client import flight_client
+from llm_client import llm_client
+from pipeline import (
+    StageTimings, recommendation_cache, recommendation_calls,
+    run_recommendation, stream_recommendation
+)
+from render import etag, render_markdown
+from batch import BATCH_CONCURRENCY, run_batch
+from reference_data import registry
+from city_lookup import city_locations
+from cache import cache_stats
+from singleflight import singleflight_stats
+from cassette import cassette
+from governor import ProviderUnavailable, governor_stats
+from deadline import DeadlineExceeded
+from prefetch import PREFETCH_ENABLED, PrefetchScheduler, query_log
+from jobs import JOB_MAX_WAIT, JobQueue, JobQueueFull
+from metrics import executor_collector, http_duration, register_collector, render_prometheus
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Travel Recommendation API")
+# Потоки для asyncio.to_thread (каталоги отелей, поиск локаций)
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", str(min(32, (os.cpu_count() or 1) + 4))))
+
+
+def collect_stats():
+    """Статистика кэшей, single-flight и пула LLM для /metrics."""
+    caches = cache_stats()
+    for field, kind in (("hits", "counter"), ("stale_hits", "counter"), ("misses", "counter"),
+                        ("evictions", "counter"), ("lease_waits", "counter"), ("entries", "gauge"),
+                        ("bytes", "gauge")):
+        yield (f"travel_cache_{field}" + ("_total" if kind == "counter" else ""), kind,
+               f"Кэш: {field}", [({"cache": name}, s[field]) for name, s in caches.items()])
+    yield ("travel_cache_hit_ratio", "gauge", "Доля попаданий в кэш",
+           [({"cache": name}, s["hit_rate"]) for name, s in caches.items()])
+    groups = singleflight_stats()
+    for field in ("upstream_calls", "saved_calls"):
+        yield (f"travel_singleflight_{field}_total", "counter", f"Single-flight: {field}",
+               [({"group": name}, s[field]) for name, s in groups.items()])
+    governors = governor_stats()
+    yield ("travel_provider_circuit_open", "gauge", "Автомат провайдера открыт (1) или полуоткрыт (0.5)",
+           [({"provider": name}, {"closed": 0, "half_open": 0.5, "open": 1}[s["state"]])
+            for name, s in governors.items()])
+    for field in ("limit", "in_flight", "queued"):
+        yield (f"travel_provider_{field}", "gauge", f"Ограничитель провайдера: {field}",
+               [({"provider": name}, s[field]) for name, s in governors.items()])
+    for field in ("requests", "failures", "rejected", "overloaded"):
+        yield (f"travel_provider_{field}_total", "counter", f"Ограничитель провайдера: {field}",
+               [({"provider": name}, s[field]) for name, s in governors.items()])
+    prefetch = prefetcher.stats()
+    yield ("travel_prefetch_calls_total", "counter", "Запросы фонового прогрева к внешним API",
+           [({}, prefetch["calls"])])
+    yield ("travel_prefetch_keys", "gauge", "Ключи, которые держит тёплыми прогрев",
+           [({}, len(prefetch["keys"]))])
+    yield ("travel_prefetch_hits_total", "counter", "Попадания в записи, положенные прогревом",
+           [({"cache": name}, s["prefetch_hits"]) for name, s in prefetch["contribution"].items()])
+    queue = jobs.stats()
+    for field in ("queued", "running", "stored"):
+        yield (f"travel_jobs_{field}", "gauge", f"Задачи /jobs: {field}", [({}, queue[field])])
+    for field in ("submitted", "completed", "failed", "rejected"):
+        yield (f"travel_jobs_{field}_total", "counter", f"Задачи /jobs: {field}", [({}, queue[field])])
+    pool = llm_client.pool_stats()
+    for field in ("requests_in_use", "requests_waiting", "connections_open"):
+        yield (f"travel_llm_{field}", "gauge", f"Пул LLM: {field}", [({}, pool[field])])
+
+
+register_collector(collect_stats)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Справочники загружаются один раз при старте и перечитываются при изменении файлов
+    executor = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="travel")
+    asyncio.get_running_loop().set_default_executor(executor)
+    register_collector(executor_collector(executor))
+    await asyncio.to_thread(registry.load)
+    watcher = asyncio.create_task(registry.watch())
+    await flight_client.start()
+    await llm_client.start()
+    # Журнал недавних запросов: по нему прогреваются популярные маршруты и города
+    await asyncio.to_thread(query_log.load)
+    prefetch = asyncio.create_task(prefetcher.run()) if PREFETCH_ENABLED else None
+    await jobs.start()
+    yield
+    await jobs.close()
+    watcher.cancel()
+    if prefetch is not None:
+        prefetch.cancel()
+    await asyncio.to_thread(query_log.flush)
+    await asyncio.to_thread(city_locations.flush)
+    await flight_client.close()
+    await llm_client.close()
+
+
+app = FastAPI(title="Travel Recommendation API", lifespan=lifespan)
+
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    # Шаблон пути, а не сам путь: иначе число серий не ограничено
+    route = request.scope.get("route")
+    http_duration.observe(elapsed, request.method, getattr(route, "path", "other"), str(response.status_code))
+    if "server-timing" not in response.headers:
+        response.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.1f}"
+    return response
+
+
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable(request: Request, e: ProviderUnavailable):
+    # Провайдер недоступен или перегружен: клиенту стоит повторить позже, а не сразу
+    return JSONResponse(
+        {"detail": str(e), "provider": e.provider},
+        status_code=503,
+        headers={"Retry-After": str(int(e.retry_after + 0.5))}
+    )
+
 
+@app.exception_handler(JobQueueFull)
+async def job_queue_full(request: Request, e: JobQueueFull):
+    return JSONResponse({"detail": str(e)}, status_code=503, headers={"Retry-After": str(int(e.retry_after + 0.5))})
 
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-MODEL_NAME = "deepseek/deepseek-prover-v2:free"
 
-# Примерный курс доллара для конвертации цен отелей в рубли
-USD_TO_RUB = 90.0
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(request: Request, e: DeadlineExceeded):
+    # Без билетов ответа нет: обязательный этап не уложился в RECOMMEND_DEADLINE
+    return JSONResponse({"detail": f"Не успели подготовить ответ: {e}"}, status_code=504)
 
 
 class TravelPreference(str, Enum):
@@ -49,212 +166,314 @@ class TravelRequest(BaseModel):
     is_one_way: bool = False
     direct_flights: bool = False
     preferences: List[TravelPreference]
+    flex_days: int = Field(0, ge=0, le=7)  # гибкие даты: ±дней от указанных
+
+class BatchRequest(BaseModel):
+    requests: List[TravelRequest] = Field(min_length=1, max_length=1000)
+    concurrency: int = Field(BATCH_CONCURRENCY, ge=1, le=100)
+    # Лимиты одновременных обращений к провайдерам: flights, hotels, llm
+    provider_limits: Dict[str, int] = {}
+
+class FlightOption(BaseModel):
+    airline: str
+    price: float  # в рублях
+    departure_time: str
+    arrival_time: Optional[str] = None
+    transfers: Union[int, str]
+    link: str
+
+class HotelOption(BaseModel):
+    id: Optional[int] = None
+    name: str
+    rating: float
+    stars: float
+    total_price: float  # в центах USD
+    per_night: float  # в USD
+    address: str
+    url: Optional[str] = None
+    main_photo: Optional[str] = None
+    photos: List[str] = []
+
+class DestinationOption(BaseModel):
+    city: str
+    code: str
+    flight_price: float  # в рублях
+    hotel: Optional[str] = None
+    hotel_price: Optional[float] = None  # в рублях
+    total: Optional[float] = None  # в рублях
+    hotels_loaded: bool
+
+class DateOption(BaseModel):
+    departure_at: str
+    return_at: Optional[str] = None
+    price: float  # в рублях
+
+class PriceCalendar(BaseModel):
+    departures: List[str]
+    returns: List[Optional[str]]
+    prices: List[List[Optional[float]]]  # [вылет][возвращение]
+    cheapest: List[DateOption]
+
+class RecommendationResponse(BaseModel):
+    destination_city: str
+    departure_date: str
+    return_date: Optional[str] = None
+    destinations: Optional[List[DestinationOption]] = None  # режим «куда угодно»
+    calendar: Optional[PriceCalendar] = None  # гибкие даты
+    flights: List[FlightOption]
+    hotels: List[HotelOption]
+    nights: int
+    recommendation: Optional[str] = None  # None — секция пропущена
+    checklist: Optional[str] = None
+    skipped: List[str] = []  # секции, не успевшие к сроку ответа
+
+class ResponseFormat(str, Enum):
+    JSON = "json"
+    MARKDOWN = "markdown"
+
+MEDIA_TYPES = {
+    ResponseFormat.JSON: "application/json",
+    ResponseFormat.MARKDOWN: "text/markdown; charset=utf-8",
+}
 
 class ParsedItem(BaseModel):
     markdown: str
     url: str
     price: float  # в USD
 
-async def ask_llm(prompt: str) -> str:
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "HTTP-Referer": "https://your-travel-app.com",
-        "X-Title": "Travel AI"
-    }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            OPENROUTER_API_URL,
-            json={
-                "model": MODEL_NAME,
-                "messages": [{"role": "user", "content": prompt}]
-            }, headers=headers, timeout=30
-        )
-        response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
+prefetcher = PrefetchScheduler(query_log, TravelRequest.model_validate)
 
 @app.get("/", response_class=PlainTextResponse)
 async def root():
     return "Travel Recommendation API up & running. POST to /recommend"
 
-@app.post("/recommend", response_class=PlainTextResponse)
-async def recommend(request: TravelRequest):
-    flight_results = await asyncio.to_thread(
-        search_flights,
-        origin_input=request.departure_city,
-        destination_input=request.destination_city,
-        departure_date=request.departure_date,
-        return_date=request.return_date,
-        is_one_way=request.is_one_way,
-        direct=request.direct_flights,
-        adult=request.adults,
-        child=request.children,
-        infant=request.infants,
-        save_results=False
+@app.get("/reference/stats")
+async def reference_stats():
+    return registry.stats()
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return llm_client.pool_stats()
+
+@app.get("/cache/stats")
+async def caches():
+    return await asyncio.to_thread(cache_stats)
+
+@app.get("/singleflight/stats")
+async def singleflight():
+    return singleflight_stats()
+
+@app.get("/cassette/stats")
+async def cassette_stats():
+    return cassette.stats()
+
+@app.get("/governor/stats")
+async def governors():
+    return governor_stats()
+
+@app.get("/prefetch/stats")
+async def prefetch_stats():
+    """Что держит тёплым фоновый прогрев и сколько попаданий в кэш он дал."""
+    return await asyncio.to_thread(prefetcher.stats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Метрики в формате Prometheus."""
+    # Размеры кэшей при CACHE_BACKEND=sqlite читаются из базы — не в event loop
+    return PlainTextResponse(await asyncio.to_thread(render_prometheus), media_type="text/plain; version=0.0.4")
+
+def result_id(request: TravelRequest) -> str:
+    """Ключ результата: одинаковые запросы дают один адрес /recommend/results/{id}."""
+    return hashlib.blake2b(request.model_dump_json().encode(), digest_size=16).hexdigest()
+
+async def cached_recommendation(request: TravelRequest, timings: StageTimings,
+                                progress: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+    """Тела ответа в обоих форматах с их ETag; одинаковые запросы считаются один раз.
+
+    Тела общие для всех получателей, поэтому этапы в них не входят:
+    timings заполняется только у запроса, который считал ответ, а
+    timings.cache говорит, откуда ответ взят. progress получает секции
+    по мере готовности (см. run_recommendation), если считает именно
+    этот вызов, а не ждёт уже идущий.
+    """
+    key = result_id(request)
+    cached = await recommendation_cache.get_async(key)
+    if cached is not None:
+        timings.cache = "hit"
+        return cached
+
+    async def compute():
+        result = await run_recommendation(request, timings, progress)
+        response = RecommendationResponse(**result)
+        bodies = {
+            ResponseFormat.JSON: response.model_dump_json().encode(),
+            ResponseFormat.MARKDOWN: render_markdown(result).encode(),
+        }
+        entry = {fmt: (body, etag(body)) for fmt, body in bodies.items()}
+        entry["id"] = key
+        entry["skipped"] = result["skipped"]
+        # Неполный ответ не кэшируется: следующий запрос попробует собрать всё
+        if not result["skipped"]:
+            await recommendation_cache.set_async(key, entry)
+        return entry
+
+    timings.cache = "coalesced" if recommendation_calls.in_flight(key) else "miss"
+    return await recommendation_calls.do(key, compute)
+
+def etag_matches(if_none_match: Optional[str], tag: str) -> bool:
+    return bool(if_none_match) and (if_none_match.strip() == "*" or tag in (t.strip() for t in if_none_match.split(",")))
+
+def result_url(entry: Dict[str, Any], format: ResponseFormat) -> str:
+    url = f"/recommend/results/{entry['id']}"
+    return url if format == ResponseFormat.JSON else f"{url}?format={format.value}"
+
+def recommendation_response(entry: Dict[str, Any], format: ResponseFormat, if_none_match: Optional[str],
+                            cache_control: str) -> Response:
+    """Ответ на GET из готовых тел: ETag, Cache-Control и 304 на If-None-Match."""
+    body, tag = entry[format]
+    headers = {"ETag": tag, "Cache-Control": "no-store" if entry["skipped"] else cache_control}
+    if etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=MEDIA_TYPES[format], headers=headers)
+
+async def run_job(request: TravelRequest, progress: Callable[[str, str], None]) -> Dict[str, Any]:
+    return await cached_recommendation(request, StageTimings(), progress)
+
+jobs = JobQueue(run_job)
+
+@app.post(
+    "/recommend",
+    response_model=RecommendationResponse,
+    responses={200: {"content": {"text/markdown": {}}},
+               412: {"description": "If-None-Match совпал: у клиента уже этот ответ"}}
+)
+async def recommend(request: TravelRequest, format: ResponseFormat = ResponseFormat.JSON,
+                    if_none_match: Optional[str] = Header(None)):
+    """Рекомендация в JSON (по умолчанию) или Markdown (?format=markdown).
+
+    Ответ POST не кэшируется (no-store). Результат хранится на сервере
+    RECOMMEND_CACHE_TTL и доступен по адресу из Content-Location
+    (GET /recommend/results/{id}): там его можно перепроверять с
+    If-None-Match и получать 304, в том числе через промежуточные кэши.
+    Совпавший If-None-Match на самом POST по RFC 9110 даёт 412. Ответ,
+    в котором часть секций пропущена из-за срока (поле skipped), не
+    сохраняется и Content-Location не получает. Время этапов именно
+    этого запроса — в Server-Timing, с cache;desc=miss, hit или coalesced.
+    """
+    query_log.record(request.model_dump(mode="json"))
+    timings = StageTimings()
+    entry = await cached_recommendation(request, timings)
+    body, tag = entry[format]
+    headers = {"ETag": tag, "Cache-Control": "no-store", "Server-Timing": timings.server_timing()}
+    if not entry["skipped"]:
+        headers["Content-Location"] = result_url(entry, format)
+    if etag_matches(if_none_match, tag):
+        return Response(status_code=412, headers=headers)
+    return Response(body, media_type=MEDIA_TYPES[format], headers=headers)
+
+@app.get(
+    "/recommend/results/{result_id}",
+    response_model=RecommendationResponse,
+    responses={200: {"content": {"text/markdown": {}}}, 304: {"description": "Ответ не изменился"}}
+)
+async def recommend_result(result_id: str, format: ResponseFormat = ResponseFormat.JSON,
+                           if_none_match: Optional[str] = Header(None)):
+    """Сохранённый результат /recommend; кэшируется и перепроверяется как обычный GET."""
+    entry = await recommendation_cache.get_async(result_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Результат не найден или устарел, повторите POST /recommend")
+    max_age = max(0, int(await recommendation_cache.ttl_left_async(result_id) or 0))
+    return recommendation_response(entry, format, if_none_match, f"public, max-age={max_age}")
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: TravelRequest, response: Response):
+    """Ставит запрос /recommend в очередь и сразу возвращает id задачи.
+
+    Результат забирается GET /jobs/{job_id}/result; при заполненной
+    очереди — 503 с Retry-After.
+    """
+    query_log.record(request.model_dump(mode="json"))
+    job = jobs.submit(request)
+    response.headers["Location"] = f"/jobs/{job.id}/result"
+    return jobs.describe(job)
+
+@app.get("/jobs/stats")
+async def job_stats():
+    return jobs.stats()
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = Query(0, ge=0, le=JOB_MAX_WAIT),
+                     seen: Optional[int] = Query(None, ge=0)):
+    """Состояние задачи; wait — сколько секунд ждать завершения (long-poll),
+    seen — сколько секций уже получено: ответ придёт и с новой секцией."""
+    job = await jobs.wait(job_id, wait, seen)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или её результат уже удалён")
+    return jobs.describe(job)
+
+@app.get(
+    "/jobs/{job_id}/result",
+    response_model=RecommendationResponse,
+    responses={200: {"content": {"text/markdown": {}}}, 202: {"description": "Задача ещё выполняется"}}
+)
+async def job_result(job_id: str, wait: float = Query(0, ge=0, le=JOB_MAX_WAIT),
+                     seen: Optional[int] = Query(None, ge=0),
+                     format: ResponseFormat = ResponseFormat.JSON, if_none_match: Optional[str] = Header(None)):
+    """Результат задачи в том же виде, что ответ /recommend.
+
+    Пока задача не готова (в течение wait секунд) — 202 с её состоянием
+    и уже готовыми секциями (sections, Markdown). С seen — числом уже
+    полученных секций — 202 приходит, как только готова следующая, и
+    ответ можно показывать по частям. Ошибка задачи возвращается с тем
+    статусом, с каким её вернул бы /recommend.
+    """
+    job = await jobs.wait(job_id, wait, seen)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена или её результат уже удалён")
+    if not job.finished:
+        return JSONResponse(jobs.describe(job), status_code=202, headers={"Retry-After": "1"})
+    if job.error is not None:
+        headers = {"Retry-After": str(job.error["retry_after"])} if "retry_after" in job.error else None
+        return JSONResponse({"detail": job.error["detail"]}, status_code=job.error["status"], headers=headers)
+    return recommendation_response(job.result, format, if_none_match, f"private, max-age={int(jobs.ttl)}")
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/recommend/stream")
+async def recommend_stream(request: TravelRequest):
+    """То же, что /recommend, но секции приходят по мере готовности (SSE)."""
+    query_log.record(request.model_dump(mode="json"))
+    timings = StageTimings()
+
+    async def events():
+        try:
+            async for event, data in stream_recommendation(request, timings):
+                yield sse_event(event, data)
+        except HTTPException as e:
+            yield sse_event("error", {"status": e.status_code, "detail": e.detail})
+        except ProviderUnavailable as e:
+            yield sse_event("error", {"status": 503, "detail": str(e), "retry_after": int(e.retry_after + 0.5)})
+        except DeadlineExceeded as e:
+            yield sse_event("error", {"status": 504, "detail": f"Не успели подготовить ответ: {e}"})
+        except Exception as e:
+            yield sse_event("error", {"status": 500, "detail": str(e)})
+        yield sse_event("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
-    if not flight_results.get('data'):
-        raise HTTPException(status_code=404, detail="No flights found")
-
-
-    flights = []
-    for f in flight_results['data']:
-        flights.append({
-            "airline": f.get("airline", "N/A"),
-            "price": f.get("price", 0),
-            "departure_time": f.get("departure_at", ""),
-            "arrival_time": f.get("return_at", ""),
-            "transfers": f.get("transfers", "?"),
-            "link": f"https://aviasales.ru{f.get('link')}"
-        })
-
-
-    affordable = [f for f in flights if f["price"] <= request.budget]
-    if not affordable:
-        raise HTTPException(status_code=400, detail="Бюджета недостаточно для билетов")
-
-
-    selected_flights = random.sample(affordable, min(3, len(affordable)))
-    cheapest_price = min(f["price"] for f in affordable)
-    remaining_budget = request.budget - cheapest_price
-
-
-    # Convert budget to USD for hotel search
-    budget_hotels_usd = remaining_budget / USD_TO_RUB if remaining_budget > 0 else 0
-
-
-    check_out = request.return_date or (
-        (datetime.strptime(request.departure_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-    )
-
-    hotel_list = []
-    if budget_hotels_usd > 0:
-        hotel_list = await asyncio.to_thread(
-            find_hotels,
-            request.destination_city,
-            budget_hotels_usd,
-            request.departure_date,
-            check_out,
-            request.adults + request.children + request.infants
-        )
-    
-    # Keep hotel prices in USD without converting to rubles
-    if hotel_list:
-        hotels = hotel_list[:3]  # Get top 3 hotels with most detailed info
-    else:
-        hotels = []
-
-    # Восстанавливаем полную информацию о билетах, включая ссылки
-    flights_md = "\n\n".join([
-        f"### Перелёт {i+1}: {f['airline']}\n" +
-        f"* **Цена:** ${f['price']/USD_TO_RUB:.2f}\n" +
-        f"* **Вылет:** {f['departure_time']}\n" +
-        f"* **Возвращение:** {f['arrival_time']}\n" +
-        f"* **Пересадки:** {f['transfers']}\n" +
-        f"* **Ссылка:** {f['link']}"
-        for i, f in enumerate(selected_flights)
-    ])
-    
-    # Enhance hotel output with more details
-    if hotels:
-        hotels_md = ""
-        for i, h in enumerate(hotels):
-            nights = calculate_nights(request.departure_date, check_out) if not request.is_one_way else 1
-            hotels_md += f"### Отель {i+1}: {h['name']}\n"
-            hotels_md += f"* **Рейтинг:** {h['rating']}/10\n"
-            hotels_md += f"* **Звезд:** {'⭐' * int(h['stars'])}\n"
-            hotels_md += f"* **Цена за ночь:** ${h['per_night']:.2f}\n"
-            hotels_md += f"* **Общая стоимость ({nights} ночей):** ${h['total_price']/100:.2f}\n"
-            hotels_md += f"* **Адрес:** {h['address']}\n"
-            if h['url']:
-                hotels_md += f"* **Ссылка:** {h['url']}\n"
-            if h['main_photo']:
-                hotels_md += f"* **Фото:** ![{h['name']}]({h['main_photo']})\n"
-            hotels_md += "\n"
-    else:
-        hotels_md = "*Бюджета не хватает на отели.*"
-
-
-    rec_prompt = f"""
-Ты — туристический помощник. Перед тобой варианты перелётов и отелей.
-Объясни преимущества и недостатки каждого. Учитывай цену, количество пересадок, длительность перелёта и репутацию авиакомпании.
-Учитывай цену, рейтинг и количество звёзд у отелей. Отвечай на русском языке.
-
-Важно: твой ответ должен быть строго в Markdown формате, ничего лишнего.
-
-Перелёты:
-{flights_md}
-
-Отели:
-{hotels_md}
-
-Верни ответ в формате Markdown со списком:
-
-#### Выбор перелёта и отеля
-
-##### Перелёт 1: [Название авиакомпании]
-- **Преимущества:**
-  - [преимущество 1]
-  - [преимущество 2]
-- **Недостатки:** (если недостатков нет, не выводи поле)
-  - [недостаток 1]
-  - [недостаток 2]
-- **Кому подойдёт:** [описание целевой аудитории]
-
-##### [И так далее для каждого варианта]
-"""
-
-    checklist_prompt = f"""
-Создай чеклист путешественника для поездки в {request.destination_city} в формате Markdown.
-
-Важная информация:
-- Предпочтения туриста: {', '.join(request.preferences)}
-- Длительность поездки: с {request.departure_date} по {request.return_date or request.departure_date}
-- Состав группы: {request.adults} взрослых, {request.children} детей
-
-Твой ответ должен быть строго в формате Markdown:
-1. Начни с краткого описания города и его особенностей (2-3 предложения)
-2. Раздели чеклист по дням, где каждый день - это заголовок второго уровня (##)
-3. Для каждого дня создай список активностей с маркерами (-)
-4. Используй **жирный текст** для важных моментов и *курсив* для дополнительной информации
-5. Обязательно учти предпочтения туриста
-6. Если есть места которые стоит посетить, оформи их как подзаголовки третьего уровня (###)
-
-Очень важно, чтобы это был качественный markdown для отображения в приложении.
-"""
-
-    recommendation, checklist = await asyncio.gather(
-        ask_llm(rec_prompt),
-        ask_llm(checklist_prompt)
-    )
-
-    # Форматируем результат с правильными отступами и структурой для Markdown
-    result = f"""
-## 🛫 Авиабилеты
-{flights_md}
-
-## 🏨 Отели
-{hotels_md}
-
----
-
-## 🤖 Рекомендации по перелетам и отелям
-
-{recommendation}
-
----
-
-## 📋 Чеклист путешественника
-
-{checklist}
-"""
 
-    return result
+@app.post("/recommend/batch")
+async def recommend_batch(batch: BatchRequest):
+    """Пакет запросов; результаты приходят в NDJSON по мере готовности."""
+    async def lines():
+        async for item in run_batch(batch.requests, batch.concurrency, batch.provider_limits):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
 
-def calculate_nights(check_in: str, check_out: str) -> int:
-    """Количество ночей между датами."""
-    date_in = datetime.strptime(check_in, '%Y-%m-%d')
-    date_out = datetime.strptime(check_out, '%Y-%m-%d')
-    nights = (date_out - date_in).days
-    return max(1, nights)
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,182 @@
+import time
+import asyncio
+import bisect
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм: длительность в секундах и размер ответа в байтах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+Sample = Tuple[Dict[str, str], float]
+
+METRICS: List[Any] = []
+COLLECTORS: List[Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Счётчик с метками; значения по кортежу значений меток."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def lines(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_labels(dict(zip(self.labels, label_values)))} {_number(value)}"
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами.
+
+    observe() — поиск корзины bisect и несколько сложений под замком,
+    поэтому её можно оставлять включённой в рабочем режиме.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # По меткам: [счётчики корзин..., +Inf], сумма
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def lines(self) -> Iterable[str]:
+        with self._lock:
+            values = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        for label_values, counts, total in values:
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                yield f"{self.name}_bucket{_labels({**labels, 'le': le})} {cumulative}"
+            yield f"{self.name}_sum{_labels(labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(labels)} {cumulative}"
+
+
+stage_duration = Histogram(
+    "travel_stage_duration_seconds", "Длительность этапов конвейера /recommend", ("stage",)
+)
+function_duration = Histogram(
+    "travel_function_duration_seconds", "Длительность функций горячего пути", ("function",)
+)
+upstream_requests = Counter(
+    "travel_upstream_requests_total", "Запросы к внешним API по кодам ответа", ("provider", "status")
+)
+upstream_duration = Histogram(
+    "travel_upstream_duration_seconds", "Длительность запросов к внешним API", ("provider",)
+)
+upstream_bytes = Histogram(
+    "travel_upstream_response_bytes", "Размер ответов внешних API", ("provider",), buckets=SIZE_BUCKETS
+)
+http_duration = Histogram(
+    "travel_http_request_duration_seconds", "Длительность запросов к API до отправки заголовков",
+    ("method", "path", "status")
+)
+
+
+def observe_upstream(provider: str, status: Any, started: float, size: Optional[int] = None) -> None:
+    """Код ответа, длительность и размер одного запроса к внешнему API."""
+    upstream_requests.inc(provider, str(status))
+    upstream_duration.observe(time.perf_counter() - started, provider)
+    if size is not None:
+        upstream_bytes.observe(size, provider)
+
+
+def timed(name: str) -> Callable:
+    """Декоратор: длительность вызова в travel_function_duration_seconds."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    function_duration.observe(time.perf_counter() - start, name)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                function_duration.observe(time.perf_counter() - start, name)
+        return wrapper
+    return decorator
+
+
+def register_collector(collect: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]) -> None:
+    """Метрики, которые считаются в момент опроса: (имя, тип, описание, [(метки, значение)])."""
+    COLLECTORS.append(collect)
+
+
+def executor_collector(executor: ThreadPoolExecutor) -> Callable:
+    """Очередь и потоки пула, в котором работают asyncio.to_thread."""
+    def collect():
+        yield ("travel_threadpool_queue_depth", "gauge", "Задачи, ждущие свободного потока",
+               [({}, executor._work_queue.qsize())])
+        yield ("travel_threadpool_threads", "gauge", "Запущенные потоки пула",
+               [({}, len(executor._threads))])
+        yield ("travel_threadpool_max_threads", "gauge", "Размер пула",
+               [({}, executor._max_workers)])
+    return collect
+
+
+def render_prometheus() -> str:
+    """Все метрики в текстовом формате Prometheus."""
+    out: List[str] = []
+    for metric in METRICS:
+        out.append(f"# HELP {metric.name} {metric.help}")
+        out.append(f"# TYPE {metric.name} {metric.kind}")
+        out.extend(metric.lines())
+    for collect in COLLECTORS:
+        for name, kind, help, samples in collect():
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in samples)
+    return "\n".join(out) + "\n"
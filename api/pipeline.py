@@ -0,0 +1,631 @@
+import os
+import time
+import random
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+
+from avia_parser import search_flight_offers, search_flights_async, search_price_calendar_async
+from hotels_request import cached_city_catalog, filter_hotels, load_city_catalog
+from llm_client import LLM_TIMEOUT, llm_client
+from limits import provider_slot
+from governor import ProviderUnavailable
+from deadline import (
+    DEADLINE_RESERVE, LLM_MIN_BUDGET, RECOMMEND_DEADLINE, DeadlineExceeded, timeout_for, use_deadline, within
+)
+from cache import TTLCache
+from singleflight import SingleFlight
+from metrics import stage_duration, timed
+from reference_data import registry
+from render import (
+    SKIPPED, USD_TO_RUB, calendar_markdown, destinations_markdown, flights_markdown,
+    hotels_markdown, intro_markdown
+)
+
+# Режим «куда угодно»: сколько билетов смотреть, сколько направлений сравнивать
+# и общий срок на загрузку их каталогов отелей
+EXPLORE_FLIGHTS_LIMIT = int(os.getenv("EXPLORE_FLIGHTS_LIMIT", "30"))
+EXPLORE_CANDIDATES = int(os.getenv("EXPLORE_CANDIDATES", "5"))
+EXPLORE_DEADLINE = float(os.getenv("EXPLORE_DEADLINE", "10"))
+
+# Готовые ответы /recommend: повтор запроса и перепроверка по ETag не запускают конвейер
+RECOMMEND_CACHE_TTL = float(os.getenv("RECOMMEND_CACHE_TTL", "300"))
+recommendation_cache = TTLCache(
+    "recommendations",
+    ttl=RECOMMEND_CACHE_TTL,
+    max_entries=int(os.getenv("RECOMMEND_CACHE_MAX_ENTRIES", "500")),
+    max_bytes=int(os.getenv("RECOMMEND_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+recommendation_calls = SingleFlight("recommendations")
+
+# Чеклист зависит только от города, дат, состава группы и предпочтений — его можно переиспользовать
+checklist_cache = TTLCache(
+    "checklists",
+    ttl=float(os.getenv("CHECKLIST_CACHE_TTL", str(24 * 3600))),
+    max_entries=int(os.getenv("CHECKLIST_CACHE_MAX_ENTRIES", "2000"))
+)
+
+
+class StageTimings:
+    """Время начала и окончания этапов обработки запроса."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+        # Откуда взят ответ /recommend: miss — посчитан этим запросом, hit — из кэша,
+        # coalesced — дождались одинакового запроса, который считался в это время
+        self.cache: Optional[str] = None
+
+    def record(self, name: str, start: float) -> None:
+        end = time.perf_counter()
+        stage_duration.observe(end - start, name)
+        self.stages[name] = {
+            "start_ms": round((start - self.started) * 1000, 1),
+            "duration_ms": round((end - start) * 1000, 1),
+        }
+
+    async def measure(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.record(name, start)
+
+    def measure_sync(self, name: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(name, start)
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"total_ms": self.total_ms(), "stages": dict(self.stages)}
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing."""
+        parts = [f"cache;desc={self.cache}"] if self.cache else []
+        parts += [f"{name};dur={stage['duration_ms']}" for name, stage in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms()}")
+        return ", ".join(parts)
+
+
+def _discard(task: asyncio.Task) -> None:
+    """Отменяет ненужную задачу и гасит её возможную ошибку."""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+@timed("ask_llm")
+async def ask_llm(prompt: str, timeout: Optional[float] = None) -> str:
+    """Ответ модели; таймаут вызова не больше остатка срока запроса, чтобы после
+    срока запрос к OpenRouter не занимал слот ограничителя и соединение."""
+    async with provider_slot("llm"):
+        return await llm_client.complete(prompt, timeout=timeout_for(timeout or LLM_TIMEOUT))
+
+
+async def load_catalog(city: str):
+    async with provider_slot("hotels"):
+        return await asyncio.to_thread(load_city_catalog, city)
+
+
+def calculate_nights(check_in: str, check_out: str) -> int:
+    """Количество ночей между датами."""
+    date_in = datetime.strptime(check_in, '%Y-%m-%d')
+    date_out = datetime.strptime(check_out, '%Y-%m-%d')
+    nights = (date_out - date_in).days
+    return max(1, nights)
+
+
+def stay_nights(request, check_out: str) -> int:
+    return calculate_nights(request.departure_date, check_out) if not request.is_one_way else 1
+
+
+def check_out_date(request) -> str:
+    return request.return_date or (
+        (datetime.strptime(request.departure_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    )
+
+
+def parse_flight(f: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "airline": f.get("airline", "N/A"),
+        "price": f.get("price", 0),
+        "departure_time": f.get("departure_at", ""),
+        "arrival_time": f.get("return_at", ""),
+        "transfers": f.get("transfers", "?"),
+        "link": f"https://aviasales.ru{f.get('link')}"
+    }
+
+
+def recommendation_prompt(flights_md: str, hotels_md: str) -> str:
+    return f"""
+Ты — туристический помощник. Перед тобой варианты перелётов и отелей.
+Объясни преимущества и недостатки каждого. Учитывай цену, количество пересадок, длительность перелёта и репутацию авиакомпании.
+Учитывай цену, рейтинг и количество звёзд у отелей. Отвечай на русском языке.
+
+Важно: твой ответ должен быть строго в Markdown формате, ничего лишнего.
+
+Перелёты:
+{flights_md}
+
+Отели:
+{hotels_md}
+
+Верни ответ в формате Markdown со списком:
+
+#### Выбор перелёта и отеля
+
+##### Перелёт 1: [Название авиакомпании]
+- **Преимущества:**
+  - [преимущество 1]
+  - [преимущество 2]
+- **Недостатки:** (если недостатков нет, не выводи поле)
+  - [недостаток 1]
+  - [недостаток 2]
+- **Кому подойдёт:** [описание целевой аудитории]
+
+##### [И так далее для каждого варианта]
+"""
+
+
+def checklist_prompt(request) -> str:
+    return f"""
+Создай чеклист путешественника для поездки в {request.destination_city} в формате Markdown.
+
+Важная информация:
+- Предпочтения туриста: {', '.join(request.preferences)}
+- Длительность поездки: с {request.departure_date} по {request.return_date or request.departure_date}
+- Состав группы: {request.adults} взрослых, {request.children} детей
+
+Твой ответ должен быть строго в формате Markdown:
+1. Начни с краткого описания города и его особенностей (2-3 предложения)
+2. Раздели чеклист по дням, где каждый день - это заголовок второго уровня (##)
+3. Для каждого дня создай список активностей с маркерами (-)
+4. Используй **жирный текст** для важных моментов и *курсив* для дополнительной информации
+5. Обязательно учти предпочтения туриста
+6. Если есть места которые стоит посетить, оформи их как подзаголовки третьего уровня (###)
+
+Очень важно, чтобы это был качественный markdown для отображения в приложении.
+"""
+
+
+async def checklist(request) -> str:
+    """Чеклист поездки из кэша или от модели."""
+    prompt = checklist_prompt(request)
+    return await checklist_cache.get_or_fetch(prompt, lambda: ask_llm(prompt))
+
+
+async def sample_flights(offers, k: int = 3) -> Dict[str, Any]:
+    """k случайных билетов из потока предложений и самая низкая цена.
+
+    Поток читается один раз (выборка резервуаром), весь список в памяти
+    не собирается.
+    """
+    selected: List[Dict[str, Any]] = []
+    cheapest = None
+    affordable = 0
+    try:
+        async for offer in offers:
+            flight = parse_flight(offer)
+            affordable += 1
+            if cheapest is None or flight["price"] < cheapest:
+                cheapest = flight["price"]
+            if len(selected) < k:
+                selected.append(flight)
+            else:
+                j = random.randrange(affordable)
+                if j < k:
+                    selected[j] = flight
+    except ProviderUnavailable:
+        raise
+    except Exception as e:
+        raise Exception(f"Ошибка при поиске билетов: {e}")
+    random.shuffle(selected)
+    return {"selected": selected, "cheapest": cheapest, "affordable": affordable, "received": offers.received}
+
+
+def start_flights(request, timings: StageTimings) -> asyncio.Task:
+    offers = search_flight_offers(
+        origin_input=request.departure_city,
+        destination_input=request.destination_city,
+        departure_date=request.departure_date,
+        return_date=request.return_date,
+        is_one_way=request.is_one_way,
+        direct=request.direct_flights,
+        adult=request.adults,
+        child=request.children,
+        infant=request.infants,
+        max_price=request.budget
+    )
+    return asyncio.create_task(timings.measure("flights", sample_flights(offers)))
+
+
+def start_catalog(request, timings: StageTimings) -> asyncio.Task:
+    return asyncio.create_task(timings.measure(
+        "hotel_catalog", load_catalog(request.destination_city)
+    ))
+
+
+async def pick_cheapest_dates(request, timings: StageTimings):
+    """Календарь цен ±flex_days и запрос с самыми дешёвыми датами."""
+    calendar = await timings.measure("price_calendar", search_price_calendar_async(
+        origin_input=request.departure_city,
+        destination_input=request.destination_city,
+        departure_date=request.departure_date,
+        return_date=request.return_date,
+        flex_days=request.flex_days,
+        is_one_way=request.is_one_way,
+        direct=request.direct_flights,
+        adult=request.adults,
+        child=request.children,
+        infant=request.infants
+    ))
+    if calendar["cheapest"]:
+        best = calendar["cheapest"][0]
+        request = request.model_copy(update={
+            "departure_date": best["departure_at"],
+            "return_date": best["return_at"] or request.return_date
+        })
+    return request, calendar
+
+
+def cheapest_destinations(flight_results: Dict[str, Any], budget: float, limit: int) -> List[Dict[str, Any]]:
+    """Самый дешёвый билет в бюджете до каждого направления, по возрастанию цены."""
+    best: Dict[str, Dict[str, Any]] = {}
+    for f in flight_results.get("data") or []:
+        code = f.get("destination")
+        price = f.get("price", 0)
+        if code and price <= budget and (code not in best or price < best[code]["price"]):
+            best[code] = f
+    return sorted(best.values(), key=lambda f: f["price"])[:limit]
+
+
+def _destination_entry(request, flight: Dict[str, Any], city: str,
+                       task: asyncio.Task, check_out: str) -> Dict[str, Any]:
+    entry = {
+        "city": city,
+        "code": flight["destination"],
+        "flight_price": flight["price"],
+        "hotel": None,
+        "hotel_price": None,
+        "total": None,
+        "hotels_loaded": task.done() and not task.cancelled() and task.exception() is None,
+    }
+    if not entry["hotels_loaded"]:
+        return entry
+    budget_hotels_usd = (request.budget - flight["price"]) / USD_TO_RUB
+    hotels = filter_hotels(
+        task.result(), budget_hotels_usd, request.departure_date, check_out,
+        request.adults + request.children + request.infants,
+        max_results=1, sort_by="price"
+    )
+    if hotels:
+        hotel_price = hotels[0]["total_price"] / 100 * USD_TO_RUB
+        entry.update(hotel=hotels[0]["name"], hotel_price=hotel_price, total=flight["price"] + hotel_price)
+    return entry
+
+
+async def rank_destinations(request, timings: StageTimings) -> List[Dict[str, Any]]:
+    """Направления из города вылета, отсортированные по цене билета и отеля.
+
+    Каталоги отелей всех кандидатов грузятся одновременно с общим сроком
+    EXPLORE_DEADLINE; не успевшие направления остаются в списке с ценой
+    одного билета. Незавершённые загрузки продолжаются в фоне и попадут в кэш.
+    """
+    flight_results = await timings.measure("explore_flights", within(search_flights_async(
+        origin_input=request.departure_city,
+        destination_input=None,
+        departure_date=request.departure_date,
+        return_date=request.return_date,
+        is_one_way=request.is_one_way,
+        direct=request.direct_flights,
+        adult=request.adults,
+        child=request.children,
+        infant=request.infants,
+        limit=EXPLORE_FLIGHTS_LIMIT
+    )))
+    candidates = cheapest_destinations(flight_results, request.budget, EXPLORE_CANDIDATES)
+    if not candidates:
+        raise HTTPException(status_code=404, detail="Не нашлось направлений в рамках бюджета")
+
+    resolver = registry.city_resolver
+    cities = [resolver.city_name(f["destination"]) for f in candidates]
+    start = time.perf_counter()
+    catalog_tasks = [asyncio.create_task(load_catalog(city)) for city in cities]
+    # Остаток срока запроса нужен ещё билетам, отелям и LLM выбранного направления
+    try:
+        timeout = timeout_for(EXPLORE_DEADLINE, reserve=DEADLINE_RESERVE)
+    except DeadlineExceeded:
+        timeout = 0
+    _, pending = await asyncio.wait(catalog_tasks, timeout=timeout)
+    timings.record("explore_hotels", start)
+    for task in pending:
+        _discard(task)
+
+    check_out = check_out_date(request)
+    ranking = [
+        _destination_entry(request, flight, city, task, check_out)
+        for flight, city, task in zip(candidates, cities, catalog_tasks)
+    ]
+    # Сначала направления, где бюджета хватает и на билет, и на отель
+    ranking.sort(key=lambda e: (e["total"] is None, e["total"] or e["flight_price"]))
+    return ranking
+
+
+async def pick_destination(request, timings: StageTimings):
+    """Режим «куда угодно»: запрос с лучшим направлением и рейтинг направлений."""
+    ranking = await rank_destinations(request, timings)
+    return request.model_copy(update={"destination_city": ranking[0]["city"]}), ranking
+
+
+def select_flights(request, sample: Dict[str, Any]):
+    """Три случайных билета в бюджете и остаток бюджета на отели в USD."""
+    if not sample["received"]:
+        raise HTTPException(status_code=404, detail="No flights found")
+    if not sample["affordable"]:
+        raise HTTPException(status_code=400, detail="Бюджета недостаточно для билетов")
+
+    remaining_budget = request.budget - sample["cheapest"]
+
+    # Convert budget to USD for hotel search
+    budget_hotels_usd = remaining_budget / USD_TO_RUB if remaining_budget > 0 else 0
+    return sample["selected"], budget_hotels_usd
+
+
+async def select_hotels(request, catalog_task: asyncio.Task, budget_hotels_usd: float,
+                        check_out: str, timings: StageTimings) -> List[Dict[str, Any]]:
+    """Топ-3 отеля в оставшемся бюджете; каталог грузится заранее.
+
+    Каталог ждётся, пока до срока запроса остаётся LLM_MIN_BUDGET; дальше
+    используется сохранённая копия, а без неё — DeadlineExceeded.
+    """
+    if budget_hotels_usd <= 0:
+        _discard(catalog_task)
+        return []
+    try:
+        catalog = await within(catalog_task, reserve=LLM_MIN_BUDGET)
+    except DeadlineExceeded:
+        catalog = await asyncio.to_thread(cached_city_catalog, request.destination_city)
+        if catalog is None:
+            raise
+    hotel_list = timings.measure_sync(
+        "hotel_filter", filter_hotels,
+        catalog,
+        budget_hotels_usd,
+        request.departure_date,
+        check_out,
+        request.adults + request.children + request.infants
+    )
+    # Keep hotel prices in USD without converting to rubles
+    return hotel_list[:3]  # Get top 3 hotels with most detailed info
+
+
+async def llm_section(section: str, run: Union[asyncio.Task, Callable[[], Awaitable[str]]],
+                      skipped: List[str]) -> Optional[str]:
+    """Ответ LLM-секции или None, если её пришлось пропустить.
+
+    Уже запущенная секция (задача) ждётся до срока запроса; новая (функция)
+    не запускается, если до срока меньше LLM_MIN_BUDGET. Недоступная модель
+    (открыт автомат) тоже означает пропуск секции.
+    """
+    try:
+        if not isinstance(run, asyncio.Task):
+            timeout_for(None, reserve=LLM_MIN_BUDGET)
+            run = run()
+        return await within(run)
+    except (DeadlineExceeded, ProviderUnavailable):
+        skipped.append(section)
+        return None
+
+
+async def hotels_section(request, catalog_task: asyncio.Task, budget_hotels_usd: float,
+                         check_out: str, timings: StageTimings, skipped: List[str]) -> List[Dict[str, Any]]:
+    """select_hotels, но без каталога к сроку секция отелей пропускается."""
+    try:
+        return await select_hotels(request, catalog_task, budget_hotels_usd, check_out, timings)
+    except DeadlineExceeded:
+        skipped.append("hotels")
+        return []
+
+
+def calendar_grid(calendar: Dict[str, Any]) -> Dict[str, Any]:
+    """Календарь цен для JSON: матрица списками вместо словарей с ключом None."""
+    return {
+        "departures": calendar["departures"],
+        "returns": calendar["returns"],
+        "prices": [[calendar["matrix"][dep][ret] for ret in calendar["returns"]] for dep in calendar["departures"]],
+        "cheapest": calendar["cheapest"],
+    }
+
+
+async def run_recommendation(request, timings: StageTimings,
+                             progress: Optional[Callable[[str, str], None]] = None) -> Dict[str, Any]:
+    """Конвейер /recommend с учётом зависимостей между этапами.
+
+    Перелёты, каталог отелей города и чеклист не зависят друг от друга
+    и стартуют сразу. Ждать самый дешёвый билет нужно только фильтру
+    отелей по оставшемуся бюджету и рекомендации, которой нужны оба списка.
+    При гибких датах перелёты и чеклист ждут выбора дат по календарю цен,
+    а без города назначения всё ждёт выбора направления (pick_destination).
+
+    Весь конвейер укладывается в RECOMMEND_DEADLINE: срок передаётся во все
+    этапы через контекст. Без билетов ответа нет (DeadlineExceeded), а
+    календарь цен, отели и LLM-секции при нехватке времени пропускаются —
+    их список в result["skipped"].
+
+    progress(section, markdown), если задан, получает каждую секцию
+    (flights, hotels, checklist, recommendation), как только она готова:
+    так задачи /jobs показывают ответ по частям.
+
+    Возвращает структурированный результат; Markdown из него строит
+    render.render_markdown.
+    """
+    report = progress or (lambda section, markdown: None)
+    use_deadline(RECOMMEND_DEADLINE)
+    tasks = []
+    skipped: List[str] = []
+    result: Dict[str, Any] = {"destinations": None, "calendar": None, "skipped": skipped}
+
+    try:
+        if not request.destination_city:
+            request, result["destinations"] = await pick_destination(request, timings)
+
+        catalog_task = start_catalog(request, timings)
+        tasks.append(catalog_task)
+        if request.flex_days:
+            try:
+                request, calendar = await within(pick_cheapest_dates(request, timings), reserve=DEADLINE_RESERVE)
+                result["calendar"] = calendar_grid(calendar)
+            except DeadlineExceeded:
+                skipped.append("calendar")
+
+        flights_task = start_flights(request, timings)
+        checklist_task = asyncio.create_task(timings.measure("llm_checklist", checklist(request)))
+        tasks += [flights_task, checklist_task]
+        checklist_task.add_done_callback(
+            lambda task: task.cancelled() or task.exception() or report("checklist", task.result())
+        )
+
+        selected_flights, budget_hotels_usd = select_flights(request, await within(flights_task))
+        flights_md = intro_markdown(result) + flights_markdown(selected_flights)
+        report("flights", flights_md)
+        check_out = check_out_date(request)
+        hotels = await hotels_section(request, catalog_task, budget_hotels_usd, check_out, timings, skipped)
+        result.update(
+            destination_city=request.destination_city,
+            departure_date=request.departure_date,
+            return_date=request.return_date,
+            flights=selected_flights,
+            hotels=hotels,
+            nights=stay_nights(request, check_out)
+        )
+
+        hotels_md = hotels_markdown(hotels, result["nights"], "hotels" in skipped)
+        report("hotels", hotels_md)
+        result["recommendation"] = await llm_section("recommendation", lambda: timings.measure(
+            "llm_recommendation", ask_llm(recommendation_prompt(flights_md, hotels_md))
+        ), skipped)
+        report("recommendation", SKIPPED if result["recommendation"] is None else result["recommendation"])
+        result["checklist"] = await llm_section("checklist", checklist_task, skipped)
+    except BaseException:
+        for task in tasks:
+            _discard(task)
+        raise
+
+    return result
+
+
+async def _pump_llm(section: str, prompt: str, queue: asyncio.Queue, timings: StageTimings) -> str:
+    """Перекладывает токены ответа модели в очередь событий; возвращает весь ответ."""
+    start = time.perf_counter()
+    tokens = []
+    try:
+        async with provider_slot("llm"):
+            async for token in llm_client.stream(prompt, timeout=timeout_for(LLM_TIMEOUT)):
+                tokens.append(token)
+                await queue.put((section, {"delta": token}))
+    finally:
+        timings.record(f"llm_{section}", start)
+    return "".join(tokens)
+
+
+async def _stream_checklist(request, queue: asyncio.Queue, timings: StageTimings) -> None:
+    """Чеклист из кэша одним куском или по токенам от модели с записью в кэш."""
+    prompt = checklist_prompt(request)
+    cached = await checklist_cache.get_async(prompt)
+    if cached is not None:
+        await queue.put(("checklist", {"delta": cached}))
+        return
+    await checklist_cache.set_async(prompt, await _pump_llm("checklist", prompt, queue, timings))
+
+
+async def stream_recommendation(request, timings: StageTimings) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Потоковый вариант run_recommendation: пары (событие, данные).
+
+    Перелёты отдаются сразу после ответа API, затем отели, затем токены
+    рекомендации и чеклиста по мере генерации (секции могут чередоваться).
+    Срок и пропуск секций — как в run_recommendation; пропущенные секции
+    перечисляются в событии skipped перед timings.
+    """
+    deadline = use_deadline(RECOMMEND_DEADLINE)
+    queue: asyncio.Queue = asyncio.Queue()
+    tasks = []
+    skipped: List[str] = []
+
+    try:
+        intro_md = ""
+        if not request.destination_city:
+            request, ranking = await pick_destination(request, timings)
+            intro_md += destinations_markdown(ranking)
+            yield "destinations", {"destinations": ranking, "markdown": intro_md}
+
+        catalog_task = start_catalog(request, timings)
+        tasks.append(catalog_task)
+        if request.flex_days:
+            try:
+                request, calendar = await within(pick_cheapest_dates(request, timings), reserve=DEADLINE_RESERVE)
+            except DeadlineExceeded:
+                skipped.append("calendar")
+            else:
+                intro_md += calendar_markdown(calendar)
+                yield "calendar", calendar_grid(calendar)
+
+        flights_task = start_flights(request, timings)
+        checklist_task = asyncio.create_task(_stream_checklist(request, queue, timings))
+        tasks += [flights_task, checklist_task]
+
+        selected_flights, budget_hotels_usd = select_flights(request, await within(flights_task))
+        flights_md = intro_md + flights_markdown(selected_flights)
+        yield "flights", {"flights": selected_flights, "markdown": flights_md}
+
+        check_out = check_out_date(request)
+        hotels = await hotels_section(request, catalog_task, budget_hotels_usd, check_out, timings, skipped)
+        hotels_md = hotels_markdown(hotels, stay_nights(request, check_out), "hotels" in skipped)
+        yield "hotels", {"hotels": hotels, "markdown": hotels_md}
+
+        sections = {checklist_task: "checklist"}
+        if deadline.remaining() >= LLM_MIN_BUDGET:
+            recommendation_task = asyncio.create_task(
+                _pump_llm("recommendation", recommendation_prompt(flights_md, hotels_md), queue, timings)
+            )
+            tasks.append(recommendation_task)
+            sections[recommendation_task] = "recommendation"
+        else:
+            skipped.append("recommendation")
+        pending = set(sections)
+        while pending or not queue.empty():
+            if queue.empty():
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    pending | {getter}, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Срок вышел: недописанные секции обрываются
+                    for task in pending:
+                        _discard(task)
+                        skipped.append(sections[task])
+                    pending = set()
+                for task in done - {getter}:
+                    pending.discard(task)
+                    try:
+                        task.result()
+                    except (DeadlineExceeded, ProviderUnavailable):
+                        skipped.append(sections[task])
+                if getter not in done:
+                    getter.cancel()
+                    continue
+                section, data = getter.result()
+            else:
+                section, data = queue.get_nowait()
+            yield section, data
+        if skipped:
+            yield "skipped", {"sections": skipped}
+        yield "timings", timings.as_dict()
+    finally:
+        for task in tasks:
+            _discard(task)
@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import threading
+from collections import Counter, deque
+from datetime import date
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from avia_parser import (
+    FLIGHT_PAGE_SIZE, FLIGHT_PREFETCH_PAGES, _fetch_prices_limited, build_flight_params,
+    flight_cache, flight_cache_key, flight_calls, resolve_search
+)
+from cache import CACHES
+from hotels_request import city_catalog_cost, city_catalog_ttl_left, warm_city_catalog
+from pipeline import EXPLORE_FLIGHTS_LIMIT, ask_llm, checklist_cache, checklist_prompt
+from reference_data import DATA_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows: журнал пишет один процесс
+    fcntl = None
+
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+# Журнал запросов /recommend: одна строка JSON на запрос, как requests.jsonl и workload.jsonl
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", os.path.join(DATA_DIR, "data_cache", "requests.jsonl"))
+QUERY_LOG_LINES = int(os.getenv("QUERY_LOG_LINES", "5000"))
+# Какие запросы считаются недавними
+PREFETCH_WINDOW = float(os.getenv("PREFETCH_WINDOW", str(24 * 3600)))
+PREFETCH_INTERVAL = float(os.getenv("PREFETCH_INTERVAL", "300"))
+# Сколько запросов к внешним API можно сделать за один проход
+PREFETCH_BUDGET = int(os.getenv("PREFETCH_BUDGET", "40"))
+# Сколько самых частых ключей каждого вида держать тёплыми и с какой частоты
+PREFETCH_TOP = int(os.getenv("PREFETCH_TOP", "20"))
+PREFETCH_MIN_REQUESTS = int(os.getenv("PREFETCH_MIN_REQUESTS", "2"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+
+
+class QueryLog:
+    """Недавние запросы /recommend в памяти и в файле формата requests.jsonl.
+
+    Каждая строка — тело запроса и время ts. Строки копятся в памяти
+    и дописываются в файл пачкой (flush); файл переписывается, когда
+    становится вдвое длиннее QUERY_LOG_LINES. Ждут записи не больше
+    max_lines строк: если flush долго не было, старые не попадут в файл.
+    Без прогрева (enabled=False) журнал не ведётся.
+
+    Файл общий для воркеров uvicorn (--workers N): запись и обрезка идут
+    под блокировкой файла path + ".lock", а после flush недавние запросы
+    перечитываются из файла, так что прогрев видит запросы всех воркеров.
+    """
+
+    def __init__(self, path: str = QUERY_LOG_PATH, max_lines: int = QUERY_LOG_LINES,
+                 enabled: bool = PREFETCH_ENABLED):
+        self.path = path
+        self.max_lines = max_lines
+        self.enabled = enabled
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=max_lines)
+        self._pending: Deque[str] = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+
+    def _tail(self) -> Tuple[int, List[str]]:
+        """Число строк в файле и последние max_lines из них."""
+        lines: Deque[str] = deque(maxlen=self.max_lines)
+        count = 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    lines.append(line)
+                    count += 1
+        except FileNotFoundError:
+            pass
+        return count, list(lines)
+
+    def _reload(self, lines: List[str]) -> None:
+        with self._lock:
+            # Записанные после снимка pending ещё не в файле, но уже недавние
+            lines = lines + list(self._pending)
+            self.recent.clear()
+            for line in lines[-self.max_lines:]:
+                try:
+                    self.recent.append(json.loads(line))
+                except ValueError:
+                    continue
+
+    def load(self) -> None:
+        self._reload(self._tail()[1])
+
+    def record(self, query: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        entry = dict(query, ts=round(time.time(), 3))
+        with self._lock:
+            self.recent.append(entry)
+            self._pending.append(json.dumps(entry, ensure_ascii=False))
+
+    def flush(self) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            pending = list(self._pending)
+            self._pending.clear()
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if pending:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(line + "\n" for line in pending))
+            count, lines = self._tail()
+            if count > self.max_lines * 2:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w", encoding="utf-8") as f:
+                        f.write("".join(lines))
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+        self._reload(lines)
+
+    def queries(self, window: float = PREFETCH_WINDOW) -> List[Dict[str, Any]]:
+        """Запросы за последние window секунд; строки без ts (workload.jsonl) считаются свежими."""
+        since = time.time() - window
+        with self._lock:
+            return [q for q in self.recent if q.get("ts", since) >= since]
+
+
+class Warmup:
+    """Один ключ, который держится тёплым: что обновить и сколько это стоит.
+
+    cost — оценка сверху числа запросов к внешним API для refresh; она
+    считается перед каждым проходом, потому что зависит от того, что уже
+    есть в кэшах (например, известен ли locationId города).
+    """
+
+    def __init__(self, kind: str, key: str, cost: Callable[[], int],
+                 ttl_left: Callable[[], Optional[float]], refresh: Callable[[], Awaitable[int]]):
+        self.kind = kind
+        self.key = key
+        self.cost = cost
+        self.ttl_left = ttl_left
+        self.refresh = refresh
+        self.requests = 0
+        self.warmed_at: Optional[float] = None
+        self.refreshes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        ttl_left = self.ttl_left()
+        return {
+            "kind": self.kind,
+            "key": self.key,
+            "requests": self.requests,
+            "ttl_left": round(ttl_left, 1) if ttl_left is not None else None,
+            "refreshes": self.refreshes,
+            "warmed_at": self.warmed_at,
+        }
+
+
+def _flights_warmup(search: Dict[str, Any], limit: int, pages: int) -> Warmup:
+    page_params = [build_flight_params(**search, limit=limit, page=page) for page in range(1, pages + 1)]
+    keys = [flight_cache_key(params) for params in page_params]
+
+    def ttl_left() -> Optional[float]:
+        left = [flight_cache.ttl_left(key) for key in keys]
+        return None if None in left else min(left)
+
+    async def refresh() -> int:
+        for key, params in zip(keys, page_params):
+            result = await flight_calls.do(key, lambda params=params: _fetch_prices_limited(params))
+            await flight_cache.set_async(key, result, prefetched=True)
+        return len(keys)
+
+    route = f"{search['origin']}-{search['destination'] or '*'} {search['departure_at']}/{search['return_at'] or '—'}"
+    return Warmup("flights", route, lambda: len(keys), ttl_left, refresh)
+
+
+def _catalog_warmup(city: str, ahead: float) -> Warmup:
+    async def refresh() -> int:
+        return await asyncio.to_thread(warm_city_catalog, city, ahead)
+
+    return Warmup("hotel_catalog", city, lambda: city_catalog_cost(city),
+                  lambda: city_catalog_ttl_left(city), refresh)
+
+
+def _checklist_warmup(request) -> Warmup:
+    prompt = checklist_prompt(request)
+
+    async def refresh() -> int:
+        await checklist_cache.set_async(prompt, await ask_llm(prompt), prefetched=True)
+        return 1
+
+    key = f"{request.destination_city} {request.departure_date}/{request.return_date or '—'} " \
+          f"{request.adults}+{request.children} {','.join(request.preferences)}"
+    return Warmup("checklist", key, lambda: 1, lambda: checklist_cache.ttl_left(prompt), refresh)
+
+
+def request_warmups(request, ahead: float) -> List[Warmup]:
+    """Что понадобится /recommend для этого запроса: билеты, каталог города, чеклист.
+
+    Для прошедших дат прогревать нечего.
+    """
+    search = resolve_search(
+        request.departure_city, request.destination_city, request.departure_date, request.return_date,
+        request.is_one_way, request.direct_flights, request.adults, request.children, request.infants
+    )
+    if search["departure_at"] < date.today().isoformat():
+        return []
+    if not request.destination_city:
+        # «Куда угодно»: одна выборка направлений, остальное зависит от её результата
+        return [_flights_warmup(search, EXPLORE_FLIGHTS_LIMIT, 1)]
+    return [
+        _flights_warmup(search, FLIGHT_PAGE_SIZE, FLIGHT_PREFETCH_PAGES),
+        _catalog_warmup(request.destination_city, ahead),
+        _checklist_warmup(request),
+    ]
+
+
+class PrefetchScheduler:
+    """Фоновый прогрев кэшей для популярных запросов.
+
+    Раз в interval секунд берёт запросы из журнала за PREFETCH_WINDOW,
+    выбирает по каждому виду (билеты по маршруту и датам, каталог города,
+    чеклист) до top самых частых ключей и обновляет те, что устареют
+    раньше следующего прохода. Самые частые — первыми, пока не кончится
+    budget запросов к внешним API.
+    """
+
+    def __init__(self, log: QueryLog, parse: Callable[[Dict[str, Any]], Any],
+                 interval: float = PREFETCH_INTERVAL, budget: int = PREFETCH_BUDGET,
+                 top: int = PREFETCH_TOP, min_requests: int = PREFETCH_MIN_REQUESTS,
+                 concurrency: int = PREFETCH_CONCURRENCY):
+        self.log = log
+        self.parse = parse
+        self.interval = interval
+        self.budget = budget
+        self.top = top
+        self.min_requests = min_requests
+        self.concurrency = concurrency
+        # Обновлять заранее: запись должна дожить до следующего прохода с запасом
+        self.ahead = interval * 1.5
+
+        self.warm: Dict[tuple, Warmup] = {}
+        self.runs = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_calls = 0
+        self.calls = 0
+        self.errors = 0
+        self.skipped_budget = 0
+
+    def hot(self) -> List[Warmup]:
+        """Самые частые ключи по журналу, по убыванию частоты."""
+        counts: Counter = Counter()
+        found: Dict[tuple, Warmup] = {}
+        for query in self.log.queries():
+            try:
+                warmups = request_warmups(self.parse(query), self.ahead)
+            except Exception:
+                continue
+            for warmup in warmups:
+                ident = (warmup.kind, warmup.key)
+                counts[ident] += 1
+                found.setdefault(ident, warmup)
+
+        selected: List[Warmup] = []
+        per_kind: Counter = Counter()
+        for ident, n in counts.most_common():
+            if n < self.min_requests or per_kind[ident[0]] >= self.top:
+                continue
+            per_kind[ident[0]] += 1
+            warmup = self.warm.get(ident) or found[ident]
+            warmup.requests = n
+            selected.append(warmup)
+        self.warm = {(w.kind, w.key): w for w in selected}
+        return selected
+
+    def plan(self) -> List[Tuple[Warmup, int]]:
+        """Ключи, которые устареют до следующего прохода, с оценкой стоимости, в пределах budget.
+
+        Сроки и стоимость читаются из кэшей (при CACHE_BACKEND=sqlite — из
+        базы), поэтому вызывается в потоке.
+        """
+        due = [w for w in self.hot() if (w.ttl_left() or 0) < self.ahead]
+        planned, spent = [], 0
+        for warmup in due:
+            cost = warmup.cost()
+            if spent + cost > self.budget:
+                self.skipped_budget += 1
+                continue
+            planned.append((warmup, cost))
+            spent += cost
+        return planned
+
+    async def run_once(self) -> int:
+        """Один проход; возвращает число запросов к внешним API."""
+        await asyncio.to_thread(self.log.flush)
+        planned = await asyncio.to_thread(self.plan)
+
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def refresh(warmup: Warmup, cost: int) -> int:
+            async with semaphore:
+                try:
+                    calls = await warmup.refresh()
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Prefetch {warmup.kind} {warmup.key}: {e}")
+                    return cost
+                warmup.refreshes += 1
+                warmup.warmed_at = round(time.time(), 3)
+                return calls
+
+        calls = sum(await asyncio.gather(*(refresh(w, cost) for w, cost in planned)))
+        self.runs += 1
+        self.last_run_at = round(time.time(), 3)
+        self.last_run_calls = calls
+        self.calls += calls
+        return calls
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.errors += 1
+                print(f"Ошибка фонового прогрева: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, Any]:
+        contribution = {}
+        for name in ("flights", "hotel_catalogs", "checklists"):
+            cache = CACHES[name]
+            lookups = cache.hits + cache.stale_hits + cache.misses
+            contribution[name] = {
+                "prefetch_hits": cache.prefetch_hits,
+                "lookups": lookups,
+                "hit_rate_from_prefetch": round(cache.prefetch_hits / lookups, 4) if lookups else 0.0,
+            }
+        return {
+            "enabled": PREFETCH_ENABLED,
+            "interval": self.interval,
+            "budget": self.budget,
+            "queries": len(self.log.queries()),
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_run_calls": self.last_run_calls,
+            "calls": self.calls,
+            "errors": self.errors,
+            "skipped_budget": self.skipped_budget,
+            "keys": [w.stats() for w in self.warm.values()],
+            "contribution": contribution,
+        }
+
+
+query_log = QueryLog()
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from city_resolver import CityResolver
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+CITY_CODES_FILE = os.path.join(DATA_DIR, "city2code.json")
+AIRLINES_FILE = os.path.join(DATA_DIR, "airlines.json")
+
+# Как часто фоновая задача проверяет mtime справочников
+RELOAD_CHECK_INTERVAL = float(os.getenv("REFERENCE_RELOAD_INTERVAL", "30"))
+
+
+# Загрузка справочника городов
+def load_city_codes(file_path=CITY_CODES_FILE):
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print("Файл city2code.json не найден.")
+        return {}
+
+
+# Загрузка данных об авиакомпаниях из JSON
+def load_airline_data(file_path=AIRLINES_FILE):
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return {item["code"]: item for item in json.load(f)}
+    except FileNotFoundError:
+        return {}
+
+
+def build_city_resolver(file_path: str) -> CityResolver:
+    codes = load_city_codes(file_path)
+    # Коды повторяются у разных городов, интернируем их
+    return CityResolver({name: sys.intern(code) for name, code in codes.items()})
+
+
+def build_airline_names(file_path: str) -> Dict[str, str]:
+    """Компактный справочник авиакомпаний: код -> отображаемое название."""
+    names = {}
+    for code, item in load_airline_data(file_path).items():
+        if item.get("name") and item["name"] != "null":
+            names[sys.intern(code)] = item["name"]
+        else:
+            names[sys.intern(code)] = (item.get("name_translations") or {}).get(
+                "en", "Неизвестная авиакомпания"
+            )
+    return names
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Приблизительный объём объекта в памяти вместе с содержимым."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+class ReferenceFile:
+    """Один справочник: путь, построитель и загруженное значение."""
+
+    def __init__(self, path: str, builder: Callable[[str], Any]):
+        self.path = path
+        self.builder = builder
+        self.value: Any = None
+        self.mtime: Optional[float] = None
+        self.load_seconds = 0.0
+        self.size_bytes = 0
+        self.loads = 0
+
+    def _current_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> None:
+        mtime = self._current_mtime()
+        start = time.perf_counter()
+        value = self.builder(self.path)
+        self.load_seconds = time.perf_counter() - start
+        self.size_bytes = deep_sizeof(value)
+        self.value, self.mtime = value, mtime
+        self.loads += 1
+
+    def is_stale(self) -> bool:
+        return self.value is None or self._current_mtime() != self.mtime
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "loaded": self.value is not None,
+            "mtime": self.mtime,
+            "loads": self.loads,
+            "load_ms": round(self.load_seconds * 1000, 2),
+            "size_bytes": self.size_bytes,
+        }
+
+
+class ReferenceData:
+    """Справочники процесса, загружаемые один раз.
+
+    Загрузка выполняется при старте API (или лениво при первом обращении
+    из скрипта). Горячий путь только читает атрибуты; проверку mtime и
+    перезагрузку делает фоновая задача watch().
+    """
+
+    def __init__(self, city_codes_file: str = CITY_CODES_FILE,
+                 airlines_file: str = AIRLINES_FILE):
+        self._files = {
+            "city_codes": ReferenceFile(city_codes_file, build_city_resolver),
+            "airlines": ReferenceFile(airlines_file, build_airline_names),
+        }
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> Any:
+        ref = self._files[name]
+        if ref.value is None:
+            with self._lock:
+                if ref.value is None:
+                    ref.load()
+        return ref.value
+
+    @property
+    def city_resolver(self) -> CityResolver:
+        return self._get("city_codes")
+
+    @property
+    def airline_names(self) -> Dict[str, str]:
+        return self._get("airlines")
+
+    def load(self) -> None:
+        with self._lock:
+            for ref in self._files.values():
+                ref.load()
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает справочники, у которых изменился mtime."""
+        reloaded = False
+        with self._lock:
+            for ref in self._files.values():
+                if ref.is_stale():
+                    ref.load()
+                    reloaded = True
+        return reloaded
+
+    async def watch(self, interval: float = RELOAD_CHECK_INTERVAL) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception as e:
+                print(f"Ошибка перезагрузки справочников: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: ref.stats() for name, ref in self._files.items()}
+
+
+registry = ReferenceData()
@@ -0,0 +1,137 @@
+import hashlib
+from string import Template
+from typing import Any, Dict, List, Optional
+
+# Примерный курс доллара для конвертации цен отелей в рубли
+USD_TO_RUB = 90.0
+
+# Шаблоны разбираются один раз при импорте; $$ — знак доллара
+FLIGHT = Template(
+    "### Перелёт $n: $airline\n"
+    "* **Цена:** $$$price\n"
+    "* **Вылет:** $departure_time\n"
+    "* **Возвращение:** $arrival_time\n"
+    "* **Пересадки:** $transfers\n"
+    "* **Ссылка:** $link"
+)
+HOTEL = Template(
+    "### Отель $n: $name\n"
+    "* **Рейтинг:** $rating/10\n"
+    "* **Звезд:** $stars\n"
+    "* **Цена за ночь:** $$$per_night\n"
+    "* **Общая стоимость ($nights ночей):** $$$total\n"
+    "* **Адрес:** $address\n"
+)
+HOTEL_URL = Template("* **Ссылка:** $url\n")
+HOTEL_PHOTO = Template("* **Фото:** ![$name]($photo)\n")
+DATE_ROW = Template("| $departure | $return_ | $$$price |")
+DESTINATION_ROW = Template("| $city ($code) | $$$flight | $hotel | $total |")
+RESULT = Template("""
+## 🛫 Авиабилеты
+$flights
+
+## 🏨 Отели
+$hotels
+
+---
+
+## 🤖 Рекомендации по перелетам и отелям
+
+$recommendation
+
+---
+
+## 📋 Чеклист путешественника
+
+$checklist
+""")
+
+NO_HOTELS = "*Бюджета не хватает на отели.*"
+SKIPPED = "*Раздел не успел подготовиться к сроку ответа, повторите запрос позже.*"
+
+
+def usd(rub: float) -> str:
+    return f"{rub / USD_TO_RUB:.2f}"
+
+
+def flights_markdown(flights: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(
+        FLIGHT.substitute(f, n=i + 1, price=usd(f["price"]))
+        for i, f in enumerate(flights)
+    )
+
+
+def hotels_markdown(hotels: List[Dict[str, Any]], nights: int, skipped: bool = False) -> str:
+    if skipped:
+        return SKIPPED
+    if not hotels:
+        return NO_HOTELS
+    parts = []
+    for i, h in enumerate(hotels):
+        parts.append(HOTEL.substitute(
+            h, n=i + 1, nights=nights,
+            stars="⭐" * int(h["stars"]),
+            per_night=f"{h['per_night']:.2f}",
+            total=f"{h['total_price'] / 100:.2f}"
+        ))
+        if h["url"]:
+            parts.append(HOTEL_URL.substitute(url=h["url"]))
+        if h["main_photo"]:
+            parts.append(HOTEL_PHOTO.substitute(name=h["name"], photo=h["main_photo"]))
+        parts.append("\n")
+    return "".join(parts)
+
+
+def calendar_markdown(calendar: Optional[Dict[str, Any]]) -> str:
+    if not calendar or not calendar["cheapest"]:
+        return ""
+    rows = "\n".join(
+        DATE_ROW.substitute(departure=c["departure_at"], return_=c["return_at"] or "—", price=usd(c["price"]))
+        for c in calendar["cheapest"]
+    )
+    return (
+        "### 📅 Самые дешёвые даты\n"
+        "| Вылет | Возвращение | Цена |\n"
+        "|---|---|---|\n"
+        f"{rows}\n\n"
+    )
+
+
+def destinations_markdown(ranking: Optional[List[Dict[str, Any]]]) -> str:
+    if not ranking:
+        return ""
+    rows = []
+    for e in ranking:
+        if e["total"] is not None:
+            hotel = f"{e['hotel']}, ${usd(e['hotel_price'])}"
+            total = f"${usd(e['total'])}"
+        else:
+            hotel = "нет отелей в бюджете" if e["hotels_loaded"] else "не успели загрузить"
+            total = "—"
+        rows.append(DESTINATION_ROW.substitute(e, flight=usd(e["flight_price"]), hotel=hotel, total=total))
+    return (
+        "### 🌍 Куда можно полететь\n"
+        "| Направление | Билет | Самый дешёвый отель | Итого |\n"
+        "|---|---|---|---|\n"
+        + "\n".join(rows) + "\n\n"
+    )
+
+
+def intro_markdown(result: Dict[str, Any]) -> str:
+    """Таблицы направлений и дат, которые идут перед списком билетов."""
+    return destinations_markdown(result.get("destinations")) + calendar_markdown(result.get("calendar"))
+
+
+def render_markdown(result: Dict[str, Any]) -> str:
+    """Markdown-представление структурированного ответа /recommend."""
+    skipped = result.get("skipped") or ()
+    return RESULT.substitute(
+        flights=intro_markdown(result) + flights_markdown(result["flights"]),
+        hotels=hotels_markdown(result["hotels"], result["nights"], "hotels" in skipped),
+        recommendation=SKIPPED if result["recommendation"] is None else result["recommendation"],
+        checklist=SKIPPED if result["checklist"] is None else result["checklist"]
+    )
+
+
+def etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# Все группы по имени, для /singleflight/stats
+GROUPS: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов к внешним API.
+
+    Пока вызов по ключу выполняется, остальные вызовы с тем же ключом
+    ждут его результат, а не идут в сеть сами. Ошибку получают все
+    ожидающие; после завершения ключ освобождается (ошибки не кэшируются).
+
+    do() — для корутин (работа идёт в отдельной задаче, отмена одного из
+    ожидающих её не прерывает), do_sync() — для кода в потоках.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._futures: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+        self.errors = 0
+        GROUPS[name] = self
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._tasks.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Идёт ли сейчас вызов по ключу: следующий do() станет ожидающим, а не первым."""
+        return key in self._tasks or key in self._futures
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def do_sync(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._futures[key] = future
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self.errors += 1
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._futures.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._tasks) + len(self._futures),
+            "upstream_calls": self.calls,
+            "saved_calls": self.shared,
+            "errors": self.errors,
+        }
+
+
+def singleflight_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: group.stats() for name, group in GROUPS.items()}
@@ -0,0 +1,73 @@
+"""Автомат ProviderGovernor: прерванный пробный запрос не должен держать пробу.
+
+Запуск из каталога api:
+
+    python -m pytest tests
+"""
+import asyncio
+import time
+
+from governor import ProviderGovernor
+
+
+def half_open_governor() -> ProviderGovernor:
+    """Автомат ждёт пробу, а токенов нет: проба встанет в ожидание token bucket."""
+    governor = ProviderGovernor("test", rate=1, burst=1, max_concurrency=4, cooldown=0)
+    governor.state = "open"
+    governor._opened_at = time.monotonic() - 1
+    governor._tokens = -5
+    return governor
+
+
+def test_probe_cancelled_during_token_wait_is_released():
+    governor = half_open_governor()
+
+    async def call():
+        async with governor.slot():
+            pass
+
+    async def run():
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert governor.state == "half_open"
+    assert not governor._probing
+    assert governor.in_flight == 0
+
+
+def test_sync_probe_interrupted_during_token_wait_is_released(monkeypatch):
+    governor = half_open_governor()
+
+    def interrupted(seconds):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(time, "sleep", interrupted)
+    try:
+        with governor.sync_slot():
+            pass
+    except KeyboardInterrupt:
+        pass
+    assert not governor._probing
+    assert governor.in_flight == 0
+
+
+def test_next_request_probes_after_cancelled_probe():
+    governor = half_open_governor()
+
+    async def call():
+        async with governor.slot():
+            pass
+
+    async def run():
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        governor._tokens = governor.burst
+        await call()
+
+    asyncio.run(run())
+    assert governor.state == "closed"
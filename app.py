@@ -2,7 +2,55 @@ import streamlit as st
 import requests
 import datetime
 from datetime import timedelta
-import json
+import time
+
+API_URL = "http://api:8000"
+# Сколько секунд API держит один запрос результата (long-poll) и сколько ждём всего
+JOB_POLL_WAIT = 20
+JOB_TIMEOUT = 300
+
+
+@st.cache_resource
+def api_session():
+    """Общая сессия с пулом соединений к API для всех пользователей приложения."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=64)
+    session.mount("http://", adapter)
+    return session
+
+
+SECTION_TITLES = {
+    "flights": "## 🛫 Авиабилеты\n",
+    "hotels": "## 🏨 Отели\n",
+    "recommendation": "---\n## 🤖 Рекомендации по перелетам и отелям\n\n",
+    "checklist": "---\n## 📋 Чеклист путешественника\n\n",
+}
+
+
+def wait_for_result(session, job, status_box, section_boxes):
+    """Ждёт результат задачи короткими long-poll запросами; возвращает последний ответ.
+
+    Готовые секции показываются сразу: с seen API отвечает 202, как только
+    появляется новая секция, и она выводится в свой блок section_boxes.
+    """
+    result_url = f"{API_URL}/jobs/{job['job_id']}/result"
+    stop_at = time.monotonic() + JOB_TIMEOUT
+    while True:
+        sections = job.get("sections", {})
+        for section, markdown in sections.items():
+            section_boxes[section].markdown(SECTION_TITLES[section] + markdown, unsafe_allow_html=True)
+        if job.get("status") == "queued":
+            status_box.caption(f"Запрос в очереди, перед вами: {job['position'] - 1}")
+        else:
+            status_box.caption("Готовим рекомендации...")
+        response = session.get(
+            result_url,
+            params={"wait": JOB_POLL_WAIT, "seen": len(sections), "format": "markdown"},
+            timeout=(5, JOB_POLL_WAIT + 10)
+        )
+        if response.status_code != 202 or time.monotonic() > stop_at:
+            return response
+        job = response.json()
 
 # Set page configuration
 st.set_page_config(
@@ -21,7 +69,7 @@ with st.form("travel_form"):
     
     with col1:
         departure_city = st.text_input("Город отправления", "Москва")
-        destination_city = st.text_input("Город назначения", "")
+        destination_city = st.text_input("Город назначения (пусто — куда угодно)", "")
         
         # Get today's date for defaults and validation
         today = datetime.date.today()
@@ -80,11 +128,8 @@ with st.form("travel_form"):
 
 # Process form submission
 if submitted:
-    # Check if destination city is provided
-    if not destination_city:
-        st.error("Пожалуйста, укажите город назначения.")
     # Check if preferences are selected
-    elif not preferences:
+    if not preferences:
         st.error("Пожалуйста, выберите хотя бы одно предпочтение.")
     else:
         with st.spinner('Получение рекомендаций...'):
@@ -92,7 +137,7 @@ if submitted:
                 # Prepare request payload
                 payload = {
                     "departure_city": departure_city,
-                    "destination_city": destination_city,
+                    "destination_city": destination_city or None,
                     "departure_date": departure_date.strftime('%Y-%m-%d'),
                     "return_date": None if is_one_way else return_date.strftime('%Y-%m-%d'),
                     "flight_class": flight_class,
@@ -105,38 +150,29 @@ if submitted:
                     "preferences": preferences
                 }
                 
-                # Make API request
-                response = requests.post(
-                    "http://api:8000/recommend",
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=60  # Increase timeout to 60 seconds
-                )
-                
-                if response.status_code == 200:
-                    # Process the response sections separately for better rendering
-                    response_text = response.text
-                    
-                    # Split the response into sections
-                    sections = response_text.split('---')
-                    
-                    if len(sections) >= 3:
-                        # Flights and hotels info
-                        st.markdown(sections[0], unsafe_allow_html=True)
-                        
-                        # Recommendations
-                        st.markdown("---")
-                        st.markdown(sections[1], unsafe_allow_html=True)
-                        
-                        # Checklist section
-                        st.markdown("---")
-                        st.markdown(sections[2], unsafe_allow_html=True)
-                    else:
-                        # Fallback if the response format is unexpected
-                        st.markdown(response_text, unsafe_allow_html=True)
-                else:
+                # Запрос выполняется задачей в API: поток Streamlit не держит
+                # одно соединение на всё время работы LLM, а опрашивает результат
+                session = api_session()
+                response = session.post(f"{API_URL}/jobs", json=payload, timeout=(5, 10))
+                if response.status_code != 202:
                     st.error(f"Ошибка: {response.status_code} - {response.text}")
-                    
+                else:
+                    status_box = st.empty()
+                    section_boxes = {section: st.empty() for section in SECTION_TITLES}
+                    response = wait_for_result(session, response.json(), status_box, section_boxes)
+                    status_box.empty()
+                    if response.status_code == 200:
+                        # Полный ответ заменяет секции, показанные по частям
+                        for box in section_boxes.values():
+                            box.empty()
+                    if response.status_code == 202:
+                        st.error("Рекомендации готовятся слишком долго, попробуйте позже.")
+                    elif response.status_code != 200:
+                        st.error(f"Ошибка: {response.status_code} - {response.json().get('detail', response.text)}")
+                    else:
+                        response.encoding = "utf-8"
+                        st.markdown(response.text, unsafe_allow_html=True)
+
             except Exception as e:
                 st.error(f"Произошла ошибка: {str(e)}")
 